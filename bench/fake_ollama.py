@@ -0,0 +1,152 @@
+# bench/fake_ollama.py
+"""
+Fake Ollama server for benchmarking the gateway without a GPU.
+
+Implements /api/generate, /api/chat (streaming and not), /api/embed, /api/tags and /api/ps
+with a configurable token rate, chunk size, time to first token and embedding dimension, and
+answers with the same fields (and final-chunk counters) as Ollama. Like Ollama, it loads a
+model when a request first asks for it, and a request without a prompt only loads it.
+
+    python bench/fake_ollama.py --port 11435 --token-rate 200 --ttft 0.05
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import List
+
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+@dataclass
+class FakeConfig:
+    token_rate: float = 100.0  # Generated tokens per second
+    chunk_tokens: int = 1  # Tokens per streamed chunk
+    ttft: float = 0.05  # Seconds before the first token (prompt processing)
+    tokens: int = 64  # Tokens generated per response
+    embed_dim: int = 768  # Embedding dimension
+    models: List[str] = field(default_factory=lambda: ["llama3.2:latest", "nomic-embed-text:latest"])
+    loaded: List[str] = field(default_factory=list)  # Models /api/ps lists from the start
+
+def model_name(name: str) -> str:
+    return name if ":" in name else f"{name}:latest"
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    embedding = [round((i % 97) / 97 - 0.5, 6) for i in range(config.embed_dim)]
+    loaded = dict.fromkeys(model_name(name) for name in config.loaded)  # Ordered set of loaded models
+
+    def load(model: str):
+        if model:
+            loaded[model_name(model)] = None
+
+    def final_record(model: str, key: str, value, prompt_tokens: int, elapsed_ns: int) -> dict:
+        return {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            key: value,
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": elapsed_ns,
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(config.ttft * 1e9),
+            "eval_count": config.tokens,
+            "eval_duration": int(config.tokens / config.token_rate * 1e9),
+        }
+
+    async def generation(request: Request, chat: bool):
+        body = orjson.loads(await request.body())
+        model = body.get("model", "")
+        load(model)
+        if "prompt" not in body and "messages" not in body:
+            # Load request (e.g. the gateway's preloads and warm-ups)
+            record = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "done": True, "done_reason": "load"}
+            record["message" if chat else "response"] = {"role": "assistant", "content": ""} if chat else ""
+            return Response(orjson.dumps(record), media_type="application/json")
+        prompt = body.get("prompt") or "".join(str(m.get("content", "")) for m in body.get("messages") or [])
+        prompt_tokens = max(1, len(prompt) // 4)
+        key = "message" if chat else "response"
+
+        def piece(n: int):
+            text = "tok " * n
+            return {"role": "assistant", "content": text} if chat else text
+
+        start = time.perf_counter()
+        if not body.get("stream", True):
+            await asyncio.sleep(config.ttft + config.tokens / config.token_rate)
+            record = final_record(model, key, piece(config.tokens), prompt_tokens, int((time.perf_counter() - start) * 1e9))
+            return Response(orjson.dumps(record), media_type="application/json")
+
+        async def stream():
+            await asyncio.sleep(config.ttft)
+            sent = 0
+            while sent < config.tokens:
+                n = min(config.chunk_tokens, config.tokens - sent)
+                await asyncio.sleep(n / config.token_rate)
+                sent += n
+                yield orjson.dumps({"model": model, key: piece(n), "done": False}) + b"\n"
+            elapsed = int((time.perf_counter() - start) * 1e9)
+            yield orjson.dumps(final_record(model, key, piece(0), prompt_tokens, elapsed)) + b"\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        return await generation(request, chat=False)
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        return await generation(request, chat=True)
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = orjson.loads(await request.body())
+        inputs = body.get("input")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        load(body.get("model", ""))
+        await asyncio.sleep(config.ttft)
+        return Response(
+            orjson.dumps({
+                "model": body.get("model", ""),
+                "embeddings": [embedding] * len(inputs),
+                "total_duration": int(config.ttft * 1e9),
+                "prompt_eval_count": sum(max(1, len(str(text)) // 4) for text in inputs),
+            }),
+            media_type="application/json",
+        )
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": name, "model": name, "size": 0, "digest": ""} for name in config.models]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": name, "model": name, "size": 0, "size_vram": 0, "digest": "", "expires_at": None} for name in loaded]}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=FakeConfig.token_rate, help="Generated tokens per second")
+    parser.add_argument("--chunk-tokens", type=int, default=FakeConfig.chunk_tokens, help="Tokens per streamed chunk")
+    parser.add_argument("--ttft", type=float, default=FakeConfig.ttft, help="Seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=FakeConfig.tokens, help="Tokens generated per response")
+    parser.add_argument("--embed-dim", type=int, default=FakeConfig.embed_dim, help="Embedding dimension")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        token_rate=args.token_rate,
+        chunk_tokens=args.chunk_tokens,
+        ttft=args.ttft,
+        tokens=args.tokens,
+        embed_dim=args.embed_dim,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# bench/loadgen.py
+"""
+Load generator measuring what the gateway adds on top of Ollama.
+
+Runs the same workload against Ollama directly and through the gateway and reports:
+- p50/p99 latency of non-streaming requests, and the latency the gateway adds
+- time to first token (first streamed chunk) and its overhead
+- streamed chunks per second with many concurrent streams
+- max sustainable RPS: the highest throughput reached while p99 stays under a limit
+  and errors under 1%
+
+    python bench/loadgen.py --direct http://127.0.0.1:11435 --gateway http://127.0.0.1:8000 \\
+        --token <api key> --out results.json
+
+bench/run.py starts a fake Ollama and the gateway with 1..N workers and calls run_suite().
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+import orjson
+
+_sequence = itertools.count()
+
+def request_body(payload: dict, stream: bool) -> dict:
+    """
+    The payload made unique per request, so the gateway's response cache and request
+    coalescing don't turn the benchmark into a cache benchmark.
+    """
+    body = {**payload, "stream": stream}
+    field = "input" if "input" in body else "prompt"
+    body[field] = f"{body[field]} #{next(_sequence)}"
+    return body
+
+def summarize(samples: Sequence[float]) -> Dict[str, Any]:
+    """p50/p99/mean of latencies in seconds, reported in milliseconds."""
+    if not samples:
+        return {"n": 0, "p50_ms": None, "p99_ms": None, "mean_ms": None}
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "n": len(ordered),
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+async def measure_latency(client: httpx.AsyncClient, path: str, payload: dict, requests: int) -> List[float]:
+    """Sequential non-streaming requests, so the numbers are free of queueing."""
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.post(path, json=request_body(payload, False))
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def measure_ttft(client: httpx.AsyncClient, path: str, payload: dict, requests: int) -> List[float]:
+    """Time from sending a streaming request to receiving its first chunk."""
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        async with client.stream("POST", path, json=request_body(payload, True)) as response:
+            response.raise_for_status()
+            first = None
+            async for _ in response.aiter_raw():
+                if first is None:
+                    first = time.perf_counter() - start
+            samples.append(first)
+    return samples
+
+async def measure_streaming(client: httpx.AsyncClient, path: str, payload: dict, concurrency: int, duration: float) -> Dict[str, Any]:
+    """Keep `concurrency` streams running for `duration` seconds and count NDJSON lines received."""
+    deadline = time.perf_counter() + duration
+    counts = {"chunks": 0, "streams": 0, "errors": 0}
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            try:
+                async with client.stream("POST", path, json=request_body(payload, True)) as response:
+                    response.raise_for_status()
+                    async for _ in response.aiter_lines():
+                        counts["chunks"] += 1
+                counts["streams"] += 1
+            except httpx.HTTPError:
+                counts["errors"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "chunks_per_second": round(counts["chunks"] / elapsed, 1),
+        "streams_per_second": round(counts["streams"] / elapsed, 2),
+        "errors": counts["errors"],
+    }
+
+async def measure_throughput(client: httpx.AsyncClient, path: str, payload: dict, concurrency: int, duration: float) -> Dict[str, Any]:
+    """Closed-loop load: `concurrency` clients sending non-streaming requests back to back."""
+    deadline = time.perf_counter() + duration
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=request_body(payload, False))
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    total = len(latencies) + errors
+    return {
+        "concurrency": concurrency,
+        "rps": round(len(latencies) / elapsed, 1),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        **summarize(latencies),
+    }
+
+async def find_max_rps(
+    client: httpx.AsyncClient,
+    path: str,
+    payload: dict,
+    levels: Sequence[int],
+    duration: float,
+    p99_limit_ms: float,
+) -> Dict[str, Any]:
+    """Step through concurrency levels; the max sustainable RPS is the best level within the p99 and error limits."""
+    results = []
+    best: Optional[float] = None
+    for concurrency in levels:
+        result = await measure_throughput(client, path, payload, concurrency, duration)
+        results.append(result)
+        sustainable = result["error_rate"] < 0.01 and result["p99_ms"] is not None and result["p99_ms"] <= p99_limit_ms
+        if sustainable:
+            best = max(best or 0.0, result["rps"])
+        elif best is not None:
+            break  # Past saturation
+    return {"p99_limit_ms": p99_limit_ms, "max_sustainable_rps": best, "levels": results}
+
+async def run_suite(base_url: str, headers: Dict[str, str], options: argparse.Namespace) -> Dict[str, Any]:
+    """Every measurement against one target (Ollama or the gateway; both serve the same /api paths)."""
+    generate = {"model": options.model, "prompt": "Why is the sky blue?"}
+    embed = {"model": options.embed_model, "input": "The quick brown fox"}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=60, limits=limits) as client:
+        await measure_latency(client, "/api/generate", generate, 5)  # Warm up connections and caches
+        latency = await measure_latency(client, "/api/generate", generate, options.requests)
+        ttft = await measure_ttft(client, "/api/generate", generate, options.requests)
+        streaming = await measure_streaming(client, "/api/generate", generate, options.concurrency, options.duration)
+        max_rps = await find_max_rps(client, "/api/embed", embed, options.levels, options.duration, options.p99_limit_ms)
+    return {
+        "latency": summarize(latency),
+        "ttft": summarize(ttft),
+        "streaming": streaming,
+        "max_rps": max_rps,
+    }
+
+def overhead(direct: Dict[str, Any], gateway: Dict[str, Any]) -> Dict[str, Any]:
+    """What the gateway adds compared to calling Ollama directly."""
+    def diff(section: str, key: str) -> Optional[float]:
+        a, b = direct[section][key], gateway[section][key]
+        return round(b - a, 3) if a is not None and b is not None else None
+
+    return {
+        "added_latency_p50_ms": diff("latency", "p50_ms"),
+        "added_latency_p99_ms": diff("latency", "p99_ms"),
+        "ttft_overhead_p50_ms": diff("ttft", "p50_ms"),
+        "ttft_overhead_p99_ms": diff("ttft", "p99_ms"),
+    }
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--embed-model", default="nomic-embed-text")
+    parser.add_argument("--requests", type=int, default=200, help="Sequential requests for the latency and TTFT samples")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent streams for the chunk throughput test")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per throughput measurement")
+    parser.add_argument("--levels", type=lambda value: [int(v) for v in value.split(",")],
+                        default=[1, 4, 16, 32, 64, 128, 256], help="Concurrency levels for the max RPS search")
+    parser.add_argument("--p99-limit-ms", type=float, default=250.0, help="p99 latency a level must stay under to count as sustainable")
+    parser.add_argument("--out", help="Write the results to this JSON file")
+
+def write_results(results: Dict[str, Any], path: Optional[str]):
+    data = orjson.dumps(results, option=orjson.OPT_INDENT_2)
+    if path:
+        with open(path, "wb") as f:
+            f.write(data)
+    print(data.decode())
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of the gateway over direct Ollama calls")
+    parser.add_argument("--direct", required=True, help="Ollama (or fake Ollama) base URL")
+    parser.add_argument("--gateway", required=True, help="Gateway base URL (without BASE_PATH)")
+    parser.add_argument("--token", required=True, help="Gateway API key")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    async def run():
+        direct = await run_suite(options.direct, {}, options)
+        gateway = await run_suite(options.gateway, {"Authorization": f"Bearer {options.token}"}, options)
+        return {"direct": direct, "gateway": gateway, "overhead": overhead(direct, gateway)}
+
+    write_results(asyncio.run(run()), options.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# bench/run.py
+"""
+Benchmark the gateway end to end on one machine.
+
+Starts bench/fake_ollama.py, measures it directly, then starts the gateway in front of it
+with 1..N uvicorn workers and measures each, and writes everything to one JSON file
+(with the commit it ran on) so results can be compared between commits:
+
+    python bench/run.py --workers 4 --out bench/results/$(git rev-parse --short HEAD).json
+
+The gateway runs with a throwaway token database; the API key is created through
+gen_api_key_cli.py so nothing here imports the server.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import httpx
+
+from loadgen import add_arguments, overhead, run_suite, write_results
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(REPO_DIR, "src")
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+@contextmanager
+def process(args, cwd=None, env=None):
+    proc = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def gateway_env(options: argparse.Namespace, db_path: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{options.fake_port}",
+        "TOKEN_DB_PATH": db_path,
+        "BASE_PATH": "/api",
+        "LOG_LEVEL": "WARNING",
+        "LOG_FILE": "",
+    })
+    return env
+
+def create_token(env: dict) -> str:
+    output = subprocess.run(
+        [sys.executable, "gen_api_key_cli.py", "-g", "bench", "bench"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    match = re.search(r": ([0-9a-f]{64})", output)
+    if match is None:
+        raise RuntimeError(f"Could not create an API key: {output}")
+    return match.group(1)
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gateway against a fake Ollama")
+    parser.add_argument("--workers", type=int, default=1, help="Benchmark the gateway with 1..N uvicorn workers")
+    parser.add_argument("--fake-port", type=int, default=11435)
+    parser.add_argument("--gateway-port", type=int, default=8765)
+    parser.add_argument("--token-rate", type=float, default=1000.0, help="Fake Ollama tokens per second")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="Fake Ollama tokens per streamed chunk")
+    parser.add_argument("--ttft", type=float, default=0.01, help="Fake Ollama seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=32, help="Fake Ollama tokens per response")
+    parser.add_argument("--embed-dim", type=int, default=768, help="Fake Ollama embedding dimension")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    fake_args = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_ollama.py"),
+        "--port", str(options.fake_port),
+        "--token-rate", str(options.token_rate),
+        "--chunk-tokens", str(options.chunk_tokens),
+        "--ttft", str(options.ttft),
+        "--tokens", str(options.tokens),
+        "--embed-dim", str(options.embed_dim),
+    ]
+    fake_url = f"http://127.0.0.1:{options.fake_port}"
+    gateway_url = f"http://127.0.0.1:{options.gateway_port}"
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "time": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": vars(options),
+        },
+        "gateway": {},
+        "overhead": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp, process(fake_args):
+        wait_until_up(f"{fake_url}/api/tags")
+        print(f"Measuring Ollama directly ({fake_url})", file=sys.stderr)
+        results["direct"] = asyncio.run(run_suite(fake_url, {}, options))
+
+        env = gateway_env(options, os.path.join(tmp, "tokens.db"))
+        headers = {"Authorization": f"Bearer {create_token(env)}"}
+        for workers in range(1, options.workers + 1):
+            gateway_args = [
+                sys.executable, "-m", "uvicorn", "--factory", "main:create_app",
+                "--port", str(options.gateway_port), "--workers", str(workers), "--log-level", "warning",
+            ]
+            with process(gateway_args, cwd=SRC_DIR, env=env):
+                wait_until_up(f"{gateway_url}/docs")
+                print(f"Measuring the gateway with {workers} worker(s)", file=sys.stderr)
+                gateway = asyncio.run(run_suite(gateway_url, headers, options))
+            results["gateway"][f"workers={workers}"] = gateway
+            results["overhead"][f"workers={workers}"] = overhead(results["direct"], gateway)
+
+    write_results(results, options.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# bench/startup.py
+"""
+Measure how long the gateway and the CLIs take to start, each run in a fresh interpreter:
+
+- import: `import main`
+- create_app: building the application (settings, logging, routes)
+- lifespan: the lifespan up to serving (token store, upstream client, caches, first backend
+  health check) and its shutdown
+- cli_import: `import libs.token_operations`, what gen_api_key_cli.py loads before doing anything,
+  together with whether it pulled in server-only modules
+
+    python bench/startup.py --runs 20 --out startup.json
+
+The backend is an unreachable address, so the health check fails fast instead of measuring Ollama.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import orjson
+
+from loadgen import summarize, write_results
+from run import SRC_DIR, git_commit
+
+SERVER_ONLY_MODULES = ("fastapi", "starlette", "httpx", "uvicorn")
+
+GATEWAY_PROBE = """
+import asyncio, sys, time
+import orjson
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+
+async def lifespan():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+    return started, time.perf_counter()
+
+started, stopped = asyncio.run(lifespan())
+sys.stdout.write(orjson.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "lifespan_startup": started - created,
+    "lifespan_shutdown": stopped - started,
+}).decode())
+"""
+
+CLI_PROBE = """
+import sys, time
+import orjson
+start = time.perf_counter()
+import libs.token_operations
+elapsed = time.perf_counter() - start
+sys.stdout.write(orjson.dumps({
+    "cli_import": elapsed,
+    "server_modules": sorted(name for name in %r if name in sys.modules),
+}).decode())
+""" % (SERVER_ONLY_MODULES,)
+
+def probe(code: str, env: dict) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return orjson.loads(output)
+
+def probe_env(db_path: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_BASE_URL": "http://127.0.0.1:9",
+        "OLLAMA_BASE_URLS": "[]",
+        "TOKEN_DB_PATH": db_path,
+        "LOG_LEVEL": "WARNING",
+        "LOG_FILE": "",
+    })
+    return env
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gateway and CLI startup time")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters started per measurement")
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    options = parser.parse_args()
+
+    samples: Dict[str, List[float]] = {}
+    server_modules = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = probe_env(os.path.join(tmp, "tokens.db"))
+        probe(GATEWAY_PROBE, env)  # Creates the database, so every measured run opens an existing one
+        for _ in range(options.runs):
+            for name, value in probe(GATEWAY_PROBE, env).items():
+                samples.setdefault(name, []).append(value)
+            cli = probe(CLI_PROBE, env)
+            samples.setdefault("cli_import", []).append(cli["cli_import"])
+            server_modules.update(cli["server_modules"])
+
+    results = {
+        "meta": {"commit": git_commit(), "python": sys.version.split()[0], "runs": options.runs},
+        **{name: summarize(values) for name, values in samples.items()},
+        "cli_server_modules": sorted(server_modules),  # Should be empty
+    }
+    write_results(results, options.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# admin_routes.py
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Security, Depends, Query, Request, Response
+from libs.token_manager import TokenManager
+from libs.embed_cache import EmbedCache
+from libs.embed_batcher import EmbedBatcher
+from libs.backend_pool import BackendPool
+from libs.tags_cache import TagsCache
+from libs.rate_limiter import AdmissionController
+from libs.scheduler import FairScheduler
+from libs.response_cache import ResponseCache
+from libs.usage_recorder import UsageRecorder
+from libs.singleflight import SingleFlight
+from libs.model_manager import ModelManager
+from libs.batch import BatchRunner
+from libs.profiler import SamplingProfiler
+from routes import (
+    get_admin_principal, get_embed_cache, get_embed_batcher, get_backend_pool, get_tags_cache, get_admission,
+    get_scheduler, get_response_cache, get_upstream_flight, get_usage_recorder, get_token_manager,
+    get_model_manager, get_batch_runner, get_profiler, until_disconnected,
+)
+
+logger = logging.getLogger(__name__)
+
+# Every route in this router requires an admin key (see ADMIN_USERS)
+admin_router = APIRouter(dependencies=[Security(get_admin_principal)])
+
+def require_embed_cache(embed_cache: Optional[EmbedCache] = Depends(get_embed_cache)) -> EmbedCache:
+    if embed_cache is None:
+        raise HTTPException(status_code=404, detail="Embedding cache is disabled")
+    return embed_cache
+
+# Backends #############################################################################
+
+@admin_router.get("/backends")
+async def backends_status(pool: BackendPool = Depends(get_backend_pool)):
+    return pool.stats()
+
+# Embedding cache ########################################################################
+
+@admin_router.get("/cache/embed")
+async def embed_cache_stats(embed_cache: EmbedCache = Depends(require_embed_cache)):
+    return await embed_cache.stats()
+
+@admin_router.delete("/cache/embed")
+async def embed_cache_invalidate(model: Optional[str] = None, embed_cache: EmbedCache = Depends(require_embed_cache)):
+    dropped = await embed_cache.invalidate(model)
+    logger.info("Embedding cache invalidated for model: %s (%s)", model or 'all', dropped)
+    return {"model": model, "dropped": dropped}
+
+@admin_router.get("/embed/batcher")
+async def embed_batcher_stats(embed_batcher: Optional[EmbedBatcher] = Depends(get_embed_batcher)):
+    if embed_batcher is None:
+        raise HTTPException(status_code=404, detail="Embedding batching is disabled")
+    return embed_batcher.stats()
+
+# Response cache #########################################################################
+
+def require_response_cache(response_cache: Optional[ResponseCache] = Depends(get_response_cache)) -> ResponseCache:
+    if response_cache is None:
+        raise HTTPException(status_code=404, detail="Response cache is disabled")
+    return response_cache
+
+@admin_router.get("/cache/responses")
+async def response_cache_stats(response_cache: ResponseCache = Depends(require_response_cache)):
+    return response_cache.stats()
+
+@admin_router.delete("/cache/responses")
+async def response_cache_invalidate(model: Optional[str] = None, response_cache: ResponseCache = Depends(require_response_cache)):
+    dropped = response_cache.invalidate(model)
+    logger.info("Response cache invalidated for model: %s (%s)", model or 'all', dropped)
+    return {"model": model, "dropped": dropped}
+
+# Tags cache #############################################################################
+
+def require_tags_cache(tags_cache: Optional[TagsCache] = Depends(get_tags_cache)) -> TagsCache:
+    if tags_cache is None:
+        raise HTTPException(status_code=404, detail="Tags cache is disabled")
+    return tags_cache
+
+@admin_router.get("/cache/tags")
+async def tags_cache_stats(tags_cache: TagsCache = Depends(require_tags_cache)):
+    return tags_cache.stats()
+
+@admin_router.delete("/cache/tags")
+async def tags_cache_invalidate(tags_cache: TagsCache = Depends(require_tags_cache)):
+    tags_cache.invalidate()
+    return {"invalidated": True}
+
+# Request coalescing #####################################################################
+
+@admin_router.get("/coalescing")
+async def coalescing_stats(upstream_flight: Optional[SingleFlight] = Depends(get_upstream_flight)):
+    if upstream_flight is None:
+        raise HTTPException(status_code=404, detail="Request coalescing is disabled")
+    return upstream_flight.stats()
+
+# Usage ##################################################################################
+
+@admin_router.get("/usage")
+async def usage_report(
+    user: Optional[str] = None,
+    model: Optional[str] = None,
+    since: Optional[str] = None,
+    usage_recorder: Optional[UsageRecorder] = Depends(get_usage_recorder),
+    token_manager: TokenManager = Depends(get_token_manager),
+):
+    """Tokens used per key, model and UTC day (`since` is a YYYY-MM-DD day)."""
+    if usage_recorder is None:
+        raise HTTPException(status_code=404, detail="Usage tracking is disabled")
+    await usage_recorder.flush()  # Include what has not been written yet
+    rows = await token_manager.store.run(token_manager.get_usage, user, since, model)
+    columns = ("user", "api_name", "model", "day", "requests", "prompt_tokens", "completion_tokens")
+    return [dict(zip(columns, row)) for row in rows]
+
+# Admission control ######################################################################
+
+@admin_router.get("/limits")
+async def limits_stats(admission: AdmissionController = Depends(get_admission)):
+    return admission.stats()
+
+@admin_router.get("/scheduler")
+async def scheduler_stats(scheduler: Optional[FairScheduler] = Depends(get_scheduler)):
+    if scheduler is None:
+        raise HTTPException(status_code=404, detail="Scheduler is disabled")
+    return scheduler.stats()
+
+# Models ##################################################################################
+
+@admin_router.get("/models")
+async def models_stats(models: ModelManager = Depends(get_model_manager)):
+    """Models loaded on each server (per the last /api/ps poll), cold requests and loads per model."""
+    return models.stats()
+
+# Batch jobs #############################################################################
+
+@admin_router.get("/batches")
+async def batches_stats(batch_runner: Optional[BatchRunner] = Depends(get_batch_runner)):
+    """Jobs running in this worker process, and the queued and running jobs of every key."""
+    if batch_runner is None:
+        raise HTTPException(status_code=404, detail="Batch jobs are disabled")
+    return {**batch_runner.stats(), "active": await batch_runner.list_jobs(active_only=True)}
+
+@admin_router.post("/batches/{job_id}/cancel")
+async def batch_cancel(job_id: str, batch_runner: Optional[BatchRunner] = Depends(get_batch_runner)):
+    if batch_runner is None:
+        raise HTTPException(status_code=404, detail="Batch jobs are disabled")
+    job = await batch_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such batch")
+    logger.info("Batch %s cancelled by an admin", job_id)
+    return job
+
+# Profiling ##############################################################################
+
+@admin_router.post("/profile")
+async def profile(
+    request: Request,
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1),
+    idle: bool = False,
+    profiler: Optional[SamplingProfiler] = Depends(get_profiler),
+):
+    """
+    Sample the stack of every thread for `seconds` (up to PROFILER_MAX_SECONDS) and answer with
+    collapsed stacks, ready for `flamegraph.pl profile.txt > profile.svg` or speedscope. Threads
+    waiting for work are left out unless `idle` is set.
+    """
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    logger.info("Profiling for %ss every %sms", min(seconds, profiler.max_seconds), interval_ms)
+    stacks = await until_disconnected(request, profiler.profile(seconds, interval_ms / 1000, idle))
+    return Response(content=stacks, media_type="text/plain; charset=utf-8")
@@ -0,0 +1,93 @@
+# batch_routes.py
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Security, Depends, Request
+from fastapi.responses import StreamingResponse
+from libs.token_manager import Principal
+from libs.batch import BatchRunner, BatchUploadError, parse_route, ROUTES
+from models import Settings
+from routes import check_rate_limit, get_batch_runner, get_settings
+
+logger = logging.getLogger(__name__)
+
+# Jobs are only visible to the key that uploaded them
+batch_router = APIRouter()
+
+def require_batch_runner(batch_runner: Optional[BatchRunner] = Depends(get_batch_runner)) -> BatchRunner:
+    if batch_runner is None:
+        raise HTTPException(status_code=404, detail="Batch jobs are disabled")
+    return batch_runner
+
+@batch_router.post("", status_code=201)
+async def create_batch(
+    request: Request,
+    endpoint: Optional[str] = None,
+    principal: Principal = Security(check_rate_limit),
+    batch_runner: BatchRunner = Depends(require_batch_runner),
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Upload a JSONL file of requests, one per line: {"custom_id": ..., "url": "/api/chat", "body": {...}},
+    or bare request bodies for the route given as `endpoint`. The body is written to disk as it arrives.
+    """
+    route = None
+    if endpoint is not None:
+        route = parse_route(endpoint)
+        if route is None:
+            raise HTTPException(status_code=422, detail=f"endpoint must be one of: {', '.join(ROUTES)}")
+    try:
+        return await batch_runner.create(principal, route, request.stream(), settings.BATCH_MAX_UPLOAD_BYTES)
+    except BatchUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@batch_router.get("")
+async def list_batches(
+    principal: Principal = Security(check_rate_limit),
+    batch_runner: BatchRunner = Depends(require_batch_runner),
+):
+    return await batch_runner.list_jobs(principal.user_id)
+
+@batch_router.get("/{job_id}")
+async def get_batch(
+    job_id: str,
+    principal: Principal = Security(check_rate_limit),
+    batch_runner: BatchRunner = Depends(require_batch_runner),
+):
+    job = await batch_runner.get(job_id, principal.user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such batch")
+    return job
+
+@batch_router.get("/{job_id}/results")
+async def get_batch_results(
+    job_id: str,
+    principal: Principal = Security(check_rate_limit),
+    batch_runner: BatchRunner = Depends(require_batch_runner),
+):
+    """Result lines written so far, in completion order: {"custom_id", "line", "status", "response" or "error"}."""
+    if await batch_runner.get(job_id, principal.user_id) is None:
+        raise HTTPException(status_code=404, detail="No such batch")
+    return StreamingResponse(batch_runner.results(job_id), media_type="application/x-ndjson")
+
+@batch_router.post("/{job_id}/cancel")
+async def cancel_batch(
+    job_id: str,
+    principal: Principal = Security(check_rate_limit),
+    batch_runner: BatchRunner = Depends(require_batch_runner),
+):
+    job = await batch_runner.cancel(job_id, principal.user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such batch")
+    logger.info("Batch %s cancelled by %s", job_id, principal.user)
+    return job
+
+@batch_router.delete("/{job_id}")
+async def delete_batch(
+    job_id: str,
+    principal: Principal = Security(check_rate_limit),
+    batch_runner: BatchRunner = Depends(require_batch_runner),
+):
+    """Cancel the job if it is still going, and remove it with its input and results."""
+    if not await batch_runner.delete(job_id, principal.user_id):
+        raise HTTPException(status_code=404, detail="No such batch")
+    return {"id": job_id, "deleted": True}
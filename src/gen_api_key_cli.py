@@ -1,15 +1,44 @@
 # gen_api_key_cli.py
 import sys
-from libs.token_operations import generate_token, list_users, delete_token, export_users
+from libs.token_operations import (
+    generate_token, list_users_page, delete_token, export_users, set_limits, set_priority, set_cache_responses, get_usage,
+    generate_tokens_from_csv, revoke_tokens_from_csv, rotate_tokens_from_csv, USER_HEADERS,
+)
 from tabulate import tabulate  # Import tabulate for table formatting
 
+def parse_limit(value, cast):
+    # "-" removes the limit
+    return None if value == "-" else cast(value)
+
+def parse_options(args, names):
+    # "--name value" pairs following a command, None when malformed
+    if len(args) % 2:
+        return None
+    options = {}
+    for flag, value in zip(args[::2], args[1::2]):
+        if not flag.startswith("--") or flag[2:] not in names:
+            return None
+        options[flag[2:]] = value
+    return options
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python gen_api_key.py -g <user> <api_key_name>     # Generate token")
-        print("  python gen_api_key.py -l                           # List users")
+        print("  python gen_api_key.py -l [--user <user>] [--search <text>] [--limit <n>] [--after <cursor>]")
+        print("                                                     # List users, one page at a time")
         print("  python gen_api_key.py -d <user> <api_key_name>     # Delete token")
-        print("  python gen_api_key.py -e <filename>                # Export users to file")
+        print("  python gen_api_key.py -e <filename> [--user <user>] [--search <text>]")
+        print("                                                     # Export users to file (.csv or .jsonl)")
+        print("  python gen_api_key.py -G <keys.csv> <tokens.csv>   # Generate tokens for user,api_key_name[,expires_at] rows")
+        print("  python gen_api_key.py -D <keys.csv>                # Delete tokens of user,api_key_name rows")
+        print("  python gen_api_key.py -R <keys.csv> <tokens.csv> <grace_seconds>")
+        print("                                                     # Rotate tokens, old ones work for the grace period")
+        print("  python gen_api_key.py -r <user> <api_key_name> <rps> <max_streams> <tokens_per_minute>")
+        print("                                                     # Set limits, '-' means unlimited")
+        print("  python gen_api_key.py -p <user> <api_key_name> <priority>  # Set scheduling priority")
+        print("  python gen_api_key.py -c <user> <api_key_name> on|off      # Use the response cache")
+        print("  python gen_api_key.py -u [<user>]                  # Token usage per key, model and day")
         sys.exit(1)
 
     if sys.argv[1] == '-g' and len(sys.argv) == 4:
@@ -17,20 +46,76 @@ def main():
         api_name = sys.argv[3]
         print(generate_token(user, api_name))
     elif sys.argv[1] == '-l':
-        users = list_users()
+        options = parse_options(sys.argv[2:], ("user", "search", "limit", "after"))
+        if options is None:
+            print("Invalid options, see usage.")
+            sys.exit(1)
+        try:
+            limit = int(options.pop("limit", 50))
+            after = options.pop("after", None)
+            after = int(after) if after is not None else None
+        except ValueError:
+            print("--limit and --after must be integers.")
+            sys.exit(1)
+        users, next_cursor = list_users_page(limit, after, **options)
         if users:
-            headers = ["User ID", "User", "API KEY Name", "Created At", "Expires At"]
-            print(tabulate(users, headers, tablefmt="pretty"))  # Display as a pretty table
+            print(tabulate(users, USER_HEADERS, tablefmt="pretty"))  # Display as a pretty table
+            if next_cursor is not None:
+                print(f"More users: add --after {next_cursor}")
         else:
             print("No users found.")
     elif sys.argv[1] == '-d' and len(sys.argv) == 4:
         user = sys.argv[2]
         api_name = sys.argv[3]
         print(delete_token(user, api_name))
-    elif sys.argv[1] == '-e' and len(sys.argv) == 3:
+    elif sys.argv[1] == '-e' and len(sys.argv) >= 3:
         filename = sys.argv[2]
-        result = export_users(filename)
+        options = parse_options(sys.argv[3:], ("user", "search"))
+        if options is None:
+            print("Invalid options, see usage.")
+            sys.exit(1)
+        result = export_users(filename, **options)
         print(result)
+    elif sys.argv[1] == '-G' and len(sys.argv) == 4:
+        print(generate_tokens_from_csv(sys.argv[2], sys.argv[3]))
+    elif sys.argv[1] == '-D' and len(sys.argv) == 3:
+        print(revoke_tokens_from_csv(sys.argv[2]))
+    elif sys.argv[1] == '-R' and len(sys.argv) == 5:
+        try:
+            grace_seconds = float(sys.argv[4])
+        except ValueError:
+            print("Grace period must be a number of seconds.")
+            sys.exit(1)
+        print(rotate_tokens_from_csv(sys.argv[2], sys.argv[3], grace_seconds))
+    elif sys.argv[1] == '-r' and len(sys.argv) == 7:
+        user = sys.argv[2]
+        api_name = sys.argv[3]
+        try:
+            limits = (parse_limit(sys.argv[4], float), parse_limit(sys.argv[5], int), parse_limit(sys.argv[6], int))
+        except ValueError:
+            print("Limits must be numbers or '-'.")
+            sys.exit(1)
+        print(set_limits(user, api_name, *limits))
+    elif sys.argv[1] == '-p' and len(sys.argv) == 5:
+        user = sys.argv[2]
+        api_name = sys.argv[3]
+        try:
+            priority = int(sys.argv[4])
+        except ValueError:
+            print("Priority must be an integer.")
+            sys.exit(1)
+        print(set_priority(user, api_name, priority))
+    elif sys.argv[1] == '-c' and len(sys.argv) == 5 and sys.argv[4] in ("on", "off"):
+        user = sys.argv[2]
+        api_name = sys.argv[3]
+        print(set_cache_responses(user, api_name, sys.argv[4] == "on"))
+    elif sys.argv[1] == '-u' and len(sys.argv) in (2, 3):
+        rows = get_usage(sys.argv[2] if len(sys.argv) == 3 else None)
+        if rows:
+            headers = ["User", "API KEY Name", "Model", "Day (UTC)", "Requests", "Prompt Tokens", "Completion Tokens"]
+            print(tabulate(rows, headers, tablefmt="pretty"))
+        else:
+            print("No usage recorded.")
     else:
         print("Invalid command or arguments.")
         sys.exit(1)
@@ -2,7 +2,10 @@
 import sys
 from InquirerPy import prompt
 from InquirerPy.utils import color_print
-from libs.token_operations import generate_token, list_users, delete_token, export_users
+from libs.token_operations import (
+    generate_token, list_users_page, delete_token, export_users, generate_tokens_from_csv, revoke_tokens_from_csv,
+    rotate_tokens_from_csv, USER_HEADERS,
+)
 from tabulate import tabulate  # Import tabulate for table formatting
 
 def generate_token_interactive():
@@ -26,13 +29,28 @@ def generate_token_interactive():
     color_print([("fg:green" if "Generated" in result else "fg:red", result)])
     
 def list_users_interactive():
-    users = list_users()
-    if users:
-        headers = ["User ID", "User", "API KEY Name", "Created At", "Expires At"]
-        table = tabulate(users, headers=headers, tablefmt="pretty")
+    questions = [
+        {
+            "type": "input",
+            "name": "search",
+            "message": "Show users or API key names containing (empty for all):",
+        }
+    ]
+    search = prompt(questions)["search"].strip() or None
+
+    after = None
+    while True:
+        users, after = list_users_page(limit=50, after=after, search=search)
+        if not users:
+            color_print([("fg:red", "No users found.")])
+            return
+        table = tabulate(users, headers=USER_HEADERS, tablefmt="pretty")
         color_print([("fg:yellow", table)])
-    else:
-        color_print([("fg:red", "No users found.")])
+        if after is None:
+            return
+        more = prompt([{"type": "confirm", "name": "more", "message": "Show the next page?", "default": True}])
+        if not more["more"]:
+            return
 
 def delete_token_interactive():
     questions = [
@@ -59,7 +77,7 @@ def export_users_interactive():
         {
             "type": "input",
             "name": "filename",
-            "message": "Enter the filename to export users to:",
+            "message": "Enter the filename to export users to (.csv or .jsonl):",
             "default": "users.csv"
         }
     ]
@@ -69,6 +87,45 @@ def export_users_interactive():
     result = export_users(filename)
     color_print([("fg:green" if "successfully" in result else "fg:red", result)])
 
+def bulk_questions(with_output):
+    questions = [
+        {
+            "type": "input",
+            "name": "filename",
+            "message": "CSV file of user,api_key_name rows:",
+        }
+    ]
+    if with_output:
+        questions.append({
+            "type": "input",
+            "name": "output",
+            "message": "File to write the new tokens to:",
+            "default": "tokens.csv"
+        })
+    return prompt(questions)
+
+def generate_tokens_interactive():
+    answers = bulk_questions(with_output=True)
+    result = generate_tokens_from_csv(answers["filename"], answers["output"])
+    color_print([("fg:green" if "Generated" in result else "fg:red", result)])
+
+def delete_tokens_interactive():
+    answers = bulk_questions(with_output=False)
+    result = revoke_tokens_from_csv(answers["filename"])
+    color_print([("fg:green" if "Deleted" in result else "fg:red", result)])
+
+def rotate_tokens_interactive():
+    answers = bulk_questions(with_output=True)
+    grace = prompt([{
+        "type": "input",
+        "name": "grace",
+        "message": "Seconds the old tokens keep working:",
+        "default": "86400",
+        "validate": lambda value: value.replace(".", "", 1).isdigit(),
+    }])["grace"]
+    result = rotate_tokens_from_csv(answers["filename"], answers["output"], float(grace))
+    color_print([("fg:green" if "Rotated" in result else "fg:red", result)])
+
 def main_menu():
     while True:
         questions = [
@@ -78,9 +135,12 @@ def main_menu():
                 "message": "What do you want to do?",
                 "choices": [
                     {"name": "Generate a token", "value": "generate"},
-                    {"name": "List all users", "value": "list"},
+                    {"name": "List users", "value": "list"},
                     {"name": "Delete a token", "value": "delete"},
                     {"name": "Export users to file", "value": "export"},
+                    {"name": "Generate tokens from a CSV file", "value": "bulk_generate"},
+                    {"name": "Delete tokens from a CSV file", "value": "bulk_delete"},
+                    {"name": "Rotate tokens from a CSV file", "value": "rotate"},
                     {"name": "Exit", "value": "exit"}
                 ]
             }
@@ -96,6 +156,12 @@ def main_menu():
             delete_token_interactive()
         elif answer == "export":
             export_users_interactive()
+        elif answer == "bulk_generate":
+            generate_tokens_interactive()
+        elif answer == "bulk_delete":
+            delete_tokens_interactive()
+        elif answer == "rotate":
+            rotate_tokens_interactive()
         elif answer == "exit":
             color_print([("fg:green", "Exiting...")])
             sys.exit(0)
@@ -0,0 +1,73 @@
+# libs/access_log.py
+import logging
+import time
+from datetime import datetime, timezone
+
+import orjson
+
+from libs.logger import ACCESS_LOGGER
+
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+class AccessLogMiddleware:
+    """
+    ASGI middleware writing one JSON line per request to the access logger once the response
+    is complete (for streams, after the last chunk), rather than logging per chunk.
+
+    Handlers add what they know through request.state: `principal` (set once the API key is
+    resolved) and `ctx`, the RequestContext carrying the model and Ollama's token counters.
+    The phase durations TimingMiddleware collects in `timings` go in as milliseconds.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        response = {"status": None, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info("%s", self.line(scope, response, time.perf_counter() - start).decode())
+
+    @staticmethod
+    def line(scope, response, duration: float) -> bytes:
+        state = scope.get("state") or {}
+        client = scope.get("client")
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": response["status"],  # None if the client went away before the response started
+            "duration_ms": round(duration * 1000, 2),
+            "bytes": response["bytes"],
+            "client": client[0] if client else None,
+        }
+        principal = state.get("principal")
+        if principal is not None:
+            entry["user"] = principal.user
+            entry["api_name"] = principal.api_name
+        ctx = state.get("ctx")
+        if ctx is not None:
+            entry["model"] = ctx.model
+            if ctx.usage:
+                entry.update(ctx.usage)
+            if ctx.error:
+                entry["error"] = ctx.error
+        timings = state.get("timings")
+        if timings is not None and timings.phases:
+            entry["timings"] = timings.as_dict()
+        return orjson.dumps(entry)
@@ -0,0 +1,153 @@
+# libs/backend_pool.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set
+import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+def model_key(name: str) -> str:
+    """Normalize a model name the way Ollama does ('llama3.2' is 'llama3.2:latest')."""
+    return name if ":" in name else f"{name}:latest"
+
+class Backend:
+    """One upstream Ollama server and what the pool knows about it."""
+    __slots__ = ("url", "outstanding", "healthy", "failures", "models", "resident", "last_check", "last_error")
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0  # Requests currently forwarded to this server
+        self.healthy = True  # Optimistic until the first health check says otherwise
+        self.failures = 0  # Consecutive failed checks/requests
+        self.models: Optional[Set[str]] = None  # Models listed by /api/tags, None until known
+        self.resident: Set[str] = set()  # Models loaded in memory, per /api/ps (see ModelManager)
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def serves(self, model: Optional[str]) -> bool:
+        return model is None or self.models is None or model_key(model) in self.models
+
+class BackendPool:
+    """
+    Pool of Ollama servers sharing the gateway's upstream HTTP client.
+
+    Requests go to the healthy server with the fewest outstanding requests among those whose
+    /api/tags lists the requested model. A background task polls /api/tags on every server:
+    servers failing `failure_threshold` checks in a row (or forwarded requests in a row) are
+    ejected, and re-admitted as soon as a check succeeds again.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        client: httpx.AsyncClient,
+        health_interval: float = 10.0,
+        health_timeout: float = 2.0,
+        failure_threshold: int = 2,
+    ):
+        if not urls:
+            raise ValueError("At least one Ollama URL is required (OLLAMA_BASE_URL or OLLAMA_BASE_URLS)")
+        self.backends = [Backend(url) for url in urls]
+        self.client = client
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+        self._next = 0  # Rotates the starting point so ties don't always pick the first server
+        self._health_task: Optional[asyncio.Task] = None
+
+    # Selection ###########################################################################
+
+    def select(self, model: Optional[str] = None) -> Backend:
+        # With every server ejected, keep trying all of them rather than failing every request
+        healthy = [backend for backend in self.backends if backend.healthy] or self.backends
+        # If no server lists the model, let any of them answer (Ollama returns a proper 404)
+        candidates = [backend for backend in healthy if backend.serves(model)] or healthy
+        if model is not None and len(candidates) > 1:
+            # Servers that already have the model loaded answer without a multi-second load
+            key = model_key(model)
+            candidates = [backend for backend in candidates if key in backend.resident] or candidates
+
+        self._next = (self._next + 1) % len(candidates)
+        rotated = candidates[self._next:] + candidates[:self._next]
+        return min(rotated, key=lambda backend: backend.outstanding)
+
+    @asynccontextmanager
+    async def acquire(self, model: Optional[str] = None):
+        """Pick a backend for the request and count it as outstanding until the block exits."""
+        backend = self.select(model)
+        backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    def healthy_backends(self) -> List[Backend]:
+        return [backend for backend in self.backends if backend.healthy]
+
+    # Health ##############################################################################
+
+    def report_success(self, backend: Backend):
+        backend.failures = 0
+        if not backend.healthy:
+            backend.healthy = True
+            logger.info("Ollama backend re-admitted: %s", backend.url)
+
+    def report_failure(self, backend: Backend, error: str):
+        backend.failures += 1
+        backend.last_error = error
+        if backend.healthy and backend.failures >= self.failure_threshold:
+            backend.healthy = False
+            logger.warning("Ollama backend ejected after %d failures: %s (%s)", backend.failures, backend.url, error)
+
+    async def check(self, backend: Backend):
+        backend.last_check = time.time()
+        try:
+            response = await self.client.get(f"{backend.url}/api/tags", timeout=self.health_timeout)
+            response.raise_for_status()
+            models = orjson.loads(response.content).get("models") or []
+        except Exception as e:
+            self.report_failure(backend, str(e) or type(e).__name__)
+            return
+        backend.models = {model_key(model["name"]) for model in models if "name" in model}
+        self.report_success(backend)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(backend) for backend in self.backends))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error("Backend health check failed: %s", e)
+
+    async def start(self):
+        await self.check_all()
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "url": backend.url,
+                "healthy": backend.healthy,
+                "outstanding": backend.outstanding,
+                "failures": backend.failures,
+                "models": sorted(backend.models) if backend.models is not None else None,
+                "resident": sorted(backend.resident),
+                "last_check": backend.last_check,
+                "last_error": backend.last_error,
+            }
+            for backend in self.backends
+        ]
@@ -0,0 +1,526 @@
+# libs/batch.py
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import orjson
+
+from libs.rate_limiter import RateLimitExceeded
+from libs.token_manager import Principal
+from libs.token_store import TokenStore
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("generate", "chat", "embed")
+ACTIVE = ("queued", "running")  # Other statuses are final: completed, failed, cancelled
+RETRY_STATUSES = (502, 503, 504)  # Upstream failures retried up to max_retries times
+RATE_LIMIT_MAX_DELAY = 60.0  # Longest wait between two tries of a request answered with 429
+
+_COLUMNS = ("id", "user", "api_name", "route", "status", "total", "completed", "failed", "error", "created_at", "started_at", "finished_at")
+
+class BatchUploadError(Exception):
+    """An upload that can't become a job. status_code and detail are sent to the client."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class _Job:
+    __slots__ = ("id", "user_id", "route", "total", "completed", "failed", "task", "stopped")
+
+    def __init__(self, job_id: str, user_id: str, route: Optional[str], total: int):
+        self.id = job_id
+        self.user_id = user_id
+        self.route = route
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.task: Optional[asyncio.Task] = None
+        self.stopped = False  # Cancelled or taken over, no more requests are sent for it
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def parse_route(url: Any) -> Optional[str]:
+    """'generate', '/generate' and '/api/generate' all name the generate route."""
+    if not isinstance(url, str):
+        return None
+    route = url.rstrip("/").rsplit("/", 1)[-1]
+    return route if route in ROUTES else None
+
+def parse_line(line: bytes, default_route: Optional[str]) -> Tuple[Any, str, bytes]:
+    """
+    One input line: either an envelope {"custom_id": ..., "url": "/api/chat", "body": {...}} or
+    a bare request body, sent to the job's default route. Returns the custom_id, the route and
+    the request body. Raises ValueError with a message for the results file.
+    """
+    try:
+        data = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise ValueError("Line is not valid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Line must be a JSON object")
+    if "body" not in data:
+        if default_route is None:
+            raise ValueError("Line has no 'body', and the job has no default endpoint")
+        return None, default_route, line
+    route = parse_route(data["url"]) if "url" in data else default_route
+    if route is None:
+        raise ValueError(f"Field 'url' must be one of: {', '.join('/api/' + route for route in ROUTES)}")
+    if not isinstance(data["body"], dict):
+        raise ValueError("Field 'body' must be a JSON object")
+    return data.get("custom_id"), route, orjson.dumps(data["body"])
+
+def result_line(custom_id: Any, number: int, status: int, response: Optional[bytes] = None, error: Any = None) -> bytes:
+    head = orjson.dumps({"custom_id": custom_id, "line": number, "status": status})[:-1]
+    if response is not None:
+        # Ollama's JSON body is embedded as it is, without parsing and re-encoding it
+        return head + b',"response":' + response.strip() + b"}\n"
+    return head + b',"error":' + orjson.dumps(error) + b"}\n"
+
+class BatchRunner:
+    """
+    Background processing of uploaded JSONL files of /generate, /chat and /embed requests.
+
+    Jobs live in the `batches` table next to the API keys; their input and results are files in
+    `directory`. Each line is sent through `send`, the same admission, scheduling and usage
+    accounting as interactive requests, at the scheduler tier `priority` (or the key's own, if
+    lower), with at most `concurrency` lines of a job in flight. Results are appended to the
+    results file as they come in, so memory use doesn't grow with the job, and that file is
+    what a job resumes from: lines already in it are skipped.
+
+    Every worker process runs up to `max_jobs` jobs. A process claims a job by taking it over in
+    the database and renews its claim every `poll_interval` seconds, saving the progress at the
+    same time; a job whose claim wasn't renewed for `lease` seconds (its process died) is taken
+    over by whichever process polls next. Jobs in progress at shutdown are handed back to the
+    queue.
+    """
+
+    def __init__(
+        self,
+        store: TokenStore,
+        directory: str,
+        send: Callable[[Principal, str, bytes], Awaitable[bytes]],
+        load_principal: Callable[[str], Optional[Principal]],
+        concurrency: int = 4,
+        max_jobs: int = 1,
+        priority: int = -10,
+        poll_interval: float = 5.0,
+        max_retries: int = 2,
+        max_rate_limited_wait: float = 600.0,
+    ):
+        self.store = store
+        self.directory = directory
+        self.send = send
+        self.load_principal = load_principal
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.priority = priority
+        self.poll_interval = poll_interval
+        self.lease = poll_interval * 6
+        self.max_retries = max_retries
+        self.max_rate_limited_wait = max_rate_limited_wait
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs: Dict[str, _Job] = {}  # Jobs running in this process
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # File reads and writes, one thread so the writes of a job keep their order
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-io")
+        os.makedirs(directory, exist_ok=True)
+
+    def input_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.jsonl")
+
+    def results_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.results.jsonl")
+
+    async def run_io(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, fn, *args)
+
+    # Jobs ###################################################################################
+
+    async def create(self, principal: Principal, route: Optional[str], chunks: AsyncIterator[bytes], max_bytes: int) -> Dict[str, Any]:
+        """Write an upload to disk as it arrives (in blocks of about 1 MiB) and queue it as a job."""
+        job_id = uuid.uuid4().hex
+        path = self.input_path(job_id)
+        f = await self.run_io(open, path, "wb")
+        size = total = 0
+        pending = bytearray()
+        in_line = False  # Whether the line the data seen so far ends in has content
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BatchUploadError(413, f"Batch input is larger than {max_bytes} bytes")
+                *ended, rest = chunk.split(b"\n")
+                for part in ended:
+                    if in_line or part.strip():
+                        total += 1
+                    in_line = False
+                in_line = in_line or bool(rest.strip())
+                pending += chunk
+                if len(pending) >= 1 << 20:
+                    await self.run_io(f.write, bytes(pending))
+                    pending.clear()
+            if in_line:
+                total += 1
+                pending += b"\n"
+            if total == 0:
+                raise BatchUploadError(422, "Batch input has no requests")
+            await self.run_io(f.write, bytes(pending))
+        except BaseException:
+            await self.run_io(self._remove_files, job_id, f)
+            raise
+        await self.run_io(f.close)
+
+        await self.store.run(self._insert, job_id, principal, route, total)
+        logger.info("Batch %s queued for %s/%s: %d requests", job_id, principal.user, principal.api_name, total)
+        self._wakeup.set()
+        return await self.get(job_id, principal.user_id)
+
+    def _insert(self, job_id: str, principal: Principal, route: Optional[str], total: int):
+        with self.store.transaction() as conn:
+            conn.execute(
+                "INSERT INTO batches (id, user_id, user, api_name, route, status, total, created_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, principal.user_id, principal.user, principal.api_name, route, total, _now())
+            )
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The job as a dict, or None when it doesn't exist or (with `user_id`) belongs to another key."""
+        jobs = await self.store.run(self._select, job_id, user_id, None)
+        return jobs[0] if jobs else None
+
+    async def list_jobs(self, user_id: Optional[str] = None, active_only: bool = False) -> List[Dict[str, Any]]:
+        return await self.store.run(self._select, None, user_id, ACTIVE if active_only else None)
+
+    def _select(self, job_id: Optional[str], user_id: Optional[str], statuses: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+        query = f"SELECT {', '.join(_COLUMNS)} FROM batches WHERE 1 = 1"
+        params: List[Any] = []
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if statuses is not None:
+            query += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        query += " ORDER BY created_at DESC"
+        jobs = [dict(zip(_COLUMNS, row)) for row in self.store.connection().execute(query, params)]
+        for job in jobs:
+            running = self._jobs.get(job["id"])
+            if running is not None and job["status"] == "running":  # Fresher than the last saved progress
+                job["completed"], job["failed"] = running.completed, running.failed
+        return jobs
+
+    async def cancel(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Stop a queued or running job; results so far stay available. None when there is no such job
+        or (with `user_id`) it belongs to another key, which is left running.
+        """
+        if await self.get(job_id, user_id) is None:
+            return None
+        await self.store.run(self._set_cancelled, job_id, user_id)
+        job = self._jobs.get(job_id)
+        if job is not None and job.task is not None:
+            job.stopped = True
+            job.task.cancel()  # A job running in another process stops at its next claim renewal
+        return await self.get(job_id, user_id)
+
+    def _set_cancelled(self, job_id: str, user_id: Optional[str]):
+        query = f"UPDATE batches SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ({', '.join('?' for _ in ACTIVE)})"
+        params: List[Any] = [_now(), job_id, *ACTIVE]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        with self.store.transaction() as conn:
+            conn.execute(query, params)
+
+    async def delete(self, job_id: str, user_id: Optional[str] = None) -> bool:
+        """Cancel a job and remove it with its files."""
+        if await self.cancel(job_id, user_id) is None:
+            return False
+        await self.store.run(self._delete, job_id)
+        await self.run_io(self._remove_files, job_id)
+        return True
+
+    def _delete(self, job_id: str):
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM batches WHERE id = ?", (job_id,))
+
+    def _remove_files(self, job_id: str, f=None):
+        if f is not None:
+            f.close()
+        for path in (self.input_path(job_id), self.results_path(job_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def results(self, job_id: str, block_size: int = 256 * 1024) -> AsyncIterator[bytes]:
+        """The results file in blocks of whole lines, also while the job is still writing it."""
+        try:
+            f = await self.run_io(open, self.results_path(job_id), "rb")
+        except FileNotFoundError:
+            return
+        try:
+            tail = b""
+            while True:
+                block = await self.run_io(f.read, block_size)
+                if not block:
+                    break
+                data = tail + block
+                end = data.rfind(b"\n") + 1
+                tail = data[end:]
+                if end:
+                    yield data[:end]
+        finally:
+            await self.run_io(f.close)
+
+    # Processing #############################################################################
+
+    async def _run(self, job: _Job):
+        status, error = "failed", None
+        try:
+            principal = await self.store.run(self.load_principal, job.user_id)
+            if principal is None:
+                error = "The job's API key was revoked or has expired"
+                return
+            # Below interactive traffic in the fair scheduler
+            principal = principal._replace(priority=min(principal.priority or 0, self.priority))
+            done = await self.run_io(self._recover, job)
+            if done:
+                logger.info("Batch %s resumed, %d of %d requests already done", job.id, len(done), job.total)
+            await self._process(job, principal, done)
+            status = "completed"
+        except asyncio.CancelledError:
+            status = None  # Cancelled, handed back at shutdown, or taken over by another process
+            raise
+        except Exception as e:
+            logger.exception("Batch %s failed", job.id)
+            error = str(e) or type(e).__name__
+        finally:
+            self._jobs.pop(job.id, None)
+            self._wakeup.set()
+            if status is not None:
+                try:
+                    await self.store.run(self._finish, job, status, error)
+                except Exception as e:
+                    logger.error("Could not save the end of batch %s: %s", job.id, e)
+                logger.info("Batch %s %s: %d succeeded, %d failed", job.id, status, job.completed, job.failed)
+
+    def _recover(self, job: _Job) -> Set[int]:
+        """Line numbers already in the results file, after dropping a last line cut short by a crash."""
+        done: Set[int] = set()
+        path = self.results_path(job.id)
+        if not os.path.exists(path):
+            return done
+        with open(path, "r+b") as f:
+            end = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+                result = orjson.loads(line)
+                done.add(result["line"])
+                if result["status"] == 200:
+                    job.completed += 1
+                else:
+                    job.failed += 1
+            f.truncate(end)
+        return done
+
+    async def _process(self, job: _Job, principal: Principal, done: Set[int]):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results = await self.run_io(open, self.results_path(job.id), "ab")
+
+        def write(line: bytes):
+            results.write(line)
+            results.flush()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                number, line = item
+                result, ok = await self._execute(job, principal, number, line)
+                await self.run_io(write, result)
+                if ok:
+                    job.completed += 1
+                else:
+                    job.failed += 1
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            source = await self.run_io(open, self.input_path(job.id), "rb")
+            try:
+                number = 0
+                while True:
+                    lines = await self.run_io(source.readlines, 1 << 20)
+                    if not lines:
+                        break
+                    for line in lines:
+                        number += 1
+                        if number not in done and line.strip():
+                            await queue.put((number, line))
+            finally:
+                await self.run_io(source.close)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.run_io(results.close)
+
+    async def _execute(self, job: _Job, principal: Principal, number: int, line: bytes) -> Tuple[bytes, bool]:
+        """
+        Send one line, returning its result line and whether it succeeded. Raises CancelledError
+        when the job is stopped between two tries.
+        """
+        try:
+            custom_id, route, body = parse_line(line, job.route)
+        except ValueError as e:
+            return result_line(None, number, 400, error=str(e)), False
+        retries = rate_limited = 0
+        waited = 0.0
+        while not job.stopped:
+            try:
+                response = await self.send(principal, route, body)
+                return result_line(custom_id, number, 200, response=response), True
+            except RateLimitExceeded as e:
+                # Interactive traffic first: try again later, backing off exponentially, until
+                # the request has waited max_rate_limited_wait seconds in all
+                delay = min(max(e.retry_after, 2 ** rate_limited), RATE_LIMIT_MAX_DELAY, self.max_rate_limited_wait - waited)
+                if delay <= 0:
+                    return result_line(custom_id, number, 429, error=e.detail), False
+                rate_limited += 1
+                waited += delay
+                await asyncio.sleep(delay)
+            except Exception as e:
+                status = getattr(e, "status_code", 500)
+                if status in RETRY_STATUSES and retries < self.max_retries:
+                    retries += 1
+                    await asyncio.sleep(2 ** retries)
+                    continue
+                return result_line(custom_id, number, status, error=getattr(e, "detail", None) or str(e)), False
+        raise asyncio.CancelledError()
+
+    # Claims ################################################################################
+
+    def _claim(self) -> Optional[_Job]:
+        """Take over the oldest queued job, or a running one whose process stopped renewing its claim."""
+        now = time.time()
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT id, user_id, route, total FROM batches "
+                "WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) ORDER BY created_at LIMIT 1",
+                (now - self.lease,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Conditional, in case another process claimed it since the SELECT
+            cursor = conn.execute(
+                "UPDATE batches SET status = 'running', owner = ?, heartbeat = ?, started_at = COALESCE(started_at, ?) "
+                "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND heartbeat < ?))",
+                (self.owner, now, _now(), row[0], now - self.lease)
+            )
+            if cursor.rowcount == 0:
+                return None
+        return _Job(*row)
+
+    def _renew(self, jobs: List[_Job]) -> List[_Job]:
+        """Save the progress of this process' jobs and renew their claims. Returns the jobs it no longer owns."""
+        lost = []
+        now = time.time()
+        with self.store.transaction() as conn:
+            for job in jobs:
+                cursor = conn.execute(
+                    "UPDATE batches SET completed = ?, failed = ?, heartbeat = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                    (job.completed, job.failed, now, job.id, self.owner)
+                )
+                if cursor.rowcount == 0:
+                    lost.append(job)
+        return lost
+
+    def _finish(self, job: _Job, status: str, error: Optional[str]):
+        with self.store.transaction() as conn:
+            conn.execute(
+                "UPDATE batches SET status = ?, completed = ?, failed = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, job.completed, job.failed, error, _now(), job.id, self.owner)
+            )
+
+    def _release(self, jobs: List[_Job]):
+        """Hand jobs back to the queue with their progress, so the next start resumes them without waiting for the lease."""
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "UPDATE batches SET status = 'queued', owner = NULL, completed = ?, failed = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                [(job.completed, job.failed, job.id, self.owner) for job in jobs]
+            )
+
+    async def _poll(self):
+        for job in await self.store.run(self._renew, list(self._jobs.values())):
+            logger.info("Batch %s was cancelled or taken over, stopping it", job.id)
+            job.stopped = True
+            if job.task is not None:
+                job.task.cancel()
+        while len(self._jobs) < self.max_jobs:
+            job = await self.store.run(self._claim)
+            if job is None:
+                break
+            logger.info("Batch %s started (%d requests)", job.id, job.total)
+            self._jobs[job.id] = job
+            job.task = asyncio.ensure_future(self._run(job))
+
+    async def _poll_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.error("Batch poll failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        tasks = [job.task for job in self._jobs.values() if job.task is not None]
+        jobs = list(self._jobs.values())
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if jobs:
+            try:
+                await self.store.run(self._release, jobs)
+            except Exception as e:
+                logger.error("Could not hand back running batches: %s", e)
+        self._io.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "max_jobs": self.max_jobs,
+            "concurrency": self.concurrency,
+            "priority": self.priority,
+            "running": {
+                job.id: {"total": job.total, "completed": job.completed, "failed": job.failed}
+                for job in self._jobs.values()
+            },
+        }
@@ -0,0 +1,97 @@
+# libs/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """Thread-safe LRU cache where every entry also expires after a time-to-live (in seconds)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return  # Caching disabled
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)  # Evict the least recently used entry
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[1] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class ByteLRU:
+    """
+    LRU cache of byte strings bounded by the total size of the stored values.
+    Entries can carry a tag (e.g. the model name) so related entries can be dropped together.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (tag, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Hashable, value: bytes, tag: Hashable = None):
+        if len(value) > self.max_bytes:
+            return  # Never let a single entry flush the whole cache
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size_bytes -= len(old[1])
+            self._data[key] = (tag, value)
+            self.size_bytes += len(value)
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    def discard_tag(self, tag: Hashable) -> int:
+        """Drop every entry stored with the given tag, returns how many were dropped."""
+        with self._lock:
+            keys = [key for key, (entry_tag, _) in self._data.items() if entry_tag == tag]
+            for key in keys:
+                self.size_bytes -= len(self._data.pop(key)[1])
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
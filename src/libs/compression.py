@@ -0,0 +1,45 @@
+# libs/compression.py
+import gzip
+from typing import Optional, Tuple
+
+try:
+    import zstandard  # Optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+def available_codings() -> Tuple[str, ...]:
+    """Content codings the gateway can produce, preferred first."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content coding for a response from the client's Accept-Encoding header, or None to
+    send it uncompressed. Codings with q=0 are refused; among the others zstd wins over gzip.
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip()
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    for coding in available_codings():
+        if coding in accepted or "*" in accepted:
+            return coding
+    return None
+
+def compress(body: bytes, coding: str) -> bytes:
+    """Compress a whole response body. Both codecs release the GIL, so this can run in a thread."""
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
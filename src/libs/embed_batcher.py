@@ -0,0 +1,111 @@
+# libs/embed_batcher.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import orjson
+from starlette.responses import Response
+
+from libs.payload import Payload
+
+logger = logging.getLogger(__name__)
+
+# Fields that must match for two /embed calls to share an upstream request
+_NOT_GROUPED = ("input", "stream", "extra_params")
+
+def _chars(inputs: List[Any]) -> int:
+    return sum(len(text) for text in inputs if isinstance(text, str))
+
+class _Batch:
+    __slots__ = ("template", "items", "size", "timer")
+
+    def __init__(self, template: Dict[str, Any]):
+        self.template = template
+        self.items: List[tuple] = []  # (inputs, future)
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+class EmbedBatcher:
+    """
+    Micro-batching stage for /embed. Concurrent calls for the same model and options that
+    arrive within `window` seconds (or until `max_items` inputs are queued) are sent to
+    Ollama as one list-input request, and the vectors are split back to each caller.
+    """
+
+    def __init__(self, send: Callable[[Payload], Awaitable[Response]], window: float, max_items: int):
+        self.send = send  # Performs the non-streaming upstream call, raises HTTPException on errors
+        self.window = window
+        self.max_items = max_items
+        self._pending: Dict[bytes, _Batch] = {}
+        self._tasks: Set[asyncio.Task] = set()  # Batches being sent, referenced until done
+        self.batches = 0
+        self.batched_requests = 0
+
+    async def embed(self, payload: Payload) -> bytes:
+        """Queue the payload's input(s) and return the JSON body answering just this call."""
+        inputs = payload.data.get("input")
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+
+        template = {k: v for k, v in payload.data.items() if k not in _NOT_GROUPED}
+        group = orjson.dumps(template, option=orjson.OPT_SORT_KEYS)
+
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(group)
+        if batch is None:
+            batch = self._pending[group] = _Batch(template)
+            batch.timer = loop.call_later(self.window, self._flush, group, batch)
+
+        future = loop.create_future()
+        batch.items.append((inputs, future))
+        batch.size += len(inputs)
+        if batch.size >= self.max_items:
+            self._flush(group, batch)
+        return await future
+
+    def _flush(self, group: bytes, batch: _Batch):
+        if self._pending.get(group) is not batch:
+            return  # Already flushed by size
+        del self._pending[group]
+        batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: _Batch):
+        self.batches += 1
+        self.batched_requests += len(batch.items)
+        data = dict(batch.template)
+        data["input"] = [text for inputs, _ in batch.items for text in inputs]
+        data["stream"] = False
+
+        try:
+            response = await self.send(Payload(data))
+            result = orjson.loads(response.body)
+            embeddings = result.pop("embeddings")
+        except Exception as e:
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Everything but the vectors (model, durations) is shared by the whole batch. The prompt
+        # token count can't be split exactly, so it is shared out in proportion to the input length.
+        prompt_eval_count = result.pop("prompt_eval_count", None)
+        total_chars = _chars(data["input"]) or 1
+        offset = 0
+        for inputs, future in batch.items:
+            part = embeddings[offset:offset + len(inputs)]
+            offset += len(inputs)
+            if future.done():
+                continue  # The caller went away
+            body = dict(result, embeddings=part)
+            if prompt_eval_count is not None:
+                body["prompt_eval_count"] = round(prompt_eval_count * _chars(inputs) / total_chars)
+            future.set_result(orjson.dumps(body))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "pending_batches": len(self._pending),
+        }
@@ -0,0 +1,163 @@
+# libs/embed_cache.py
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+import orjson
+
+from libs.backend_pool import model_key
+from libs.cache import ByteLRU
+from libs.payload import Payload
+
+logger = logging.getLogger(__name__)
+
+# Request fields that change the vectors Ollama returns. Anything else (stream, keep_alive, ...) is ignored.
+EMBED_KEY_FIELDS = ("model", "input", "options", "truncate", "dimensions")
+
+class _DiskTier:
+    """SQLite-backed second tier, survives restarts. All I/O runs on one background thread."""
+
+    # Trim the table back to max_entries every this many writes
+    TRIM_EVERY = 256
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._writes = 0
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-cache")
+        self._executor.submit(self._open).result()
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embed_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                body BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embed_cache_model ON embed_cache(model)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embed_cache_created_at ON embed_cache(created_at)')
+        self._conn.commit()
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def submit(self, fn, *args):
+        """Fire-and-forget write, errors are logged instead of reaching the request."""
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(_log_failure)
+
+    def get(self, key: str) -> Optional[tuple]:
+        return self._conn.execute('SELECT model, body FROM embed_cache WHERE key = ?', (key,)).fetchone()
+
+    def set(self, key: str, model: str, body: bytes):
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO embed_cache (key, model, body, created_at) VALUES (?, ?, ?, ?)',
+                (key, model, body, time.time())
+            )
+        self._writes += 1
+        if self._writes % self.TRIM_EVERY == 0:
+            self._trim()
+
+    def _trim(self):
+        with self._conn:
+            self._conn.execute(
+                'DELETE FROM embed_cache WHERE key IN '
+                '(SELECT key FROM embed_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def invalidate(self, model: Optional[str]) -> int:
+        with self._conn:
+            if model is None:
+                return self._conn.execute('DELETE FROM embed_cache').rowcount
+            # Also rows stored under the name as requested, by versions that didn't normalize it
+            names = (model, model[:-len(":latest")]) if model.endswith(":latest") else (model, model)
+            return self._conn.execute('DELETE FROM embed_cache WHERE model IN (?, ?)', names).rowcount
+
+    def count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM embed_cache').fetchone()[0]
+
+    def close(self):
+        self._executor.submit(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("Embedding cache disk write failed: %s", future.exception())
+
+class EmbedCache:
+    """
+    Content-addressed cache of /embed responses, keyed by the model, the input and the
+    options that affect the vectors. A memory LRU bounded in bytes sits in front of an
+    optional SQLite tier on local disk. Hits are served without contacting Ollama.
+    """
+
+    def __init__(self, max_bytes: int, disk_path: Optional[str] = None, disk_max_entries: int = 1_000_000):
+        self.memory = ByteLRU(max_bytes)
+        self.disk = _DiskTier(disk_path, disk_max_entries) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(payload: Payload) -> str:
+        fields = [payload.data.get(name) for name in EMBED_KEY_FIELDS]
+        return hashlib.sha256(orjson.dumps(fields, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        body = self.memory.get(key)
+        if body is not None:
+            self.hits += 1
+            return body
+        if self.disk is not None:
+            row = await self.disk.run(self.disk.get, key)
+            if row is not None:
+                self.disk_hits += 1
+                model, body = row[0], bytes(row[1])
+                self.memory.set(key, body, tag=model_key(model))  # Promote to the memory tier
+                return body
+        self.misses += 1
+        return None
+
+    def set(self, key: str, model: str, body: bytes):
+        model = model_key(model)  # 'llama3.2' and 'llama3.2:latest' are invalidated together
+        self.memory.set(key, body, tag=model)
+        if self.disk is not None:
+            self.disk.submit(self.disk.set, key, model, body)
+
+    async def invalidate(self, model: Optional[str] = None) -> Dict[str, int]:
+        """Drop cached embeddings for one model, or for every model when model is None."""
+        if model is None:
+            memory = len(self.memory)
+            self.memory.clear()
+        else:
+            model = model_key(model)
+            memory = self.memory.discard_tag(model)
+        disk = await self.disk.run(self.disk.invalidate, model) if self.disk is not None else 0
+        return {"memory": memory, "disk": disk}
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size_bytes,
+            "memory_max_bytes": self.memory.max_bytes,
+            "disk_entries": await self.disk.run(self.disk.count) if self.disk is not None else None,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,87 @@
+# libs/embed_encoding.py
+import base64
+import io
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import orjson
+
+try:
+    import numpy  # Optional: pip install numpy
+except ImportError:
+    numpy = None
+
+# Request fields selecting the encoding, removed from the payload before it is forwarded to Ollama
+FORMAT_FIELD = "encoding_format"
+DTYPE_FIELD = "dtype"
+
+FORMATS = ("float", "base64", "binary", "npy")  # "float" is Ollama's JSON
+DTYPES = {"float32": "<f4", "float16": "<f2"}  # Little-endian, whatever the host's byte order
+_ACCEPT = {"application/octet-stream": "binary", "application/x-npy": "npy"}
+
+class EmbedEncoding(NamedTuple):
+    format: str  # "base64", "binary" or "npy"
+    dtype: str  # "float32" or "float16"
+
+def parse_encoding(accept: Optional[str], encoding_format: Optional[str], dtype: Optional[str]) -> Optional[EmbedEncoding]:
+    """
+    The encoding a client asked for, from the request's `encoding_format` and `dtype` fields or
+    else its Accept header (`application/octet-stream` or `application/x-npy`, optionally with a
+    `dtype=float16` parameter). None means Ollama's JSON, sent as it is.
+    Raises ValueError with a client-facing message for unknown values.
+    """
+    if encoding_format is None and accept:
+        for media_range in accept.split(","):
+            media_type, *params = (part.strip() for part in media_range.split(";"))
+            encoding_format = _ACCEPT.get(media_type.lower())
+            if encoding_format is not None:
+                for param in params:
+                    name, _, value = param.partition("=")
+                    if name.strip().lower() == "dtype" and dtype is None:
+                        dtype = value.strip().strip('"')
+                break
+
+    if encoding_format in (None, "float"):
+        if dtype not in (None, "float32"):
+            raise ValueError(f"Field '{DTYPE_FIELD}' needs an '{FORMAT_FIELD}' of base64, binary or npy")
+        return None
+    if encoding_format not in FORMATS:
+        raise ValueError(f"Field '{FORMAT_FIELD}' must be one of: {', '.join(FORMATS)}")
+    dtype = dtype or "float32"
+    if not isinstance(dtype, str) or dtype not in DTYPES:
+        raise ValueError(f"Field '{DTYPE_FIELD}' must be one of: {', '.join(DTYPES)}")
+    return EmbedEncoding(encoding_format, dtype)
+
+def available() -> bool:
+    """The binary encodings need numpy."""
+    return numpy is not None
+
+def encode(body: bytes, encoding: EmbedEncoding) -> Tuple[bytes, str, Dict[str, str]]:
+    """
+    Re-encode Ollama's JSON /embed response. Returns the content, its media type and extra headers.
+
+    - base64: the same JSON, each vector a base64 string of its little-endian floats
+    - binary: the vectors as one row-major buffer, with X-Embedding-Shape ("rows,dims") and
+      X-Embedding-Dtype headers
+    - npy: the vectors as a 2-D NumPy .npy file
+    """
+    result = orjson.loads(body)
+    # One C-level conversion from the parsed lists, no per-element Python code
+    vectors = numpy.asarray(result.pop("embeddings", None) or [], dtype=DTYPES[encoding.dtype])
+    if vectors.size == 0:
+        vectors = vectors.reshape(0, 0)
+    elif vectors.ndim != 2:
+        raise ValueError("Ollama returned embeddings of different lengths")
+
+    if encoding.format == "base64":
+        result["embeddings"] = [base64.b64encode(row.tobytes()).decode() for row in vectors]
+        result[DTYPE_FIELD] = encoding.dtype
+        return orjson.dumps(result), "application/json", {}
+    if encoding.format == "npy":
+        buffer = io.BytesIO()
+        numpy.save(buffer, vectors, allow_pickle=False)
+        return buffer.getvalue(), "application/x-npy", {}
+    headers = {
+        "X-Embedding-Shape": f"{vectors.shape[0]},{vectors.shape[1]}",
+        "X-Embedding-Dtype": encoding.dtype,
+    }
+    return vectors.tobytes(), "application/octet-stream", headers
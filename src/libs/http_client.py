@@ -0,0 +1,31 @@
+# libs/http_client.py
+import logging
+import httpx
+from models import Settings
+
+logger = logging.getLogger(__name__)
+
+def create_upstream_client(settings: Settings) -> httpx.AsyncClient:
+    """Build the long-lived, pooled HTTP client shared by every request forwarded to Ollama."""
+    limits = httpx.Limits(
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+        read=settings.UPSTREAM_READ_TIMEOUT,
+        write=settings.UPSTREAM_WRITE_TIMEOUT,
+        pool=settings.UPSTREAM_POOL_TIMEOUT,
+    )
+
+    http2 = settings.UPSTREAM_HTTP2
+    if http2:
+        # HTTP/2 support in httpx requires the optional 'h2' package (pip install httpx[http2])
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("UPSTREAM_HTTP2 is enabled but the 'h2' package is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
@@ -1,11 +1,60 @@
 # libs/logger.py
+import atexit
 import logging
 import logging.config
-from models import Settings
+import logging.handlers
+import queue
+from typing import List, Optional
+from models import Settings, get_settings
 
-def setup_logging():
+ACCESS_LOGGER = "access"
+
+# Listeners writing the records queued by the QueueHandlers, stopped (and flushed) at exit
+_listeners: List[logging.handlers.QueueListener] = []
+
+def _file_handler(filename: str, level: str, formatter: str, settings: Settings) -> dict:
+    handler = {
+        'level': level,
+        'formatter': formatter,
+        'filename': filename,
+        'mode': 'a',
+        'encoding': 'utf-8',
+    }
+    if settings.LOG_FILE_MAX_BYTES > 0:
+        handler.update({
+            'class': 'logging.handlers.RotatingFileHandler',
+            'maxBytes': settings.LOG_FILE_MAX_BYTES,
+            'backupCount': settings.LOG_FILE_BACKUP_COUNT,
+        })
+    else:
+        handler['class'] = 'logging.FileHandler'
+    return handler
+
+def _move_to_queue(logger: logging.Logger):
+    """
+    Replace the logger's handlers with a QueueHandler and have a QueueListener thread run
+    them, so console and file I/O never happens on the event loop.
+    """
+    handlers = logger.handlers[:]
+    if not handlers:
+        return
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    _listeners.append(listener)
+
+def stop_logging():
+    """Write out queued records and stop the listener threads."""
+    while _listeners:
+        _listeners.pop().stop()
+
+atexit.register(stop_logging)
+
+def setup_logging(settings: Optional[Settings] = None):
     """Set up logging configuration based on the LOG_LEVEL and LOG_FILE_LEVEL environment variables."""
-    settings = Settings()  # Initialize Settings to access LOG_LEVEL and LOG_FILE_LEVEL
+    settings = settings or get_settings()  # Initialize Settings to access LOG_LEVEL and LOG_FILE_LEVEL
+    stop_logging()  # When called again, the previous listeners must not keep writing
 
     # Retrieve the log level for the console handler from settings, default to 'INFO' if not set or invalid
     log_level_str = settings.LOG_LEVEL.upper() if hasattr(settings, 'LOG_LEVEL') else 'INFO'
@@ -41,19 +90,12 @@ def setup_logging():
                 'class': 'logging.StreamHandler',
                 'formatter': 'standard'
             },
-            'file': {
-                'level': log_file_level_str,  # Use the log level from LOG_FILE_LEVEL
-                'class': 'logging.FileHandler',
-                'formatter': 'detailed',
-                'filename': 'app.log',  # Make this path configurable if needed
-                'mode': 'a',
-            },
         },
 
         'loggers': {
             # Root logger configuration
             '': {
-                'handlers': ['console', 'file'],
+                'handlers': ['console'],
                 'level': log_level_str,  # Use the log level from LOG_LEVEL
                 'propagate': True
             },
@@ -66,8 +108,26 @@ def setup_logging():
         }
     }
 
+    if settings.LOG_FILE:
+        # Use the log level from LOG_FILE_LEVEL
+        config['handlers']['file'] = _file_handler(settings.LOG_FILE, log_file_level_str, 'detailed', settings)
+        config['loggers']['']['handlers'].append('file')
+
+    # One JSON document per line and request, see libs/access_log.py
+    if settings.ACCESS_LOG:
+        config['formatters']['message'] = {'format': '%(message)s'}
+        if settings.ACCESS_LOG_FILE:
+            config['handlers']['access'] = _file_handler(settings.ACCESS_LOG_FILE, 'INFO', 'message', settings)
+        else:
+            config['handlers']['access'] = {'level': 'INFO', 'class': 'logging.StreamHandler', 'formatter': 'message'}
+        config['loggers'][ACCESS_LOGGER] = {'handlers': ['access'], 'level': 'INFO', 'propagate': False}
+
     # Apply the logging configuration
     logging.config.dictConfig(config)
 
     # Optional: Set the root logger's level explicitly
     logging.getLogger().setLevel(log_level_str)
+
+    _move_to_queue(logging.getLogger())
+    if settings.ACCESS_LOG:
+        _move_to_queue(logging.getLogger(ACCESS_LOGGER))
@@ -0,0 +1,212 @@
+# libs/metrics.py
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _label_text(self, labels: Labels, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._label_text(labels)} {_format_value(value)}" for labels, value in self._values.items()]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: Labels, value: float):
+        self._values[labels] = value
+
+    def clear(self):
+        self._values.clear()
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Labels, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: Labels, value: float):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {state[-1]}")
+        return lines
+
+class GatewayMetrics:
+    """
+    The gateway's metrics, rendered in the Prometheus text exposition format.
+
+    Everything runs on the event loop, so the metrics need no locking. Stream throughput is
+    taken from the counters in Ollama's final chunk (RequestContext.usage), which is parsed
+    once per stream rather than per chunk.
+    """
+
+    def __init__(self):
+        self.requests = Counter("gateway_requests_total", "Requests handled.", ("route", "model", "user", "status"))
+        self.errors = Counter("gateway_request_errors_total", "Requests answered with an error status or aborted.", ("route", "model", "user", "status"))
+        self.in_flight = Gauge("gateway_requests_in_flight", "Requests being handled.")
+        self.duration = Histogram("gateway_request_duration_seconds", "Time from request to the end of the response.", ("route", "model"))
+        self.upstream_duration = Histogram("gateway_upstream_duration_seconds", "Time spent waiting on Ollama, up to its last byte.", ("route", "model"))
+        self.ttfb = Histogram("gateway_time_to_first_byte_seconds", "Time from request to the first byte of a streamed response.", ("route", "model"))
+        self.stream_errors = Counter("gateway_stream_errors_total", "Streams cut short by an upstream failure after the response started.", ("route", "model"))
+        self.tokens = Counter("gateway_tokens_total", "Tokens processed by Ollama.", ("model", "user", "kind"))
+        self.tokens_per_second = Histogram(
+            "gateway_generation_tokens_per_second",
+            "Generation speed reported by Ollama (eval_count / eval_duration).",
+            ("model",),
+            buckets=TOKENS_PER_SECOND_BUCKETS,
+        )
+        self.backend_in_flight = Gauge("gateway_backend_requests_in_flight", "Requests outstanding per Ollama server.", ("backend",))
+        self.backend_healthy = Gauge("gateway_backend_healthy", "1 if the Ollama server passes health checks.", ("backend",))
+        self.model_resident = Gauge("gateway_model_resident", "1 for each model an Ollama server has loaded, per /api/ps.", ("backend", "model"))
+        self.model_cold_requests = Counter("gateway_model_cold_requests_total", "Requests sent to a server that didn't have their model loaded.", ("model",))
+        self.model_loads = Counter("gateway_model_loads_total", "Model preloads and warm-ups sent by the gateway.", ("model",))
+        self._metrics = [
+            self.requests, self.errors, self.stream_errors, self.in_flight, self.duration, self.upstream_duration, self.ttfb,
+            self.tokens, self.tokens_per_second, self.backend_in_flight, self.backend_healthy,
+            self.model_resident, self.model_cold_requests, self.model_loads,
+        ]
+
+    def observe_request(self, route: str, status: Optional[int], start: float, ctx=None, principal=None):
+        end = time.perf_counter()
+        model = (ctx.model if ctx is not None else None) or ""
+        user = principal.user if principal is not None else ""
+        status_label = str(status) if status is not None else "aborted"
+        self.requests.inc((route, model, user, status_label))
+        if status is None or status >= 400:
+            self.errors.inc((route, model, user, status_label))
+        self.duration.observe((route, model), end - start)
+        if ctx is None:
+            return
+
+        if ctx.upstream_start is not None:
+            self.upstream_duration.observe((route, model), (ctx.upstream_end or end) - ctx.upstream_start)
+        if ctx.first_byte is not None:
+            self.ttfb.observe((route, model), ctx.first_byte - start)
+        if ctx.error:
+            self.stream_errors.inc((route, model))
+        usage = ctx.usage
+        if usage:
+            self.tokens.inc((model, user, "prompt"), usage.get("prompt_eval_count", 0))
+            self.tokens.inc((model, user, "completion"), usage.get("eval_count", 0))
+            eval_count, eval_duration = usage.get("eval_count"), usage.get("eval_duration")
+            if eval_count and eval_duration:
+                self.tokens_per_second.observe((model,), eval_count / (eval_duration / 1e9))
+
+    def set_backends(self, backends: List[dict]):
+        self.backend_in_flight.clear()
+        self.backend_healthy.clear()
+        self.model_resident.clear()
+        for backend in backends:
+            self.backend_in_flight.set((backend["url"],), backend["outstanding"])
+            self.backend_healthy.set((backend["url"],), 1 if backend["healthy"] else 0)
+            for model in backend["resident"]:
+                self.model_resident.set((backend["url"], model), 1)
+
+    def set_model_loads(self, cold_requests: Dict[str, int], loads: Dict[str, int]):
+        """Copy ModelManager's counters, which it keeps itself so /admin/models works without metrics."""
+        self.model_cold_requests._values = {(model,): n for model, n in cold_requests.items()}
+        self.model_loads._values = {(model,): n for model, n in loads.items()}
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+class MetricsMiddleware:
+    """
+    ASGI middleware feeding GatewayMetrics: one observation per request once the response
+    is over (for streams, after the last chunk or the client going away).
+    Requests not matching any route are counted under route="unmatched".
+    """
+
+    def __init__(self, app, metrics: GatewayMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            state = scope.get("state") or {}
+            self.metrics.observe_request(route, status, start, state.get("ctx"), state.get("principal"))
@@ -0,0 +1,185 @@
+# libs/model_manager.py
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Union
+
+import orjson
+
+from libs.backend_pool import Backend, BackendPool, model_key
+from libs.payload import Payload
+from libs.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+KeepAlive = Union[str, int, float]
+
+class ModelManager:
+    """
+    Keeps track of which models each Ollama server has loaded, so that loads are seen, counted
+    and where possible avoided:
+
+    - `preload` models are loaded on every server at startup (an empty /api/generate call), and
+      loaded again when a /api/ps poll finds one missing, e.g. after Ollama restarted
+    - /api/ps is polled every `poll_interval` seconds; the backend pool prefers servers that have
+      a request's model resident (Backend.resident)
+    - `keep_alive` policies (model -> Ollama keep_alive, e.g. -1 to pin a model) replace whatever
+      keep_alive forwarded requests carry
+    - with `warmup_hold`, requests for a model that isn't resident wait behind a single warm-up
+      call per server instead of all reaching Ollama while it loads
+    """
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        preload: List[str],
+        keep_alive: Dict[str, KeepAlive],
+        poll_interval: float = 10.0,
+        warmup_hold: bool = False,
+        warmup_timeout: float = 300.0,
+    ):
+        self.pool = pool
+        self.preload = [model_key(model) for model in preload]
+        self.keep_alive = {model_key(model): value for model, value in keep_alive.items()}
+        self.poll_interval = poll_interval
+        self.warmup_hold = warmup_hold
+        self.warmup_timeout = warmup_timeout
+        self._loads = SingleFlight()  # (backend url, model) -> load in progress
+        self._residency: Dict[str, Dict[str, Dict[str, Any]]] = {}  # backend url -> model -> /api/ps entry
+        self._tasks: Set[asyncio.Task] = set()
+        self._poll_task: Optional[asyncio.Task] = None
+        # Per model
+        self.cold_requests: Dict[str, int] = {}  # Requests sent to a server that didn't have the model loaded
+        self.loads: Dict[str, int] = {}  # Preloads and warm-ups sent
+        self.load_failures: Dict[str, int] = {}
+
+    # Requests #############################################################################
+
+    def apply_keep_alive(self, payload: Payload):
+        if payload.model:
+            value = self.keep_alive.get(model_key(payload.model))
+            if value is not None and payload.data.get("keep_alive") != value:
+                payload.update({"keep_alive": value})
+
+    async def before_request(self, backend: Backend, model: Optional[str]):
+        """Called once a server is picked for a request: count cold starts, hold the request while the model loads."""
+        if not model or self.is_resident(backend, model):
+            return
+        key = model_key(model)
+        self.cold_requests[key] = self.cold_requests.get(key, 0) + 1
+        if self.warmup_hold:
+            await self._loads.do((backend.url, key), lambda: self._load(backend, key))
+
+    def loaded(self, backend: Backend, model: Optional[str]):
+        """The server answered a request for the model, so it has it loaded (until the next poll says otherwise)."""
+        if model:
+            key = model_key(model)
+            resident = self._residency.setdefault(backend.url, {})
+            if key not in resident:
+                resident[key] = {"name": key}
+                self._publish(backend)
+
+    def is_resident(self, backend: Backend, model: str) -> bool:
+        return model_key(model) in self._residency.get(backend.url, ())
+
+    # Loading ##############################################################################
+
+    async def _load(self, backend: Backend, model: str):
+        """Load a model with an empty generate call (embedding-only models are loaded through /api/embed)."""
+        self.loads[model] = self.loads.get(model, 0) + 1
+        data: Dict[str, Any] = {"model": model}
+        if model in self.keep_alive:
+            data["keep_alive"] = self.keep_alive[model]
+        start = time.perf_counter()
+        try:
+            response = await self.pool.client.post(f"{backend.url}/api/generate", content=orjson.dumps(data), timeout=self.warmup_timeout)
+            if response.status_code == 400:  # "does not support generate"
+                data["input"] = []
+                response = await self.pool.client.post(f"{backend.url}/api/embed", content=orjson.dumps(data), timeout=self.warmup_timeout)
+            response.raise_for_status()
+        except Exception as e:
+            # The requests held behind the load go ahead anyway, Ollama answers them with the actual error
+            self.load_failures[model] = self.load_failures.get(model, 0) + 1
+            logger.warning("Loading %s on %s failed: %s", model, backend.url, str(e) or type(e).__name__)
+            return
+        logger.info("Loaded %s on %s in %.1fs", model, backend.url, time.perf_counter() - start)
+        self.loaded(backend, model)
+
+    def _load_in_background(self, backend: Backend, model: str):
+        task = asyncio.ensure_future(self._loads.do((backend.url, model), lambda: self._load(backend, model)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Residency ############################################################################
+
+    async def poll(self, backend: Backend):
+        try:
+            response = await self.pool.client.get(f"{backend.url}/api/ps", timeout=self.pool.health_timeout)
+            response.raise_for_status()
+            models = orjson.loads(response.content).get("models") or []
+        except Exception as e:
+            logger.debug("Polling /api/ps on %s failed: %s", backend.url, e)
+            return
+        self._residency[backend.url] = {
+            model_key(entry["name"]): {
+                "name": entry["name"],
+                "size": entry.get("size"),
+                "size_vram": entry.get("size_vram"),
+                "expires_at": entry.get("expires_at"),
+            }
+            for entry in models if entry.get("name")
+        }
+        self._publish(backend)
+        for model in self.preload:
+            if model not in self._residency[backend.url] and not self._loads.in_flight((backend.url, model)):
+                logger.info("Preloaded model %s is not loaded on %s, loading it", model, backend.url)
+                self._load_in_background(backend, model)
+
+    def _publish(self, backend: Backend):
+        backend.resident = set(self._residency.get(backend.url, ()))
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                await asyncio.gather(*(self.poll(backend) for backend in self.pool.backends))
+            except Exception as e:
+                logger.error("Model residency poll failed: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self.poll_interval > 0:
+            # The first poll finds the preload models missing and loads them
+            self._poll_task = asyncio.create_task(self._poll_loop())
+        else:
+            for backend in self.pool.backends:
+                for model in self.preload:
+                    self._load_in_background(backend, model)
+
+    async def close(self):
+        tasks = list(self._tasks)
+        if self._poll_task is not None:
+            tasks.append(self._poll_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def resident(self) -> Dict[str, List[str]]:
+        return {url: sorted(models) for url, models in self._residency.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "poll_interval": self.poll_interval,
+            "warmup_hold": self.warmup_hold,
+            "preload": self.preload,
+            "keep_alive": self.keep_alive,
+            "backends": {url: list(models.values()) for url, models in self._residency.items()},
+            "models": {
+                model: {
+                    "cold_requests": self.cold_requests.get(model, 0),
+                    "loads": self.loads.get(model, 0),
+                    "load_failures": self.load_failures.get(model, 0),
+                }
+                for model in sorted(set(self.cold_requests) | set(self.loads) | set(self.load_failures))
+            },
+            "loading": self._loads.stats()["in_flight"],
+        }
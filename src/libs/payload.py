@@ -0,0 +1,69 @@
+# libs/payload.py
+from typing import Any, Dict, Optional
+import orjson
+
+class Payload:
+    """
+    JSON request body forwarded to Ollama.
+
+    Keeps the bytes the client sent next to the parsed fields, so an unchanged body is
+    forwarded as-is and only re-encoded (with orjson) once something was merged into it.
+    """
+    __slots__ = ("data", "_raw")
+
+    def __init__(self, data: Dict[str, Any], raw: Optional[bytes] = None):
+        self.data = data
+        self._raw = raw
+
+    @property
+    def model(self) -> str:
+        return self.data.get("model")
+
+    @property
+    def stream(self) -> bool:
+        return self.data.get("stream", True)  # Ollama streams unless told otherwise
+
+    def update(self, params: Dict[str, Any]):
+        if params:
+            self.data.update(params)
+            self._raw = None
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove a field the gateway handles itself, so it isn't forwarded to Ollama."""
+        if key not in self.data:
+            return default
+        self._raw = None
+        return self.data.pop(key)
+
+    def body(self) -> bytes:
+        if self._raw is None:
+            self._raw = orjson.dumps(self.data)
+        return self._raw
+
+def parse_passthrough(raw: bytes) -> Payload:
+    """
+    Parse a raw request body checking only the fields the gateway relies on ('model', 'stream'
+    and 'extra_params'). Everything else is left for Ollama to validate.
+    Raises ValueError with a client-facing message when the body is unusable.
+    """
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        raise ValueError("Request body is not valid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    model = data.get("model")
+    if not isinstance(model, str) or not model:
+        raise ValueError("Field 'model' is required and must be a string")
+    stream = data.get("stream")
+    if stream is not None and not isinstance(stream, bool):
+        raise ValueError("Field 'stream' must be a boolean")
+
+    payload = Payload(data, raw)
+    extra_params = data.get("extra_params")
+    if extra_params is not None:
+        if not isinstance(extra_params, dict):
+            raise ValueError("Field 'extra_params' must be an object")
+        payload.update(extra_params)
+    return payload
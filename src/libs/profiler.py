@@ -0,0 +1,101 @@
+# libs/profiler.py
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames (module, function) of threads that are waiting rather than running: the event
+# loop polling for I/O (or, with uvloop, inside the loop's C code), idle thread pool workers and
+# the log queue listeners
+IDLE_FRAMES = {
+    ("selectors", "select"),
+    ("asyncio.runners", "run"),
+    ("uvloop", "run"),
+    ("threading", "wait"),
+    ("queue", "get"),
+    ("logging.handlers", "dequeue"),
+    ("concurrent.futures.thread", "_worker"),
+}
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the running gateway. For the length of a profile, a thread of its
+    own takes the stack of every other thread (the event loop's and the worker threads') every
+    `interval` seconds through sys._current_frames(); between profiles nothing runs at all.
+
+    Profiles come out as collapsed stacks, one "thread;outermost frame;...;innermost frame count"
+    line per distinct stack, which flamegraph.pl, inferno and speedscope read as they are.
+    Frames are "module:function". One profile runs at a time.
+    """
+
+    def __init__(self, max_seconds: float = 60.0):
+        self.max_seconds = max_seconds
+        self.running = False
+        self.profiles = 0
+
+    async def profile(self, seconds: float, interval: float = 0.01, idle: bool = False) -> bytes:
+        """Sample for `seconds` (at most max_seconds). Waiting threads are left out unless `idle`."""
+        seconds = min(seconds, self.max_seconds)
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        stop = threading.Event()
+
+        def run():
+            try:
+                stacks = self._sample(seconds, interval, idle, stop)
+            except BaseException as e:
+                loop.call_soon_threadsafe(lambda: result.done() or result.set_exception(e))
+            else:
+                loop.call_soon_threadsafe(lambda: result.done() or result.set_result(stacks))
+
+        self.running = True
+        start = time.perf_counter()
+        try:
+            threading.Thread(target=run, name="profiler", daemon=True).start()
+            stacks = await result
+        finally:
+            stop.set()  # The client went away: stop sampling too
+            self.running = False
+        self.profiles += 1
+        logger.info("Profiled for %.1fs: %s samples, %s distinct stacks", time.perf_counter() - start, sum(stacks.values()), len(stacks))
+        return self.collapse(stacks)
+
+    @staticmethod
+    def _sample(seconds: float, interval: float, idle: bool, stop: threading.Event) -> Counter:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        labels: Dict[object, str] = {}  # Code object -> frame label
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while True:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not idle and (frame.f_globals.get("__name__"), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                if ident not in names:  # Started since
+                    names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(";", ":"))
+                stacks[tuple(reversed(stack))] += 1
+            if time.monotonic() >= deadline or stop.wait(interval):
+                return stacks
+
+    @staticmethod
+    def collapse(stacks: Counter) -> bytes:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common()).encode()
+
+    def stats(self) -> Dict[str, object]:
+        return {"max_seconds": self.max_seconds, "running": self.running, "profiles": self.profiles}
@@ -0,0 +1,206 @@
+# libs/rate_limiter.py
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from libs.backend_pool import model_key
+from libs.request_context import RequestContext
+from libs.token_manager import Principal
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is not admitted. retry_after is a hint in seconds for the Retry-After header."""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    """Classic token bucket: refills at `rate` per second up to `capacity`. The balance may go negative (debt)."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens if available and return 0, otherwise return the seconds to wait."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def wait_time(self) -> float:
+        """Seconds until the balance is positive again (0 if it already is)."""
+        self._refill()
+        return 0.0 if self.tokens > 0 else (1 - self.tokens) / self.rate
+
+    def charge(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+class _KeyState:
+    """Limits enforcement state of one API key, rebuilt when the key's limits change."""
+    __slots__ = ("limits", "requests", "tokens", "streams")
+
+    def __init__(self, principal: Principal, burst_seconds: float):
+        self.limits = (principal.rate_limit_rps, principal.max_concurrent_streams, principal.tokens_per_minute)
+        rps, _, tpm = self.limits
+        self.requests = TokenBucket(rps, max(1.0, rps * burst_seconds)) if rps else None
+        self.tokens = TokenBucket(tpm / 60.0, float(tpm)) if tpm else None
+        self.streams = 0
+
+class _ModelSlots:
+    """Global concurrency cap of one model."""
+    __slots__ = ("limit", "semaphore", "waiting")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+
+class AdmissionController:
+    """
+    In-process admission control in front of the upstream:
+
+    - per API key: requests per second and tokens per minute (token buckets), and a cap on
+      streaming responses in progress. Limits come from the key's row in the tokens table.
+    - per model: a global cap on requests forwarded at once. Excess requests wait in line for
+      at most `queue_timeout` seconds so GPU servers are not oversubscribed.
+
+    Rejections raise RateLimitExceeded, turned into 429 responses with a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        burst_seconds: float = 1.0,
+        model_max_concurrency: int = 0,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        queue_timeout: float = 30.0,
+    ):
+        self.burst_seconds = burst_seconds
+        self.model_max_concurrency = model_max_concurrency
+        self.model_concurrency = {model_key(name): limit for name, limit in (model_concurrency or {}).items()}
+        self.queue_timeout = queue_timeout
+        self._keys: Dict[str, _KeyState] = {}
+        self._models: Dict[str, Optional[_ModelSlots]] = {}
+        self.rejected = 0
+
+    def _state(self, principal: Principal) -> _KeyState:
+        state = self._keys.get(principal.user_id)
+        limits = (principal.rate_limit_rps, principal.max_concurrent_streams, principal.tokens_per_minute)
+        if state is None or state.limits != limits:
+            streams = state.streams if state is not None else 0
+            state = self._keys[principal.user_id] = _KeyState(principal, self.burst_seconds)
+            state.streams = streams  # Streams already running still count against the new limit
+        return state
+
+    def check_rate(self, principal: Principal):
+        """Per-key request rate and token budget. Holds nothing, so it can run before any other work."""
+        state = self._state(principal)
+        if state.tokens is not None:
+            wait = state.tokens.wait_time()
+            if wait:
+                self.rejected += 1
+                raise RateLimitExceeded("Token per minute limit exceeded", wait)
+        if state.requests is not None:
+            wait = state.requests.try_take()
+            if wait:
+                self.rejected += 1
+                raise RateLimitExceeded("Request rate limit exceeded", wait)
+
+    async def acquire(self, ctx: RequestContext, model: Optional[str], stream: bool):
+        """
+        Take a stream slot for the key (streaming requests) and a concurrency slot for the model,
+        waiting in line for the latter. Both are given back, and the tokens the response used
+        charged to the key, when the request context finishes.
+        """
+        principal = ctx.principal
+        state = self._state(principal)
+        max_streams = principal.max_concurrent_streams
+        if stream:
+            if max_streams is not None and state.streams >= max_streams:
+                self.rejected += 1
+                raise RateLimitExceeded(f"Too many concurrent streams (limit {max_streams})", 1)
+            # Counted before waiting for the model, so streams queued behind it count too
+            state.streams += 1
+
+        slots = self._model_slots(model)
+        if slots is not None:
+            try:
+                await self._wait_for_slot(slots, model)
+            except BaseException:  # Rejected or cancelled while in line
+                if stream:
+                    self._end_stream(principal)
+                raise
+            ctx.on_finish(lambda _: slots.semaphore.release())
+
+        if stream:
+            ctx.on_finish(lambda _: self._end_stream(principal))
+        if state.tokens is not None:
+            ctx.on_finish(lambda finished: self._charge_tokens(principal, finished.usage))
+
+    @asynccontextmanager
+    async def model_slot(self, model: Optional[str]):
+        """
+        Hold a concurrency slot of the model for the duration of the block, waiting in line like
+        acquire(). For upstream calls made on behalf of several requests, such as embedding batches.
+        """
+        slots = self._model_slots(model)
+        if slots is None:
+            yield
+            return
+        await self._wait_for_slot(slots, model)
+        try:
+            yield
+        finally:
+            slots.semaphore.release()
+
+    async def _wait_for_slot(self, slots: _ModelSlots, model: str):
+        slots.waiting += 1
+        try:
+            await asyncio.wait_for(slots.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Model {model} is at capacity", self.queue_timeout)
+        finally:
+            slots.waiting -= 1
+
+    def _model_slots(self, model: Optional[str]) -> Optional[_ModelSlots]:
+        if model is None:
+            return None
+        key = model_key(model)
+        if key not in self._models:
+            limit = self.model_concurrency.get(key, self.model_max_concurrency)
+            self._models[key] = _ModelSlots(limit) if limit > 0 else None  # None means unlimited
+        return self._models[key]
+
+    def _end_stream(self, principal: Principal):
+        state = self._keys.get(principal.user_id)
+        if state is not None and state.streams > 0:
+            state.streams -= 1
+
+    def _charge_tokens(self, principal: Principal, usage: Optional[Dict[str, int]]):
+        state = self._keys.get(principal.user_id)
+        if usage and state is not None and state.tokens is not None:
+            state.tokens.charge(usage.get("prompt_eval_count", 0) + usage.get("eval_count", 0))
+
+    def stats(self):
+        return {
+            "rejected": self.rejected,
+            "keys_tracked": len(self._keys),
+            "models": {
+                model: {"limit": slots.limit, "waiting": slots.waiting}
+                for model, slots in self._models.items() if slots is not None
+            },
+        }
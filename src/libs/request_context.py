@@ -0,0 +1,43 @@
+# libs/request_context.py
+import logging
+from typing import Callable, Dict, List, Optional
+
+from libs.token_manager import Principal
+from libs.timing import Timings
+
+logger = logging.getLogger(__name__)
+
+class RequestContext:
+    """
+    Per-request state shared by a route handler and forward_request: who is asking, for which
+    route and model, and the callbacks to run once the response is over (whether it completed,
+    failed or the client went away). finish() runs them exactly once.
+    """
+
+    def __init__(self, principal: Principal, route: str, model: Optional[str] = None, timings: Optional[Timings] = None):
+        self.principal = principal
+        self.route = route
+        self.model = model
+        self.timings = timings  # Phase durations for Server-Timing and the access log, None outside HTTP requests
+        self.usage: Optional[Dict[str, int]] = None  # Ollama's token counters, when the response carried them
+        # time.perf_counter() marks set by forward_request, for metrics
+        self.upstream_start: Optional[float] = None
+        self.first_byte: Optional[float] = None  # First chunk of a streamed response
+        self.upstream_end: Optional[float] = None
+        self.error: Optional[str] = None  # Upstream failure reported inside an already started stream
+        self._callbacks: List[Callable[["RequestContext"], None]] = []
+        self.finished = False
+
+    def on_finish(self, callback: Callable[["RequestContext"], None]):
+        self._callbacks.append(callback)
+
+    def finish(self, usage: Optional[Dict[str, int]] = None):
+        if self.finished:
+            return
+        self.finished = True
+        self.usage = usage
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error("Request finish callback failed: %s", e)
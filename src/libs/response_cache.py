@@ -0,0 +1,124 @@
+# libs/response_cache.py
+import hashlib
+from typing import Optional
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from libs.backend_pool import model_key
+from libs.cache import ByteLRU
+from libs.payload import Payload
+
+# Fields that don't change what the model answers
+NON_KEY_FIELDS = ("stream", "keep_alive")
+
+def is_deterministic(payload: Payload) -> bool:
+    """Greedy decoding (temperature 0) or a fixed seed make Ollama answer the same way every time."""
+    options = payload.data.get("options")
+    if not isinstance(options, dict):
+        return False
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+def stream_completed(body: bytes) -> bool:
+    """True if the NDJSON stream ends with Ollama's final chunk (not an error record)."""
+    lines = body.rstrip().rsplit(b"\n", 1)
+    try:
+        last = orjson.loads(lines[-1])
+    except orjson.JSONDecodeError:
+        return False
+    return isinstance(last, dict) and last.get("done") is True and "error" not in last
+
+class ResponseCache:
+    """
+    Cache of /generate and /chat responses for deterministic requests, keyed by a canonical
+    hash of the route and the request minus the fields in NON_KEY_FIELDS (object keys sorted,
+    the model name normalized). Non-streaming
+    bodies are stored as they are. Streams are recorded as their NDJSON chunk sequence while
+    being relayed, kept only if they ran to the final `"done": true` chunk, and replayed
+    line by line on a hit. Entries live in a memory LRU bounded in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.memory = ByteLRU(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(route: str, payload: Payload) -> str:
+        fields = {name: value for name, value in payload.data.items() if name not in NON_KEY_FIELDS}
+        if isinstance(fields.get("model"), str):
+            fields["model"] = model_key(fields["model"])  # 'llama3.2' and 'llama3.2:latest' are the same model
+        canonical = orjson.dumps([route, payload.stream, fields], option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(canonical).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        body = self.memory.get(key)
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def set(self, key: str, model: str, body: bytes):
+        self.memory.set(key, body, tag=model_key(model))  # 'llama3.2' and 'llama3.2:latest' are invalidated together
+
+    def record_stream(self, response: StreamingResponse, key: str, model: str):
+        """Store the stream relayed by `response` once it completes."""
+        upstream = response.body_iterator
+        max_bytes = self.memory.max_bytes
+
+        async def recording():
+            chunks = []
+            size = 0
+            try:
+                async for chunk in upstream:
+                    if chunks is not None:
+                        size += len(chunk)
+                        if size > max_bytes:
+                            chunks = None  # Too large to cache, just relay the rest
+                        else:
+                            chunks.append(chunk)
+                    yield chunk
+            finally:
+                await upstream.aclose()
+            if chunks is not None:
+                body = b"".join(chunks)
+                if stream_completed(body):
+                    self.set(key, model, body)
+
+        response.body_iterator = recording()
+        return response
+
+    @staticmethod
+    def replay_stream(body: bytes, max_bytes: int = 0) -> StreamingResponse:
+        """Send a cached stream line by line, or with `max_bytes`, in chunks of whole lines of about that size."""
+        async def replay():
+            chunk = b""
+            for line in body.splitlines(keepends=True):
+                if not max_bytes:
+                    yield line
+                    continue
+                chunk += line
+                if len(chunk) >= max_bytes:
+                    yield chunk
+                    chunk = b""
+            if chunk:
+                yield chunk
+        return StreamingResponse(replay(), media_type="application/json")
+
+    def invalidate(self, model: Optional[str] = None) -> int:
+        """Drop cached responses of one model, or of every model when model is None."""
+        if model is None:
+            dropped = len(self.memory)
+            self.memory.clear()
+            return dropped
+        return self.memory.discard_tag(model_key(model))
+
+    def stats(self):
+        return {
+            "entries": len(self.memory),
+            "size_bytes": self.memory.size_bytes,
+            "max_bytes": self.memory.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,195 @@
+# libs/scheduler.py
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from libs.rate_limiter import RateLimitExceeded
+from libs.request_context import RequestContext
+
+class _Waiter:
+    __slots__ = ("future", "user", "priority", "enqueued")
+
+    def __init__(self, future: asyncio.Future, user: str, priority: int):
+        self.future = future
+        self.user = user
+        self.priority = priority
+        self.enqueued = time.monotonic()
+
+class FairScheduler:
+    """
+    Bounds the requests forwarded upstream at once and decides who goes next when that
+    bound is reached.
+
+    Waiting requests are queued per user. Queues are grouped in priority tiers (the API key's
+    priority, so batch keys can be given a negative one) and within a tier users are served
+    round-robin: one request per user per turn, however many each has queued. Tiers share the
+    freed slots by weighted round-robin, so a busy tier can't starve the ones below it: each
+    tier with requests waiting gets slots in proportion to its weight, `tier_weights[priority]`
+    or else `tier_weight_base ** priority` (higher tiers get more). Queues are bounded in total
+    and per user, and requests beyond the bounds, or waiting longer than `queue_timeout`, are
+    rejected at once with RateLimitExceeded (429).
+    """
+
+    def __init__(
+        self,
+        max_inflight: int,
+        max_queue: int = 1000,
+        max_queue_per_user: int = 100,
+        queue_timeout: float = 60.0,
+        tier_weight_base: float = 1.5,
+        tier_weights: Optional[Dict[int, float]] = None,
+    ):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.tier_weight_base = tier_weight_base
+        self.tier_weights = dict(tier_weights or {})
+        self.inflight = 0
+        self.queued = 0
+        # priority -> user -> waiters; users rotate to the end of their tier once served
+        self._tiers: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        # priority -> credit of the weighted round-robin, kept while the tier has requests waiting
+        self._credits: Dict[int, float] = {}
+        self.granted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._waits: Deque[float] = deque(maxlen=1024)  # Recent queue waits, for the percentiles in stats()
+        self._max_wait = 0.0
+
+    async def acquire(self, ctx: RequestContext):
+        """Wait for an upstream slot, given back when the request context finishes."""
+        if self.inflight < self.max_inflight and self.queued == 0:
+            self.inflight += 1
+            self._record_wait(0.0)
+        else:
+            await self._wait(ctx)
+        ctx.on_finish(lambda _: self.release())
+
+    async def _wait(self, ctx: RequestContext):
+        user = ctx.principal.user
+        priority = ctx.principal.priority or 0
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded("Gateway queue is full", 1)
+        users = self._tiers.setdefault(priority, OrderedDict())
+        queue = users.get(user)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Too many queued requests for user {user}", 1)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), user, priority)
+        if queue is None:
+            queue = users[user] = deque()
+        queue.append(waiter)
+        self.queued += 1
+        self._dispatch()  # Slots may have been freed by requests that gave up while queued
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # Granted just as the caller gave up, hand the slot on
+            else:
+                self._remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise RateLimitExceeded("Timed out waiting in the gateway queue", self.queue_timeout)
+            raise
+
+    def release(self):
+        self.inflight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.inflight < self.max_inflight and self.queued:
+            waiter = self._next_waiter()
+            if waiter.future.done():
+                continue  # Gave up while queued, not removed yet
+            self.inflight += 1
+            self._record_wait(time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def tier_weight(self, priority: int) -> float:
+        weight = self.tier_weights.get(priority)
+        return weight if weight is not None else self.tier_weight_base ** priority
+
+    def _next_tier(self) -> int:
+        # Smooth weighted round-robin: every waiting tier earns its weight, the richest is served
+        # and pays back the total, so over any stretch each tier gets its share of the slots
+        waiting = [priority for priority, users in self._tiers.items() if users]
+        if len(waiting) == 1:
+            return waiting[0]
+        total = 0.0
+        for priority in waiting:
+            weight = self.tier_weight(priority)
+            self._credits[priority] = self._credits.get(priority, 0.0) + weight
+            total += weight
+        priority = max(waiting, key=lambda p: (self._credits[p], p))
+        self._credits[priority] -= total
+        return priority
+
+    def _next_waiter(self) -> _Waiter:
+        priority = self._next_tier()
+        users = self._tiers[priority]
+        user, queue = next(iter(users.items()))
+        waiter = queue.popleft()
+        if queue:
+            users.move_to_end(user)
+        else:
+            self._remove_user(users, user, priority)
+        self.queued -= 1
+        return waiter
+
+    def _remove_user(self, users: "OrderedDict[str, Deque[_Waiter]]", user: str, priority: int):
+        del users[user]
+        if not users:
+            self._credits.pop(priority, None)  # An idle tier doesn't bank credit for later
+
+    def _remove(self, waiter: _Waiter):
+        users = self._tiers.get(waiter.priority)
+        queue = users.get(waiter.user) if users is not None else None
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        self.queued -= 1
+        if not queue:
+            self._remove_user(users, waiter.user, waiter.priority)
+
+    def _record_wait(self, wait: float):
+        self.granted += 1
+        self._waits.append(wait)
+        if wait > self._max_wait:
+            self._max_wait = wait
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def percentile(q: float) -> Optional[float]:
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else None
+
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "queue_wait_seconds": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": self._max_wait,
+            },
+            "tier_weights": {
+                priority: self.tier_weight(priority)
+                for priority, users in sorted(self._tiers.items(), reverse=True) if users
+            },
+            "tiers": {
+                priority: {user: len(queue) for user, queue in users.items()}
+                for priority, users in sorted(self._tiers.items(), reverse=True) if users
+            },
+        }
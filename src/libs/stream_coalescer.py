@@ -0,0 +1,112 @@
+# libs/stream_coalescer.py
+import asyncio
+from typing import AsyncIterator, NamedTuple, Optional
+
+import anyio
+
+# Client headers overriding the route's flush policy
+INTERVAL_HEADER = "x-stream-flush-ms"
+MAX_BYTES_HEADER = "x-stream-flush-bytes"
+
+class FlushPolicy(NamedTuple):
+    interval: float  # Seconds a complete line may be held back
+    max_bytes: int  # Held lines are sent as soon as they add up to this many bytes
+
+def flush_policy(
+    interval_ms: float,
+    max_bytes: int,
+    header_ms: Optional[str] = None,
+    header_bytes: Optional[str] = None,
+    max_client_ms: float = 1000.0,
+) -> Optional[FlushPolicy]:
+    """
+    The flush policy of a stream: the route's interval and byte limit, overridden by the client's
+    X-Stream-Flush-Ms (capped at `max_client_ms`) and X-Stream-Flush-Bytes headers. None, for an
+    interval of 0, relays chunks as they come. Raises ValueError with a client-facing message for
+    header values that aren't non-negative numbers.
+    """
+    if header_ms is not None:
+        try:
+            interval_ms = min(float(header_ms), max_client_ms)
+        except ValueError:
+            interval_ms = -1
+        if not interval_ms >= 0:  # Also NaN
+            raise ValueError("X-Stream-Flush-Ms must be a number of milliseconds, 0 to disable coalescing")
+    if header_bytes is not None:
+        try:
+            max_bytes = int(header_bytes)
+        except ValueError:
+            max_bytes = -1
+        if max_bytes < 0:
+            raise ValueError("X-Stream-Flush-Bytes must be a number of bytes")
+    if interval_ms <= 0:
+        return None
+    return FlushPolicy(interval_ms / 1000, max_bytes)
+
+async def _next(chunks: AsyncIterator[bytes]) -> Optional[bytes]:
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def coalesce_lines(chunks: AsyncIterator[bytes], policy: FlushPolicy) -> AsyncIterator[bytes]:
+    """
+    Re-chunk an NDJSON byte stream on line boundaries: complete lines are held until they add up
+    to policy.max_bytes, or until the first of them has waited policy.interval, and then sent as
+    one chunk. Ollama writes one small line per token, so with many streams this trades a bounded
+    delay for far fewer writes. A line split across chunks goes out once it is complete; whatever
+    is held when the stream ends, or fails, is sent before the end or the error.
+    """
+    loop = asyncio.get_running_loop()
+    held = bytearray()  # Complete lines
+    partial = bytearray()  # Start of the next line
+    deadline = 0.0
+    pending: Optional[asyncio.Future] = None  # Read still going when the deadline passed
+    try:
+        while True:
+            if not held and pending is None:
+                chunk = await _next(chunks)  # Nothing to flush, no deadline to watch
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(_next(chunks))
+                # Waited on, never awaited: a cancelled task passes every cancellation on to the
+                # task it awaits, which would cut short the upstream's own cleanup in the read
+                timeout = deadline - loop.time() if held else None
+                if timeout is None or timeout > 0:
+                    await asyncio.wait((pending,), timeout=timeout)
+                if not pending.done():
+                    yield bytes(held)
+                    held.clear()
+                    continue
+                chunk, pending = pending.result(), None
+            if chunk is None:
+                break
+
+            end = chunk.rfind(b"\n") + 1
+            if not end:
+                partial += chunk
+                continue
+            if not held:
+                deadline = loop.time() + policy.interval
+            held += partial
+            held += memoryview(chunk)[:end]
+            partial[:] = memoryview(chunk)[end:]
+            if policy.max_bytes and len(held) >= policy.max_bytes:
+                yield bytes(held)
+                held.clear()
+    except Exception:
+        # Upstream failed: what it sent before still reaches the client, ahead of the error
+        if held or partial:
+            yield bytes(held + partial)
+        raise
+    finally:
+        if pending is not None:
+            # Shielded: the stream is typically closed by a cancellation, and the read must be
+            # over before the upstream response is closed under it
+            pending.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.wait((pending,))
+            if not pending.cancelled():
+                pending.exception()  # Retrieved, or asyncio logs it as never retrieved
+    if held or partial:
+        yield bytes(held + partial)
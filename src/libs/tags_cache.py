@@ -0,0 +1,84 @@
+# libs/tags_cache.py
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from libs.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+class TagsCache:
+    """
+    Cache for the /api/tags body. Fresh for `ttl` seconds, then served stale for up to
+    `stale_ttl` more seconds while a background refresh runs. Concurrent misses share a
+    single upstream call, and every body gets an ETag so clients can revalidate with 304s.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[bytes]], ttl: float, stale_ttl: float):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._flight = SingleFlight()
+        self._tasks: Set[asyncio.Task] = set()  # Background refreshes, referenced until done
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self) -> Tuple[bytes, str]:
+        """Return (body, etag), fetching from Ollama only when nothing usable is cached."""
+        age = time.monotonic() - self.fetched_at
+        if self.body is not None and age < self.ttl:
+            self.hits += 1
+            return self.body, self.etag
+        if self.body is not None and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            if not self._flight.in_flight("tags"):
+                task = asyncio.ensure_future(self._background_refresh())
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return self.body, self.etag
+
+        self.misses += 1
+        await self._flight.do("tags", self._refresh)
+        return self.body, self.etag
+
+    async def _refresh(self):
+        body = await self.fetch()
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.fetched_at = time.monotonic()
+
+    async def _background_refresh(self):
+        try:
+            await self._flight.do("tags", self._refresh)
+        except Exception as e:
+            # Keep serving the stale body, the next request past the stale window retries in the foreground
+            logger.error("Background refresh of /api/tags failed: %s", e)
+
+    def invalidate(self):
+        self.body = None
+        self.etag = None
+        self.fetched_at = 0.0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "age": time.monotonic() - self.fetched_at if self.body is not None else None,
+            "etag": self.etag,
+        }
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an If-None-Match header lists the ETag (weak comparison, as for GET revalidation)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (value.strip() for value in if_none_match.split(","))
+    return any((value[2:] if value.startswith("W/") else value) == etag for value in candidates)
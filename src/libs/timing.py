@@ -0,0 +1,93 @@
+# libs/timing.py
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+class Timings:
+    """
+    Durations of the phases of one request, in the order they happened:
+
+    - auth: resolving the API key
+    - body, validate: receiving the request body, and checking it against the route's model
+    - queue: waiting for the fair scheduler and the admission slots
+    - backend: picking an Ollama server (and, with MODEL_WARMUP_HOLD, waiting for its model to load)
+    - connect: opening a new connection to it, absent when a pooled one was reused
+    - upstream: Ollama's response headers for streams, its whole response otherwise
+    - ttft: from the start of the request to the first chunk of a stream
+    - encode: re-encoding and compressing /embed responses
+    - stream: from the first chunk to the end of a stream (access log only, the headers are long gone)
+
+    A handful of perf_counter() calls and dict updates per request, cheap enough to leave on.
+    """
+
+    __slots__ = ("start", "phases", "_connect_start")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}  # Name -> seconds
+        self._connect_start: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    async def trace(self, event: str, info: Dict[str, Any]):
+        """httpx `trace` extension, times the TCP and TLS setup of new upstream connections."""
+        if event.startswith("connection."):
+            if event.endswith(".started"):
+                self._connect_start = time.perf_counter()
+            elif self._connect_start is not None:
+                self.add("connect", time.perf_counter() - self._connect_start)
+                self._connect_start = None
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (https://www.w3.org/TR/server-timing/), durations in milliseconds."""
+        now = time.perf_counter()
+        metrics = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        metrics.append(f"total;dur={(now - self.start) * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Phase durations in milliseconds, for the access log."""
+        return {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+
+@contextmanager
+def timed(timings: Optional[Timings], name: str) -> Iterator[None]:
+    """Add the time spent in the block to a phase, does nothing without Timings."""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+class TimingMiddleware:
+    """
+    ASGI middleware giving every request its Timings, as request.state.timings, and with
+    `header` on sending them to the client as a Server-Timing header. The access log adds
+    them to its line once the response is over.
+    """
+
+    def __init__(self, app, header: bool = True):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = scope.setdefault("state", {})["timings"] = Timings()
+        if not self.header:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((b"server-timing", timings.server_timing().encode()))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,76 +1,374 @@
 # # token_manager.py
+import logging
 import sqlite3
 import secrets
-from datetime import datetime, timezone
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import uuid
 
+from libs.cache import TTLCache
+from libs.token_store import TokenStore, hash_token
 
-from models import Settings
-settings = Settings()
+from models import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+class Principal(NamedTuple):
+    """Identity behind an API key, as resolved by TokenManager.resolve_principal."""
+    user_id: str
+    user: str
+    api_name: str
+    expires_at: Optional[str]
+    # Per-key limits, None means unlimited
+    rate_limit_rps: Optional[float] = None
+    max_concurrent_streams: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    priority: Optional[int] = None  # Scheduling tier, None means 0
+    cache_responses: Optional[int] = None  # 0 opts out of the response cache
+
+# Marker cached for tokens that do not exist, so repeated bad keys don't reach the database
+_INVALID = object()
+
+_PRINCIPAL_COLUMNS = 'user_id, user, api_name, expires_at, rate_limit_rps, max_concurrent_streams, tokens_per_minute, priority, cache_responses'
+# Columns of list_users, iter_users and the CLIs' listings and exports
+USER_COLUMNS = ("user_id", "user", "api_name", "created_at", "expires_at")
+
+def _to_datetime(expires_at: str) -> datetime:
+    # Naive values are taken as UTC; a trailing Z is spelled out, fromisoformat only takes it from Python 3.11
+    expiry = datetime.fromisoformat(expires_at[:-1] + "+00:00" if expires_at.endswith("Z") else expires_at)
+    return expiry if expiry.tzinfo is not None else expiry.replace(tzinfo=timezone.utc)
+
+def normalize_expiry(expires_at: Optional[str]) -> Optional[str]:
+    """
+    Check an expiry given by an admin and return it as the ISO 8601 string to store (UTC offset
+    included), None for no expiry. Raises ValueError for values that aren't ISO 8601 dates.
+    """
+    if not expires_at:
+        return None
+    try:
+        return _to_datetime(expires_at).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid expiry {expires_at!r}, expected an ISO 8601 date such as 2026-12-31 or 2026-12-31T18:00:00+00:00")
+
+def _parse_expiry(expires_at: Optional[str]) -> Optional[float]:
+    """
+    Convert a stored ISO 8601 expiry into a UTC timestamp. Databases written before expiries were
+    checked may hold free-form values: those count as already expired, so the key is refused
+    (401) rather than failing every request it makes.
+    """
+    if not expires_at:
+        return None
+    try:
+        return _to_datetime(expires_at).timestamp()
+    except ValueError:
+        logger.warning("Unreadable expires_at %r, treating the key as expired", expires_at)
+        return 0.0
 
 class TokenManager:
-    def __init__(self, db_file=f"{settings.TOKEN_DB_PATH}"):
-        self.db_file = db_file
-        self.create_tokens_table()
+    def __init__(self, db_file: Optional[str] = None, settings: Optional[Settings] = None):
+        settings = settings or get_settings()
+        self.settings = settings
+        self.db_file = db_file = db_file or settings.TOKEN_DB_PATH
+        self.store = TokenStore(
+            db_file,
+            max_workers=settings.TOKEN_DB_POOL_SIZE,
+            busy_timeout=settings.TOKEN_DB_BUSY_TIMEOUT,
+        )
+
+        # Auth cache: token hash -> (Principal, expiry timestamp), or _INVALID for negative entries
+        self._cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+        # Connection kept open only to watch the tokens table's generation, which changes whenever
+        # a key is added, changed or removed, including by another process (e.g. the CLI)
+        self._watch_conn = None
+        self._watch_lock = threading.Lock()
+        self._tokens_generation = None
+        self._next_db_check = 0.0
 
     def create_tokens_table(self):
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tokens (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    user TEXT NOT NULL,
-                    api_name TEXT NOT NULL,
-                    token TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    expires_at TEXT,
-                    UNIQUE(user, api_name),
-                    UNIQUE(user_id)
-                )
-            ''')
-            conn.commit()
+        self.store.migrate()
 
     def generate_token(self, user: str, api_name: str, expires_at: str = None):
+        expires_at = normalize_expiry(expires_at)  # ValueError for values that aren't dates
         token = secrets.token_hex(32)  # Generate a secure, unique token
         user_id = str(uuid.uuid4())  # Generate a unique user_id using UUID
         created_at = datetime.now(timezone.utc).isoformat()  # Get current UTC time in ISO 8601 format
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute(
-                    'INSERT INTO tokens (user_id, user, api_name, token, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)',
-                    (user_id, user, api_name, token, created_at, expires_at)
+        try:
+            with self.store.transaction() as conn:
+                # Only the hash is persisted, the token itself is shown once to the caller
+                conn.execute(
+                    "INSERT INTO tokens (user_id, user, api_name, token, token_hash, created_at, expires_at) VALUES (?, ?, ?, '', ?, ?, ?)",
+                    (user_id, user, api_name, hash_token(token), created_at, expires_at)
                 )
-                conn.commit()
-                return token
-            except sqlite3.IntegrityError:
-                raise ValueError(f"User {user} with API {api_name} already exists.")
+            return token
+        except sqlite3.IntegrityError:
+            raise ValueError(f"User {user} with API {api_name} already exists.")
+
+    def resolve_principal(self, provided_token: str) -> Optional[Principal]:
+        """Return the Principal owning the token, or None if the token is unknown or expired."""
+        if self._db_check_due():
+            self._check_db_version()
+        token_hash = hash_token(provided_token)
+        cached = self._cache.get(token_hash)
+        if cached is None:
+            cached = self._load_principal(token_hash)
+        return self._unexpired(cached)
+
+    async def aresolve_principal(self, provided_token: str) -> Optional[Principal]:
+        """Async resolve_principal: cache hits stay on the event loop, database work goes to the store's thread pool."""
+        if self._db_check_due():
+            await self.store.run(self._check_db_version)
+        token_hash = hash_token(provided_token)
+        cached = self._cache.get(token_hash)
+        if cached is None:
+            cached = await self.store.run(self._load_principal, token_hash)
+        return self._unexpired(cached)
+
+    def _load_principal(self, token_hash: str):
+        conn = self.store.connection()
+        row = conn.execute(f'SELECT {_PRINCIPAL_COLUMNS} FROM tokens WHERE token_hash = ?', (token_hash,)).fetchone()
+        grace_until = None
+        if row is None:
+            # A token replaced by rotate_tokens keeps working until its grace period ends
+            row = conn.execute(
+                f'SELECT {_PRINCIPAL_COLUMNS}, previous_expires_at FROM tokens WHERE previous_token_hash = ?',
+                (token_hash,)
+            ).fetchone()
+            if row is not None:
+                row, grace_until = row[:-1], _parse_expiry(row[-1])
+
+        if row is None:
+            self._cache.set(token_hash, _INVALID, ttl=self.settings.AUTH_CACHE_NEGATIVE_TTL)
+            return _INVALID
+        principal = Principal(*row)
+        expiry = _parse_expiry(principal.expires_at)
+        if grace_until is not None:
+            expiry = grace_until if expiry is None else min(expiry, grace_until)
+        entry = (principal, expiry)
+        self._cache.set(token_hash, entry)
+        return entry
+
+    def get_principal(self, user_id: str) -> Optional[Principal]:
+        """The Principal of a key by user_id (for work done on its behalf later, like batch jobs), None if revoked or expired."""
+        row = self.store.connection().execute(f'SELECT {_PRINCIPAL_COLUMNS} FROM tokens WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        principal = Principal(*row)
+        return self._unexpired((principal, _parse_expiry(principal.expires_at)))
+
+    @staticmethod
+    def _unexpired(entry) -> Optional[Principal]:
+        if entry is _INVALID:
+            return None
+        principal, expiry = entry
+        if expiry is not None and expiry <= time.time():
+            return None
+        return principal
 
     def validate_token(self, provided_token: str) -> bool:
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1 FROM tokens WHERE token = ?', (provided_token,))
-            return cursor.fetchone() is not None
+        return self.resolve_principal(provided_token) is not None
 
     def get_user_by_token(self, provided_token: str) -> str:
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT user FROM tokens WHERE token = ?', (provided_token,))
-            row = cursor.fetchone()
-            return row[0] if row else None
+        principal = self.resolve_principal(provided_token)
+        return principal.user if principal else None
+
+    def invalidate_cache(self):
+        self._cache.clear()
+
+    def _db_check_due(self) -> bool:
+        # Poll at most once per AUTH_CACHE_DB_CHECK_INTERVAL so the hot path stays in memory
+        return time.monotonic() >= self._next_db_check
+
+    def _check_db_version(self):
+        with self._watch_lock:
+            now = time.monotonic()
+            if now < self._next_db_check:
+                return
+            self._next_db_check = now + self.settings.AUTH_CACHE_DB_CHECK_INTERVAL
+            if self._watch_conn is None:
+                self._watch_conn = self.store.connect()
+            generation = self.store.tokens_generation(self._watch_conn)
+            if self._tokens_generation is not None and generation != self._tokens_generation:
+                self._cache.clear()
+            self._tokens_generation = generation
+
+    def get_usage(self, user: Optional[str] = None, since: Optional[str] = None, model: Optional[str] = None):
+        """Usage rows (user, api_name, model, day, requests, prompt_tokens, completion_tokens), newest day first."""
+        query = 'SELECT user, api_name, model, day, requests, prompt_tokens, completion_tokens FROM usage WHERE 1 = 1'
+        params = []
+        if user is not None:
+            query += ' AND user = ?'
+            params.append(user)
+        if since is not None:
+            query += ' AND day >= ?'
+            params.append(since)
+        if model is not None:
+            query += ' AND model = ?'
+            params.append(model)
+        query += ' ORDER BY day DESC, user, api_name, model'
+        return self.store.connection().execute(query, params).fetchall()
 
     def list_users(self):
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT user_id, user, api_name, created_at, expires_at FROM tokens')
-            return cursor.fetchall()
+        return list(self.iter_users())
+
+    @staticmethod
+    def _user_filters(user: Optional[str], search: Optional[str]) -> Tuple[str, list]:
+        where, params = '', []
+        if user is not None:
+            where += ' AND user = ?'
+            params.append(user)
+        if search:
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where += " AND (user LIKE ? ESCAPE '\\' OR api_name LIKE ? ESCAPE '\\')"
+            params += [pattern, pattern]
+        return where, params
+
+    def iter_users(self, user: Optional[str] = None, search: Optional[str] = None) -> Iterator[tuple]:
+        """Keys (USER_COLUMNS) in creation order, read from the cursor as they are consumed rather than all at once."""
+        where, params = self._user_filters(user, search)
+        yield from self.store.connection().execute(
+            f'SELECT {", ".join(USER_COLUMNS)} FROM tokens WHERE 1 = 1{where} ORDER BY id', params
+        )
+
+    def list_users_page(
+        self,
+        limit: int = 50,
+        after: Optional[int] = None,
+        user: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[List[tuple], Optional[int]]:
+        """
+        One page of keys (USER_COLUMNS) in creation order, optionally only a user's or those whose
+        user or key name contains `search`. Returns the rows and the cursor of the next page
+        (None on the last one). Pages are found through the primary key, so the cost of a page
+        doesn't depend on how deep it is.
+        """
+        where, params = self._user_filters(user, search)
+        if after is not None:
+            where += ' AND id > ?'
+            params.append(after)
+        rows = self.store.connection().execute(
+            f'SELECT id, {", ".join(USER_COLUMNS)} FROM tokens WHERE 1 = 1{where} ORDER BY id LIMIT ?',
+            params + [limit + 1]  # One more tells whether there is a next page
+        ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [row[1:] for row in rows[:limit]], next_cursor
+
+    def generate_tokens(self, keys: Iterable[Tuple[str, str, Optional[str]]], on_token: Callable[[str, str, str], None]) -> int:
+        """
+        Create keys from (user, api_name, expires_at) rows in a single transaction: all of them
+        or, when one already exists, none. on_token(user, api_name, token) is called for each
+        new key as it is inserted, the only chance to see its token. Returns the number created.
+        """
+        created_at = datetime.now(timezone.utc).isoformat()
+        count = 0
+        with self.store.transaction() as conn:
+            for user, api_name, expires_at in keys:
+                token = secrets.token_hex(32)
+                try:
+                    conn.execute(
+                        "INSERT INTO tokens (user_id, user, api_name, token, token_hash, created_at, expires_at) VALUES (?, ?, ?, '', ?, ?, ?)",
+                        (str(uuid.uuid4()), user, api_name, hash_token(token), created_at, normalize_expiry(expires_at))
+                    )
+                except sqlite3.IntegrityError:
+                    raise ValueError(f"User {user} with API {api_name} already exists, no keys were created.")
+                on_token(user, api_name, token)
+                count += 1
+        return count
+
+    def revoke_tokens(self, keys: Iterable[Tuple[str, str]]) -> Tuple[int, List[Tuple[str, str]]]:
+        """Delete (user, api_name) keys in a single transaction. Returns the number deleted and the pairs that didn't exist."""
+        deleted, missing = 0, []
+        with self.store.transaction() as conn:
+            for user, api_name in keys:
+                cursor = conn.execute('DELETE FROM tokens WHERE user = ? AND api_name = ?', (user, api_name))
+                if cursor.rowcount:
+                    deleted += 1
+                else:
+                    missing.append((user, api_name))
+        self.invalidate_cache()
+        return deleted, missing
+
+    def rotate_tokens(
+        self,
+        keys: Iterable[Tuple[str, str]],
+        grace_seconds: float,
+        on_token: Callable[[str, str, str], None],
+    ) -> Tuple[int, List[Tuple[str, str]]]:
+        """
+        Give (user, api_name) keys new tokens in a single transaction. The old token keeps working
+        for `grace_seconds` (0 revokes it at once), so clients can switch over without downtime;
+        rotating again within the grace period ends the previous one's early. on_token is called
+        as in generate_tokens. Returns the number rotated and the pairs that didn't exist.
+        """
+        grace_until = (datetime.now(timezone.utc) + timedelta(seconds=grace_seconds)).isoformat() if grace_seconds > 0 else None
+        rotated, missing = 0, []
+        with self.store.transaction() as conn:
+            for user, api_name in keys:
+                token = secrets.token_hex(32)
+                cursor = conn.execute(
+                    'UPDATE tokens SET previous_token_hash = CASE WHEN ? IS NULL THEN NULL ELSE token_hash END, '
+                    'previous_expires_at = ?, token_hash = ? WHERE user = ? AND api_name = ?',
+                    (grace_until, grace_until, hash_token(token), user, api_name)
+                )
+                if cursor.rowcount:
+                    on_token(user, api_name, token)
+                    rotated += 1
+                else:
+                    missing.append((user, api_name))
+        self.invalidate_cache()
+        return rotated, missing
+
 
+    def set_limits(
+        self,
+        user: str,
+        api_name: str,
+        rate_limit_rps: Optional[float] = None,
+        max_concurrent_streams: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        """Set the key's limits, None removes a limit."""
+        with self.store.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE tokens SET rate_limit_rps = ?, max_concurrent_streams = ?, tokens_per_minute = ? '
+                'WHERE user = ? AND api_name = ?',
+                (rate_limit_rps, max_concurrent_streams, tokens_per_minute, user, api_name)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"No such pair: User {user} with API {api_name}")
+        self.invalidate_cache()
+
+    def set_priority(self, user: str, api_name: str, priority: int):
+        """Set the key's scheduling tier (higher first, negative for background work)."""
+        with self.store.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE tokens SET priority = ? WHERE user = ? AND api_name = ?',
+                (priority, user, api_name)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"No such pair: User {user} with API {api_name}")
+        self.invalidate_cache()
+
+    def set_cache_responses(self, user: str, api_name: str, enabled: bool):
+        """Allow or opt the key out of the deterministic response cache."""
+        with self.store.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE tokens SET cache_responses = ? WHERE user = ? AND api_name = ?',
+                (1 if enabled else 0, user, api_name)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"No such pair: User {user} with API {api_name}")
+        self.invalidate_cache()
 
     def revoke_token(self, user: str, api_name: str):
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM tokens WHERE user = ? AND api_name = ?', (user, api_name))
-            conn.commit()
+        with self.store.transaction() as conn:
+            cursor = conn.execute('DELETE FROM tokens WHERE user = ? AND api_name = ?', (user, api_name))
             if cursor.rowcount == 0:
                 raise ValueError(f"No such pair: User {user} with API {api_name}")
+        # The cache is keyed by token hash, so drop everything rather than leave a revoked key valid
+        self.invalidate_cache()
+
+    def close(self):
+        self.store.close()
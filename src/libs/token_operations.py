@@ -1,39 +1,174 @@
 # libs/token_operations.py
 import csv  # Import csv module to handle CSV file writing
-from libs.token_manager import TokenManager
+import os
+from typing import Iterator, List, Optional, Tuple
+import orjson
+from libs.token_manager import TokenManager, USER_COLUMNS, normalize_expiry
 
-# Initialize the token manager
-token_manager = TokenManager()
+# Headers of the listings and CSV exports, matching USER_COLUMNS
+USER_HEADERS = ["User ID", "User", "API KEY Name", "Created At", "Expires At"]
+
+_token_manager: Optional[TokenManager] = None
+
+def get_token_manager() -> TokenManager:
+    """The CLIs' TokenManager, opened on first use so that `--help` and argument errors don't touch the database."""
+    global _token_manager
+    if _token_manager is None:
+        _token_manager = TokenManager()
+    return _token_manager
 
 def generate_token(user, api_name):
     try:
-        token = token_manager.generate_token(user, api_name)
+        token = get_token_manager().generate_token(user, api_name)
         return f"Generated token for {user} with API {api_name}: {token}"
     except ValueError as e:
         return str(e)
 
 def list_users():
-    users = token_manager.list_users()
+    users = get_token_manager().list_users()
     if users:
         return users  # Return the list of tuples directly
     else:
         return []
 
+def list_users_page(limit=50, after=None, user=None, search=None):
+    """One page of users and the cursor of the next page (None on the last one)."""
+    return get_token_manager().list_users_page(limit, after, user, search)
+
 def delete_token(user, api_name):
     try:
-        token_manager.revoke_token(user, api_name)
+        get_token_manager().revoke_token(user, api_name)
         return f"Deleted token for {user} with API {api_name}."
     except ValueError as e:
         return str(e)
 
-def export_users(filename):
-    users = list_users()
-    if users:
-        headers = ["User ID", "User", "API KEY Name", "Created At", "Expires At"]
+def set_limits(user, api_name, rate_limit_rps=None, max_concurrent_streams=None, tokens_per_minute=None):
+    try:
+        get_token_manager().set_limits(user, api_name, rate_limit_rps, max_concurrent_streams, tokens_per_minute)
+        return f"Limits set for {user} with API {api_name}."
+    except ValueError as e:
+        return str(e)
+
+def set_priority(user, api_name, priority):
+    try:
+        get_token_manager().set_priority(user, api_name, priority)
+        return f"Priority {priority} set for {user} with API {api_name}."
+    except ValueError as e:
+        return str(e)
+
+def set_cache_responses(user, api_name, enabled):
+    try:
+        get_token_manager().set_cache_responses(user, api_name, enabled)
+        state = "enabled" if enabled else "disabled"
+        return f"Response cache {state} for {user} with API {api_name}."
+    except ValueError as e:
+        return str(e)
+
+def get_usage(user=None):
+    return get_token_manager().get_usage(user)
+
+def export_users(filename, user=None, search=None):
+    """
+    Write users to a CSV file, or JSONL when the filename ends in .jsonl, row by row from the
+    database cursor so the export takes the same memory whatever the number of keys.
+    """
+    rows = get_token_manager().iter_users(user, search)
+    count = 0
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        with open(filename, 'wb') as f:
+            for row in rows:
+                f.write(orjson.dumps(dict(zip(USER_COLUMNS, row))) + b"\n")
+                count += 1
+    else:
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(headers)  # Write the headers
-            writer.writerows(users)   # Write the user data
-        return f"Users exported successfully to {filename}"
-    else:
+            writer.writerow(USER_HEADERS)  # Write the headers
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    if count == 0:
+        os.remove(filename)
         return "No users found to export."
+    return f"{count} users exported successfully to {filename}"
+
+# Header names of the user, API key name and expiry columns in read_keys' input (lowercase, without spaces and underscores)
+_KEY_HEADERS = (("user",), ("apiname", "apikeyname"), ("expiresat",))
+
+def read_keys(filename, columns=2) -> Iterator[Tuple[str, ...]]:
+    """
+    (user, api_name[, expires_at]) rows of a CSV file, read as they are consumed. The columns
+    are taken in that order, or by name when the first row is a header (so a file written by
+    export_users can be fed back). Empty lines are skipped, missing optional cells are empty.
+    Expiries are checked and normalized (see normalize_expiry), so a typo fails the whole file
+    with its line number instead of creating a key that can't authenticate.
+    """
+    indexes = list(range(columns))
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        for number, row in enumerate(csv.reader(csvfile), 1):
+            row = [cell.strip() for cell in row]
+            if not any(row):
+                continue
+            if number == 1:
+                names = [cell.lower().replace(" ", "").replace("_", "") for cell in row]
+                if "user" in names:
+                    indexes = [next((names.index(name) for name in aliases if name in names), None) for aliases in _KEY_HEADERS[:columns]]
+                    if None in indexes[:2]:
+                        raise ValueError(f"{filename}: the header has no user or API key name column")
+                    continue
+            key = tuple(row[i] if i is not None and i < len(row) else "" for i in indexes)
+            if not key[0] or not key[1]:
+                raise ValueError(f"{filename}, line {number}: expected user,api_name")
+            if columns > 2:
+                try:
+                    key = key[:2] + (normalize_expiry(key[2]),)
+                except ValueError as e:
+                    raise ValueError(f"{filename}, line {number}: {e}")
+            yield key
+
+def _write_tokens(keys, output, bulk_call):
+    """Run a bulk call with the new tokens written to `output` as they are made; removed again if the call fails."""
+    with open(output, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["User", "API KEY Name", "Token"])
+        try:
+            return bulk_call(keys, lambda user, api_name, token: writer.writerow([user, api_name, token]))
+        except BaseException:
+            csvfile.close()
+            os.remove(output)
+            raise
+
+def _missing_note(missing: List[Tuple[str, str]]) -> str:
+    if not missing:
+        return ""
+    shown = ", ".join(f"{user}/{api_name}" for user, api_name in missing[:10])
+    more = f" and {len(missing) - 10} more" if len(missing) > 10 else ""
+    return f" Not found: {shown}{more}."
+
+def generate_tokens_from_csv(filename, output):
+    """Create the keys listed in a CSV file (user,api_name[,expires_at]) in one transaction, tokens written to `output`."""
+    try:
+        count = _write_tokens(read_keys(filename, 3), output, get_token_manager().generate_tokens)
+    except (OSError, ValueError) as e:
+        return str(e)
+    return f"Generated {count} tokens, written to {output}"
+
+def revoke_tokens_from_csv(filename):
+    """Delete the keys listed in a CSV file (user,api_name) in one transaction."""
+    try:
+        deleted, missing = get_token_manager().revoke_tokens(read_keys(filename))
+    except (OSError, ValueError) as e:
+        return str(e)
+    return f"Deleted {deleted} tokens.{_missing_note(missing)}"
+
+def rotate_tokens_from_csv(filename, output, grace_seconds):
+    """Give the keys listed in a CSV file new tokens in one transaction; old tokens work for `grace_seconds` more."""
+    manager = get_token_manager()
+    try:
+        rotated, missing = _write_tokens(
+            read_keys(filename), output,
+            lambda keys, on_token: manager.rotate_tokens(keys, grace_seconds, on_token),
+        )
+    except (OSError, ValueError) as e:
+        return str(e)
+    grace = f"Old tokens stop working in {grace_seconds:g} seconds." if grace_seconds > 0 else "Old tokens no longer work."
+    return f"Rotated {rotated} tokens, written to {output}. {grace}{_missing_note(missing)}"
@@ -0,0 +1,168 @@
+# libs/token_store.py
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List
+
+# Columns added after the original schema, created on existing databases by migrate()
+ADDED_COLUMNS = (
+    ("token_hash", "TEXT"),
+    ("rate_limit_rps", "REAL"),  # Requests per second, NULL means unlimited
+    ("max_concurrent_streams", "INTEGER"),  # Streaming responses in progress at once, NULL means unlimited
+    ("tokens_per_minute", "INTEGER"),  # Prompt + generated tokens per minute, NULL means unlimited
+    ("priority", "INTEGER"),  # Scheduling tier, higher is served first, NULL means 0
+    ("cache_responses", "INTEGER"),  # 0 opts the key out of the response cache, NULL means allowed
+    ("previous_token_hash", "TEXT"),  # Token replaced by the last rotation, still accepted until previous_expires_at
+    ("previous_expires_at", "TEXT"),
+)
+
+# Changes to the tokens table that bump tokens_generation
+TOKEN_EVENTS = ("INSERT", "UPDATE", "DELETE")
+
+def hash_token(token: str) -> str:
+    """SHA-256 of an API key. Only the hash is stored and used as the lookup key."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class TokenStore:
+    """
+    SQLite storage behind TokenManager.
+
+    The database runs in WAL mode so readers never wait on writers, each thread reuses
+    its own connection instead of opening one per call, and async callers run queries
+    on a small dedicated thread pool so the event loop is never blocked by disk I/O.
+    """
+
+    def __init__(self, db_file: str, max_workers: int = 4, busy_timeout: float = 5.0):
+        self.db_file = db_file
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="token-db")
+        self.migrate()
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a new connection configured for concurrent use."""
+        conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, avoids an fsync per commit
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Yield the thread's connection inside a transaction (commit on success, rollback on error)."""
+        conn = self.connection()
+        with conn:
+            yield conn
+
+    async def run(self, fn: Callable, *args):
+        """Run a blocking store call on the database thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def migrate(self):
+        with self.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tokens (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    api_name TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    expires_at TEXT,
+                    UNIQUE(user, api_name),
+                    UNIQUE(user_id)
+                )
+            ''')
+
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(tokens)')}
+            for name, column_type in ADDED_COLUMNS:
+                if name not in columns:
+                    conn.execute(f'ALTER TABLE tokens ADD COLUMN {name} {column_type}')
+
+            # Hash tokens stored in plaintext by older versions and stop keeping the plaintext.
+            # The 'token' column is kept (empty) for compatibility with the original schema.
+            rows = conn.execute("SELECT id, token FROM tokens WHERE token_hash IS NULL").fetchall()
+            conn.executemany(
+                "UPDATE tokens SET token_hash = ?, token = '' WHERE id = ?",
+                [(hash_token(token), row_id) for row_id, token in rows]
+            )
+
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tokens_token_hash ON tokens(token_hash)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tokens_previous_token_hash ON tokens(previous_token_hash)')
+
+            # Generation of the tokens table, bumped by triggers on every change to it. TokenManager
+            # watches it to drop its auth cache when another process (e.g. the CLI) changed a key;
+            # writes to the other tables, like usage flushes and batch heartbeats, leave it alone.
+            conn.execute('CREATE TABLE IF NOT EXISTS tokens_generation (generation INTEGER NOT NULL)')
+            conn.execute('INSERT INTO tokens_generation SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM tokens_generation)')
+            for event in TOKEN_EVENTS:
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS tokens_{event.lower()}_generation AFTER {event} ON tokens
+                    BEGIN
+                        UPDATE tokens_generation SET generation = generation + 1;
+                    END
+                ''')
+
+            # Tokens used per key, model and UTC day, written by UsageRecorder. user and api_name
+            # are copied so usage stays readable after the key is revoked.
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS usage (
+                    user_id TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    api_name TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    requests INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, model, day)
+                )
+            ''')
+
+            # Batch jobs, run by BatchRunner (libs/batch.py). owner and heartbeat are the claim of
+            # the worker process running the job, renewed while it runs.
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS batches (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    api_name TEXT NOT NULL,
+                    route TEXT,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    owner TEXT,
+                    heartbeat REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_batches_status ON batches(status, created_at)')
+
+    def tokens_generation(self, conn: sqlite3.Connection) -> int:
+        """Current generation of the tokens table, read through `conn`."""
+        return conn.execute('SELECT generation FROM tokens_generation').fetchone()[0]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,53 @@
+# libs/usage.py
+import re
+from typing import Dict, List, Optional
+import orjson
+
+# Counters Ollama reports once a response is complete (durations are in nanoseconds)
+USAGE_FIELDS = (
+    "prompt_eval_count",
+    "eval_count",
+    "prompt_eval_duration",
+    "eval_duration",
+    "load_duration",
+    "total_duration",
+)
+
+# Ollama writes the counters last, so only the tail of a complete body needs scanning
+_TAIL_BYTES = 2048
+_USAGE_RE = re.compile(rb'"(' + b"|".join(field.encode() for field in USAGE_FIELDS) + rb')":(\d+)')
+
+def usage_from_body(body: bytes) -> Optional[Dict[str, int]]:
+    """Counters of a non-streaming response, found without parsing the whole (possibly huge) body."""
+    usage = {match.group(1).decode(): int(match.group(2)) for match in _USAGE_RE.finditer(body[-_TAIL_BYTES:])}
+    return usage or None
+
+class StreamUsageTap:
+    """
+    Watches an NDJSON stream go by and returns the counters of its final record ("done": true).
+    Per chunk it only keeps references to the chunks of the trailing, possibly partial line,
+    so nothing is parsed until the stream is over.
+    """
+    __slots__ = ("_parts",)
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def feed(self, chunk: bytes):
+        if self._parts and self._parts[-1].endswith(b"\n"):
+            self._parts = [chunk]
+        else:
+            self._parts.append(chunk)
+
+    def usage(self) -> Optional[Dict[str, int]]:
+        tail = b"".join(self._parts).rstrip(b"\n")
+        if not tail:
+            return None
+        try:
+            record = orjson.loads(tail.rsplit(b"\n", 1)[-1])
+        except orjson.JSONDecodeError:
+            return None  # Stream cut before the final record
+        if not isinstance(record, dict) or not record.get("done"):
+            return None
+        usage = {field: record[field] for field in USAGE_FIELDS if isinstance(record.get(field), int)}
+        return usage or None
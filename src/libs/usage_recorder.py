@@ -0,0 +1,86 @@
+# libs/usage_recorder.py
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from libs.request_context import RequestContext
+from libs.token_store import TokenStore
+
+logger = logging.getLogger(__name__)
+
+# (user_id, user, api_name, model, day) -> [requests, prompt_tokens, completion_tokens]
+UsageKey = Tuple[str, str, str, str, str]
+
+class UsageRecorder:
+    """
+    Aggregates the tokens Ollama reports per API key, model and UTC day in memory, and adds
+    them to the `usage` table in one transaction every `flush_interval` seconds. Recording a
+    request is a dict update on the event loop; SQLite is only written from the store's
+    thread pool.
+    """
+
+    def __init__(self, store: TokenStore, flush_interval: float = 5.0):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._pending: Dict[UsageKey, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, ctx: RequestContext):
+        """RequestContext finish callback: count the request and the tokens its response used."""
+        principal = ctx.principal
+        usage = ctx.usage or {}
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        key = (principal.user_id, principal.user, principal.api_name, ctx.model or "", day)
+        totals = self._pending.get(key)
+        if totals is None:
+            totals = self._pending[key] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += usage.get("prompt_eval_count", 0)
+        totals[2] += usage.get("eval_count", 0)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await self.store.run(self._write, batch)
+            except Exception as e:
+                logger.error("Usage flush failed, will retry: %s", e)
+                for key, totals in batch.items():  # Put the counts back for the next flush
+                    pending = self._pending.setdefault(key, [0, 0, 0])
+                    for i, value in enumerate(totals):
+                        pending[i] += value
+
+    def _write(self, batch: Dict[UsageKey, List[int]]):
+        with self.store.transaction() as conn:
+            conn.executemany(
+                '''
+                INSERT INTO usage (user_id, user, api_name, model, day, requests, prompt_tokens, completion_tokens)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, model, day) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens
+                ''',
+                [key + tuple(totals) for key, totals in batch.items()]
+            )
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
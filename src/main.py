@@ -1,19 +1,174 @@
 # main.py
-from fastapi import FastAPI
-from models import Settings
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from models import Settings, get_settings
 from libs.token_manager import TokenManager
-from routes import router  # Import the router from routes.py
+from libs.http_client import create_upstream_client
+from libs.backend_pool import BackendPool
+from libs.embed_cache import EmbedCache
+from libs.embed_batcher import EmbedBatcher
+from libs.tags_cache import TagsCache
+from libs.rate_limiter import AdmissionController, RateLimitExceeded
+from libs.scheduler import FairScheduler
+from libs.response_cache import ResponseCache
+from routes import router, forward_request, forward_batch_request, fetch_tags, upstream_options  # Import the router from routes.py
+from admin_routes import admin_router
+from batch_routes import batch_router
 from libs.logger import setup_logging
+from libs.access_log import AccessLogMiddleware
+from libs.metrics import GatewayMetrics, MetricsMiddleware
+from libs.usage_recorder import UsageRecorder
+from libs.singleflight import SingleFlight
+from libs.model_manager import ModelManager
+from libs.batch import BatchRunner
+from libs.timing import TimingMiddleware
+from libs.profiler import SamplingProfiler
 
-# Initialize logging
-setup_logging()
+# Shared resources are created here, once per worker process, and reach the route handlers
+# through app.state and the get_* dependencies in routes.py
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings: Settings = app.state.settings
+    app.state.token_manager = TokenManager(settings=settings)
+    app.state.upstream_flight = SingleFlight(cancel_abandoned=True) if settings.COALESCE_REQUESTS else None
 
-# Initialize FastAPI app
-app = FastAPI()
+    # One pooled client per process, shared by all route handlers
+    app.state.http_client = create_upstream_client(settings)
+    app.state.backend_pool = BackendPool(
+        urls=settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL],
+        client=app.state.http_client,
+        health_interval=settings.BACKEND_HEALTH_INTERVAL,
+        health_timeout=settings.BACKEND_HEALTH_TIMEOUT,
+        failure_threshold=settings.BACKEND_FAILURE_THRESHOLD,
+    )
+    await app.state.backend_pool.start()
+    app.state.model_manager = ModelManager(
+        app.state.backend_pool,
+        preload=settings.MODEL_PRELOAD,
+        keep_alive=settings.MODEL_KEEP_ALIVE,
+        poll_interval=settings.MODEL_PS_INTERVAL,
+        warmup_hold=settings.MODEL_WARMUP_HOLD,
+        warmup_timeout=settings.MODEL_WARMUP_TIMEOUT,
+    )
+    app.state.model_manager.start()
 
-# Initialize TokenManager and Settings
-token_manager = TokenManager()
-settings = Settings()
+    async def fetch_tags_body() -> bytes:
+        return (await fetch_tags(app.state.backend_pool)).body
 
-# Include the router with the prefix defined in settings
-app.include_router(router, prefix=settings.BASE_PATH)
+    app.state.tags_cache = TagsCache(
+        fetch=fetch_tags_body,
+        ttl=settings.TAGS_CACHE_TTL,
+        stale_ttl=settings.TAGS_CACHE_STALE_TTL,
+    ) if settings.TAGS_CACHE_TTL > 0 else None
+    app.state.embed_cache = EmbedCache(
+        max_bytes=settings.EMBED_CACHE_MAX_BYTES,
+        disk_path=settings.EMBED_CACHE_DISK_PATH,
+        disk_max_entries=settings.EMBED_CACHE_DISK_MAX_ENTRIES,
+    ) if settings.EMBED_CACHE_ENABLED else None
+
+    async def send_embed_batch(payload):
+        # One batch is one upstream call, so it takes one of the model's concurrency slots
+        async with app.state.admission.model_slot(payload.model):
+            return await forward_request(
+                app.state.backend_pool, endpoint="/api/embed", payload=payload, stream=False, **upstream_options(app)
+            )
+
+    app.state.embed_batcher = EmbedBatcher(
+        send=send_embed_batch,
+        window=settings.EMBED_BATCH_WINDOW_MS / 1000,
+        max_items=settings.EMBED_BATCH_MAX_ITEMS,
+    ) if settings.EMBED_BATCH_ENABLED else None
+    app.state.admission = AdmissionController(
+        burst_seconds=settings.RATE_LIMIT_BURST_SECONDS,
+        model_max_concurrency=settings.MODEL_MAX_CONCURRENCY,
+        model_concurrency=settings.MODEL_CONCURRENCY,
+        queue_timeout=settings.MODEL_QUEUE_TIMEOUT,
+    )
+    app.state.scheduler = FairScheduler(
+        max_inflight=settings.SCHEDULER_MAX_INFLIGHT,
+        max_queue=settings.SCHEDULER_MAX_QUEUE,
+        max_queue_per_user=settings.SCHEDULER_MAX_QUEUE_PER_USER,
+        queue_timeout=settings.SCHEDULER_QUEUE_TIMEOUT,
+        tier_weight_base=settings.SCHEDULER_TIER_WEIGHT_BASE,
+        tier_weights=settings.SCHEDULER_TIER_WEIGHTS,
+    ) if settings.SCHEDULER_MAX_INFLIGHT > 0 else None
+    app.state.response_cache = ResponseCache(
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    ) if settings.RESPONSE_CACHE_ENABLED else None
+    app.state.usage_recorder = UsageRecorder(
+        app.state.token_manager.store,
+        flush_interval=settings.USAGE_FLUSH_INTERVAL,
+    ) if settings.USAGE_TRACKING_ENABLED else None
+    if app.state.usage_recorder is not None:
+        app.state.usage_recorder.start()
+    app.state.batch_runner = BatchRunner(
+        app.state.token_manager.store,
+        directory=settings.BATCH_DIR,
+        send=lambda principal, route, body: forward_batch_request(app, principal, route, body),
+        load_principal=app.state.token_manager.get_principal,
+        concurrency=settings.BATCH_CONCURRENCY,
+        max_jobs=settings.BATCH_MAX_RUNNING_JOBS,
+        priority=settings.BATCH_PRIORITY,
+        poll_interval=settings.BATCH_POLL_INTERVAL,
+        max_retries=settings.BATCH_MAX_RETRIES,
+        max_rate_limited_wait=settings.BATCH_MAX_RATE_LIMIT_WAIT,
+    ) if settings.BATCH_ENABLED else None
+    if app.state.batch_runner is not None:
+        app.state.batch_runner.start()
+    try:
+        yield
+    finally:
+        if app.state.batch_runner is not None:
+            await app.state.batch_runner.close()  # Before the usage recorder, so the last requests are counted
+        if app.state.usage_recorder is not None:
+            await app.state.usage_recorder.close()
+        await app.state.model_manager.close()
+        await app.state.backend_pool.close()
+        await app.state.http_client.aclose()
+        if app.state.embed_cache is not None:
+            app.state.embed_cache.close()
+        app.state.token_manager.close()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the gateway application. Settings are read once and kept on app.state; the token
+    store, upstream client and caches are created by the lifespan when the server starts.
+
+        uvicorn --factory main:create_app
+    """
+    settings = settings or get_settings()
+    setup_logging(settings)
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.metrics = GatewayMetrics() if settings.METRICS_ENABLED else None
+    app.state.profiler = SamplingProfiler(settings.PROFILER_MAX_SECONDS) if settings.PROFILER_MAX_SECONDS > 0 else None
+    if settings.SERVER_TIMING or settings.ACCESS_LOG:
+        app.add_middleware(TimingMiddleware, header=settings.SERVER_TIMING)
+    if app.state.metrics is not None:
+        app.add_middleware(MetricsMiddleware, metrics=app.state.metrics)
+    if settings.ACCESS_LOG:
+        app.add_middleware(AccessLogMiddleware)
+
+    @app.exception_handler(RateLimitExceeded)
+    async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+        return JSONResponse(
+            status_code=429,
+            content={"detail": exc.detail},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    # Include the router with the prefix defined in settings
+    app.include_router(router, prefix=settings.BASE_PATH)
+    app.include_router(admin_router, prefix=f"{settings.BASE_PATH}/admin")
+    app.include_router(batch_router, prefix=f"{settings.BASE_PATH}/batches")
+    return app
+
+# `uvicorn main:app` keeps working: the app is created on first access rather than on import
+def __getattr__(name: str):
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,7 @@
 # src/models.py
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -8,12 +9,115 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     LOG_LEVEL: str = Field("INFO", env="LOG_LEVEL")  # Default to INFO if not set
     LOG_FILE_LEVEL: str = Field("INFO", env="LOG_FILE_LEVEL")  # For file handler
+    LOG_FILE: str = "app.log"  # Log file path, empty to log to the console only
+    LOG_FILE_MAX_BYTES: int = 10 * 1024 * 1024  # Rotate log files at this size, 0 never rotates
+    LOG_FILE_BACKUP_COUNT: int = 5  # Rotated files kept
+    ACCESS_LOG: bool = False  # One JSON line per request (status, timing, user, model, token counts)
+    ACCESS_LOG_FILE: str = ""  # Access log path, empty writes it to the console
+    USAGE_TRACKING_ENABLED: bool = True  # Record tokens used per key, model and day in the usage table
+    USAGE_FLUSH_INTERVAL: float = 5.0  # Seconds between writes of the aggregated usage to the database
+    METRICS_ENABLED: bool = True  # Prometheus metrics at {BASE_PATH}/metrics (admin key required)
+    SERVER_TIMING: bool = False  # Server-Timing response header with the request's phase durations (auth, validation, queue, upstream, ttft)
+    PROFILER_MAX_SECONDS: float = 60.0  # Longest sampling profile {BASE_PATH}/admin/profile may take, 0 disables it
     BASE_PATH: str = "/api"  # Default prefix
-    OLLAMA_BASE_URL: str
+    REQUEST_PASSTHROUGH: bool = False  # Forward request bodies as sent, checking only 'model' and 'stream'
+    COALESCE_REQUESTS: bool = True  # Identical non-streaming requests in flight share one upstream call
+    VALIDATE_UPSTREAM_JSON: bool = False  # Check non-streaming Ollama responses are valid JSON before relaying them
+    OLLAMA_BASE_URL: Optional[str] = None  # Single Ollama server
+    OLLAMA_BASE_URLS: List[str] = []  # Several Ollama servers as a JSON list, takes precedence over OLLAMA_BASE_URL
     TOKEN_DB_PATH: str
+    TOKEN_DB_POOL_SIZE: int = 4  # Threads running token database queries off the event loop
+    TOKEN_DB_BUSY_TIMEOUT: float = 5.0  # Seconds SQLite waits on a locked database before failing
     CLI_API_KEY_Test: Optional[str] = None
+    ADMIN_USERS: List[str] = []  # Users allowed to call the /admin endpoints, as a JSON list: ADMIN_USERS='["alice"]'
+
+    # Shared upstream HTTP client (connection pool to Ollama)
+    UPSTREAM_MAX_CONNECTIONS: int = 100  # Max open connections to Ollama
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20  # Idle connections kept for reuse
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0  # Seconds an idle connection is kept alive
+    UPSTREAM_HTTP2: bool = False  # Requires the 'h2' package (httpx[http2])
+    UPSTREAM_CONNECT_TIMEOUT: Optional[float] = 5.0  # Seconds, None disables the timeout
+    UPSTREAM_READ_TIMEOUT: Optional[float] = 600.0  # Seconds to wait for a non-streaming response (whole generations take a while)
+    UPSTREAM_WRITE_TIMEOUT: Optional[float] = 30.0
+    UPSTREAM_POOL_TIMEOUT: Optional[float] = None  # Seconds to wait for a free connection from the pool
+    UPSTREAM_FIRST_BYTE_TIMEOUT: Optional[float] = 300.0  # Seconds a stream may take to its first chunk (model load and prompt evaluation)
+    UPSTREAM_IDLE_TIMEOUT: Optional[float] = 60.0  # Seconds a stream may go without sending a chunk
+
+    # Coalescing of streamed NDJSON lines into fewer, larger writes (see libs/stream_coalescer.py)
+    STREAM_FLUSH_INTERVAL_MS: float = 0.0  # Longest a streamed line is held back to go out with the next ones, 0 relays chunks as they come
+    STREAM_FLUSH_ROUTES: Dict[str, float] = {}  # Per-route overrides of STREAM_FLUSH_INTERVAL_MS, e.g. {"chat": 20, "generate": 50}
+    STREAM_FLUSH_MAX_BYTES: int = 16 * 1024  # Held lines are sent at once when they reach this size, 0 for no limit
+    STREAM_FLUSH_MAX_CLIENT_MS: float = 1000.0  # Cap on the interval clients may ask for with X-Stream-Flush-Ms
+
+    # Model residency (loaded models per server, see libs/model_manager.py)
+    MODEL_PRELOAD: List[str] = []  # Models loaded on every server at startup and whenever they go missing, as a JSON list
+    MODEL_KEEP_ALIVE: Dict[str, Union[int, str]] = {}  # keep_alive set on every request per model, e.g. {"llama3.2": -1} pins it
+    MODEL_PS_INTERVAL: float = 10.0  # Seconds between /api/ps polls of every server, 0 disables residency tracking
+    MODEL_WARMUP_HOLD: bool = False  # Requests for a model that isn't loaded wait behind one warm-up call per server
+    MODEL_WARMUP_TIMEOUT: float = 300.0  # Seconds a preload or warm-up call may take
+
+    # Ollama backend pool health checks
+    BACKEND_HEALTH_INTERVAL: float = 10.0  # Seconds between /api/tags checks of every backend
+    BACKEND_HEALTH_TIMEOUT: float = 2.0
+    BACKEND_FAILURE_THRESHOLD: int = 2  # Consecutive failures before a backend is ejected
+
+    # In-process authentication cache
+    AUTH_CACHE_SIZE: int = 10000  # Max cached tokens (valid and invalid), 0 disables the cache
+    AUTH_CACHE_TTL: float = 60.0  # Seconds a resolved token is trusted before re-checking the database
+    AUTH_CACHE_NEGATIVE_TTL: float = 5.0  # Seconds an unknown token is remembered as invalid
+    AUTH_CACHE_DB_CHECK_INTERVAL: float = 1.0  # Seconds between checks for changes made to the database by other processes
+
+    # Embedding cache in front of /embed
+    EMBED_CACHE_ENABLED: bool = False
+    EMBED_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Memory bound for cached responses
+    EMBED_CACHE_DISK_PATH: Optional[str] = None  # SQLite file for a persistent tier, disabled when not set
+    EMBED_CACHE_DISK_MAX_ENTRIES: int = 1_000_000
+    EMBED_COMPRESSION_MIN_BYTES: int = 64 * 1024  # gzip/zstd JSON responses this large when the client accepts it, 0 disables
+
+    # Micro-batching of concurrent /embed calls
+    EMBED_BATCH_ENABLED: bool = False
+    EMBED_BATCH_WINDOW_MS: float = 5.0  # How long the first call of a batch waits for others
+    EMBED_BATCH_MAX_ITEMS: int = 64  # Inputs that flush a batch immediately
+
+    # /tags cache
+    TAGS_CACHE_TTL: float = 30.0  # Seconds the model list is served without asking Ollama, 0 disables the cache
+    TAGS_CACHE_STALE_TTL: float = 300.0  # Seconds a stale list is still served while it is refreshed in the background
+
+    # Admission control (per-key limits are set with the CLI, see gen_api_key_cli.py -r)
+    RATE_LIMIT_BURST_SECONDS: float = 1.0  # Seconds of a key's request rate it may send in one burst
+    MODEL_MAX_CONCURRENCY: int = 0  # Requests forwarded at once per model, 0 means unlimited
+    MODEL_CONCURRENCY: Dict[str, int] = {}  # Per-model overrides of MODEL_MAX_CONCURRENCY
+    MODEL_QUEUE_TIMEOUT: float = 30.0  # Seconds a request waits for a model slot before a 429
+
+    # Fair scheduling of upstream requests across users
+    SCHEDULER_MAX_INFLIGHT: int = 0  # Requests forwarded upstream at once, 0 disables the scheduler
+    SCHEDULER_MAX_QUEUE: int = 1000  # Requests waiting in total before new ones get a 429
+    SCHEDULER_MAX_QUEUE_PER_USER: int = 100  # Requests one user may have waiting
+    SCHEDULER_QUEUE_TIMEOUT: float = 60.0  # Seconds a request may wait before a 429
+    SCHEDULER_TIER_WEIGHT_BASE: float = 1.5  # A priority tier's share of the slots is this to the power of its priority
+    SCHEDULER_TIER_WEIGHTS: Dict[int, float] = {}  # Per-tier overrides of that weight, e.g. {"0": 10, "-10": 1}
+
+    # Batch jobs: JSONL files of requests processed in the background (see libs/batch.py)
+    BATCH_ENABLED: bool = False
+    BATCH_DIR: str = "batches"  # Uploaded inputs and results, shared by the worker processes
+    BATCH_MAX_UPLOAD_BYTES: int = 1024 * 1024 * 1024
+    BATCH_CONCURRENCY: int = 4  # Requests of one job in flight at once
+    BATCH_MAX_RUNNING_JOBS: int = 1  # Jobs processed at once per worker process
+    BATCH_PRIORITY: int = -10  # Scheduler tier of batch requests, below interactive keys (0 by default)
+    BATCH_POLL_INTERVAL: float = 5.0  # Seconds between progress saves and checks for queued or abandoned jobs
+    BATCH_MAX_RETRIES: int = 2  # Retries of a request failing with 502, 503 or 504
+    BATCH_MAX_RATE_LIMIT_WAIT: float = 600.0  # Seconds a request answered with 429 is retried for before it fails
+
+    # Cache of deterministic /generate and /chat responses (temperature 0 or a fixed seed)
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Memory bound of the cache
 
     class Config:
         # env_file = ".env"
         env_file=os.path.join(os.path.dirname(__file__), '..', '.env'),
         env_file_encoding='utf-8'
+
+@lru_cache()
+def get_settings() -> Settings:
+    """The process-wide Settings: the environment and .env are read once, on first use."""
+    return Settings()
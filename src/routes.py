@@ -1,19 +1,44 @@
+import asyncio
 import logging
+import time
+from contextlib import AsyncExitStack
+import anyio
 import httpx
-import json
-from fastapi import APIRouter, HTTPException, Security, Response, Depends
+import orjson
+from fastapi import APIRouter, HTTPException, Security, Response, Depends, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
-from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Any, Optional, List, Type, Union, Callable, Tuple, Awaitable, TypeVar, AsyncIterator
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from models import Settings
-from libs.token_manager import TokenManager
+from libs.token_manager import TokenManager, Principal
+from libs.payload import Payload, parse_passthrough
+from libs.embed_cache import EmbedCache
+from libs.embed_batcher import EmbedBatcher
+from libs.backend_pool import BackendPool
+from libs.tags_cache import TagsCache, etag_matches
+from libs.rate_limiter import AdmissionController
+from libs.scheduler import FairScheduler
+from libs.response_cache import ResponseCache, is_deterministic
+from libs.singleflight import SingleFlight
+from libs.metrics import GatewayMetrics
+from libs.request_context import RequestContext
+from libs.timing import Timings, timed
+from libs.usage import StreamUsageTap, usage_from_body
+from libs.usage_recorder import UsageRecorder
+from libs.embed_encoding import EmbedEncoding, parse_encoding, encode, available as encodings_available, FORMAT_FIELD, DTYPE_FIELD
+from libs.compression import negotiate, compress
+from libs.model_manager import ModelManager
+from libs.batch import BatchRunner
+from libs.profiler import SamplingProfiler
+from libs.stream_coalescer import FlushPolicy, flush_policy, coalesce_lines, INTERVAL_HEADER, MAX_BYTES_HEADER
 
 logger = logging.getLogger(__name__)
 
-# Initialize TokenManager and Settings
-token_manager = TokenManager()
-settings = Settings()
+T = TypeVar("T")
 
 # Create an APIRouter
 router = APIRouter()
@@ -23,14 +48,98 @@ security_scheme = HTTPBearer(auto_error=False)
 
 # HELPERS ##########################################################################
 
-# Authentication Dependency
-async def get_api_key(credentials: HTTPAuthorizationCredentials = Security(security_scheme)):
-    # logger.debug(f"get_api_key() called with credentials: {credentials}")
+# Settings the app was created with (see create_app in main.py)
+def get_settings(request: Request) -> Settings:
+    return request.app.state.settings
+
+# API key store, opened once per process by the app lifespan
+def get_token_manager(request: Request) -> TokenManager:
+    return request.app.state.token_manager
+
+# Identical non-streaming requests in flight share one upstream call (see forward_request), None when disabled
+def get_upstream_flight(request: Request) -> Optional[SingleFlight]:
+    return request.app.state.upstream_flight
+
+# Phase durations of the request (see libs/timing.py), None when neither SERVER_TIMING nor ACCESS_LOG is on
+def get_timings(request: Request) -> Optional[Timings]:
+    return getattr(request.state, "timings", None)
+
+# Authentication Dependency, resolves the bearer token to its Principal (user, key name, expiry) in one cached lookup
+async def get_api_key(request: Request, credentials: HTTPAuthorizationCredentials = Security(security_scheme)) -> Principal:
+    # logger.debug("get_api_key() called with credentials: %s", credentials)
     if credentials and credentials.scheme == "Bearer":
-        if token_manager.validate_token(credentials.credentials):
-            return credentials.credentials
+        with timed(get_timings(request), "auth"):
+            principal = await request.app.state.token_manager.aresolve_principal(credentials.credentials)
+        if principal is not None:
+            request.state.principal = principal  # For the access log
+            return principal
     raise HTTPException(status_code=401, detail="Invalid or missing token")
 
+# Admin-only endpoints: the key's user must be listed in ADMIN_USERS
+async def get_admin_principal(
+    principal: Principal = Security(get_api_key),
+    settings: Settings = Depends(get_settings),
+) -> Principal:
+    if principal.user not in settings.ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return principal
+
+# Per-key rate limits and per-model concurrency caps
+def get_admission(request: Request) -> AdmissionController:
+    return request.app.state.admission
+
+# Authenticated principal whose key is still within its request rate and token budget
+async def check_rate_limit(
+    principal: Principal = Security(get_api_key),
+    admission: AdmissionController = Depends(get_admission),
+) -> Principal:
+    admission.check_rate(principal)  # Raises RateLimitExceeded, answered with a 429 (see main.py)
+    return principal
+
+# Fair scheduler bounding upstream concurrency, None when disabled
+def get_scheduler(request: Request) -> Optional[FairScheduler]:
+    return request.app.state.scheduler
+
+# Cache of deterministic /generate and /chat responses, None when disabled
+def get_response_cache(request: Request) -> Optional[ResponseCache]:
+    return request.app.state.response_cache
+
+# Prometheus metrics, None when disabled
+def get_metrics(request: Request) -> Optional[GatewayMetrics]:
+    return request.app.state.metrics
+
+# Token usage aggregation, None when disabled
+def get_usage_recorder(request: Request) -> Optional[UsageRecorder]:
+    return request.app.state.usage_recorder
+
+# Pool of Ollama backends, all reached through the shared upstream client (created and closed by the app lifespan in main.py)
+def get_backend_pool(request: Request) -> BackendPool:
+    return request.app.state.backend_pool
+
+# /tags cache dependency, None when TAGS_CACHE_TTL is 0
+def get_tags_cache(request: Request) -> Optional[TagsCache]:
+    return request.app.state.tags_cache
+
+# Embedding cache dependency, None when EMBED_CACHE_ENABLED is off
+def get_embed_cache(request: Request) -> Optional[EmbedCache]:
+    return request.app.state.embed_cache
+
+# Model residency manager (preloads, keep_alive policies, warm-up hold)
+def get_model_manager(request: Request) -> ModelManager:
+    return request.app.state.model_manager
+
+# Embedding micro-batcher dependency, None when EMBED_BATCH_ENABLED is off
+def get_embed_batcher(request: Request) -> Optional[EmbedBatcher]:
+    return request.app.state.embed_batcher
+
+# Batch jobs (see batch_routes.py), None when BATCH_ENABLED is off
+def get_batch_runner(request: Request) -> Optional[BatchRunner]:
+    return request.app.state.batch_runner
+
+# Sampling profiler behind /admin/profile, None when PROFILER_MAX_SECONDS is 0
+def get_profiler(request: Request) -> Optional[SamplingProfiler]:
+    return request.app.state.profiler
+
 # Request models
 class BaseRequest(BaseModel):
     model: str
@@ -59,121 +168,647 @@ class ChatRequest(BaseRequest):
     system: Optional[str] = None
     messages: List[Message]
 
-# Helper function to forward requests
+class EmbedRequest(BaseRequest):
+    input: Union[str, List[str]]
+    encoding_format: Optional[str] = None  # Gateway only: float (Ollama's JSON), base64, binary or npy
+    dtype: Optional[str] = None  # Gateway only: float32 or float16, for the base64, binary and npy encodings
+
+# Read the request body into a Payload, either validated by the route's model or, in
+# passthrough mode, checked only for the fields the gateway needs and forwarded untouched
+async def read_payload(request: Request, model_cls: Type[BaseRequest]) -> Payload:
+    timings = get_timings(request)
+    with timed(timings, "body"):
+        raw = await request.body()
+    with timed(timings, "validate"):
+        return parse_payload(raw, model_cls, request.app.state.settings.REQUEST_PASSTHROUGH)
+
+def parse_payload(raw: bytes, model_cls: Type[BaseRequest], passthrough: bool) -> Payload:
+    if passthrough:
+        try:
+            return parse_passthrough(raw)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        request_data = model_cls.model_validate_json(raw)
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+    payload = Payload(request_data.model_dump(exclude_unset=True))
+    payload.update(request_data.extra_params)
+    return payload
+
+# OpenAPI request body for routes that read the raw body themselves, so /docs still shows the models
+def request_body_schema(model_cls: Type[BaseModel]) -> Dict[str, Any]:
+    schema = model_cls.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def inline(node):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if ref is not None:
+                return inline(definitions[ref.rsplit("/", 1)[-1]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(item) for item in node]
+        return node
+
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": inline(schema)}},
+        }
+    }
+
+# StreamingResponse that closes the upstream stream and runs on_close however the response ends:
+# fully sent, failed, or cancelled because the client went away
+class UpstreamStreamingResponse(StreamingResponse):
+    def __init__(self, content, on_close: Callable[[], Awaitable[None]], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Shielded: after a disconnect, Starlette's cancellation would otherwise cut the
+            # cleanup short and leave the upstream response open
+            with anyio.CancelScope(shield=True):
+                try:
+                    await self.body_iterator.aclose()
+                finally:
+                    await self.on_close()
+
+# Context of a request about to be forwarded, exposed to the access log and metrics through
+# request.state and, with usage tracking on, recorded against the key once it finishes
+def new_context(request: Request, principal: Principal, route: str, model: Optional[str]) -> RequestContext:
+    ctx = request.state.ctx = RequestContext(principal, route, model, get_timings(request))
+    usage_recorder: Optional[UsageRecorder] = request.app.state.usage_recorder
+    if usage_recorder is not None:
+        ctx.on_finish(usage_recorder.record)
+    return ctx
+
+# Wait for the request's turn upstream: its place in the fair scheduler, then the key's stream
+# slot and the model's concurrency slot. Everything taken is given back when ctx finishes,
+# which forward_request guarantees from here on.
+async def admit(
+    ctx: RequestContext,
+    admission: AdmissionController,
+    scheduler: Optional[FairScheduler],
+    model: Optional[str],
+    stream: bool,
+):
+    try:
+        with timed(ctx.timings, "queue"):
+            if scheduler is not None:
+                await scheduler.acquire(ctx)
+            await admission.acquire(ctx, model, stream)
+    except BaseException:
+        ctx.finish()
+        raise
+
+# Non-streaming upstream call, returns the status code, body and content type of the response
+async def post_upstream(
+    pool: BackendPool,
+    endpoint: str,
+    payload: Payload,
+    validate_json: bool = False,
+    models: Optional[ModelManager] = None,
+    timings: Optional[Timings] = None,
+) -> Tuple[int, bytes, str]:
+    start = time.perf_counter()
+    async with pool.acquire(payload.model) as backend:
+        if models is not None:
+            await models.before_request(backend, payload.model)
+        if timings is not None:
+            timings.add("backend", time.perf_counter() - start)
+        try:
+            with timed(timings, "upstream"):
+                response = await pool.client.post(
+                    f"{backend.url}{endpoint}",
+                    content=payload.body(),
+                    headers={"Content-Type": "application/json"},
+                    extensions={"trace": timings.trace} if timings is not None else None,
+                )
+        except httpx.RequestError as exc:
+            pool.report_failure(backend, str(exc))
+            raise
+    response.raise_for_status()
+    if models is not None:
+        models.loaded(backend, payload.model)
+    content = response.content
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response from Ollama: %s %r", response.status_code, content)
+
+    # Optionally make sure Ollama sent valid JSON, without re-serializing it
+    if validate_json:
+        try:
+            orjson.loads(content)
+        except orjson.JSONDecodeError as e:
+            logger.error("JSON decoding error: %s", e)
+            raise HTTPException(status_code=500, detail="Invalid JSON response from Ollama")
+
+    return response.status_code, content, response.headers.get('Content-Type', 'application/json')
+
+# HTTP status for an upstream failure known before the response started
+def upstream_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, httpx.HTTPStatusError):
+        logger.error("Error response %s from Ollama: %s", exc.response.status_code, exc.response.text)
+        return HTTPException(status_code=exc.response.status_code, detail=exc.response.text)
+    if isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError)):
+        logger.error("Ollama did not respond in time: %r", exc)
+        return HTTPException(status_code=504, detail="Ollama did not respond in time")
+    if isinstance(exc, httpx.RequestError):
+        logger.error("Request forwarding failed: %s", exc)
+        return HTTPException(status_code=502, detail=f"Request forwarding failed: {exc}")
+    logger.error("Unhandled exception: %s", exc)
+    return HTTPException(status_code=500, detail="Request forwarding failed")
+
+# NDJSON record ending a stream that failed after its response started (the status code is
+# already sent), in the shape Ollama itself uses for errors
+def error_record(message: str, after: bytes) -> bytes:
+    record = orjson.dumps({"error": message}) + b"\n"
+    return record if not after or after.endswith(b"\n") else b"\n" + record
+
+# The chunks of a stream, each read given `timeout` seconds. Missing it raises httpx.ReadTimeout,
+# like a read timeout of the client's would; those are fixed when the request is sent.
+async def idle_limited(chunks: AsyncIterator[bytes], timeout: float) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise httpx.ReadTimeout(f"Nothing read for {timeout:g} seconds")
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+# Helper function to forward requests. When a RequestContext is given, it is finished (with
+# Ollama's token counters) once the response is over, releasing whatever the request held.
+# `flight` and `validate_json` apply to non-streaming requests, the timeouts to streams, and
+# `models` applies keep_alive policies and tracks model residency; see upstream_options.
+# With a `flush` policy, a stream's lines after the first chunk are coalesced (see stream_flush).
 async def forward_request(
+    pool: BackendPool,
     endpoint: str,
-    payload: Dict[str, Any],
+    payload: Payload,
     stream: bool,
+    ctx: Optional[RequestContext] = None,
+    flight: Optional[SingleFlight] = None,
+    validate_json: bool = False,
+    first_byte_timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    models: Optional[ModelManager] = None,
+    flush: Optional[FlushPolicy] = None,
 ) -> Response:
-    url = f"{settings.OLLAMA_BASE_URL}{endpoint}"
-    logger.debug(f"Forwarding request to {url} with payload: {payload}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Forwarding request to %s with payload: %s", endpoint, payload.data)
+    headers = {"Content-Type": "application/json"}
+    client = pool.client
+    finish = ctx.finish if ctx is not None else lambda usage=None: None
+    timings = ctx.timings if ctx is not None else None
+    if models is not None:
+        models.apply_keep_alive(payload)
 
     try:
         if stream:
             logger.debug("Streaming response enabled.")
-            async def stream_response():
-                async with httpx.AsyncClient(timeout=None) as client:
-                    async with client.stream("POST", url, json=payload) as response:
-                        if response.status_code != 200:
-                            logger.error(f"Failed to fetch streaming data: {response.status_code}")
-                            raise HTTPException(status_code=response.status_code, detail=response.text)
-                        async for chunk in response.aiter_bytes():
-                            yield chunk
-
-            return StreamingResponse(stream_response(), media_type="application/json")
-        else:
-            async with httpx.AsyncClient(timeout=None) as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                logger.debug(f"Response from Ollama: {response.status_code}")
-
-                content = await response.aread()
-                content_text = content.decode("utf-8")
-                logger.debug(f"Response content from Ollama: {content_text}")
+            tap = StreamUsageTap()
+            # Holds the backend slot and the upstream response until the stream is over
+            upstream = AsyncExitStack()
+
+            async def open_stream():
+                start = time.perf_counter()
+                backend = await upstream.enter_async_context(pool.acquire(payload.model))
+                if models is not None:
+                    await models.before_request(backend, payload.model)
+                if ctx is not None:
+                    ctx.upstream_start = time.perf_counter()
+                if timings is not None:
+                    timings.add("backend", ctx.upstream_start - start)
+                # No read timeout while Ollama loads the model and evaluates the prompt (the first
+                # byte deadline covers that), then the idle timeout for every read after the first chunk
+                request = client.build_request(
+                    "POST", f"{backend.url}{endpoint}", content=payload.body(), headers=headers,
+                    timeout=httpx.Timeout(
+                        connect=client.timeout.connect, read=None, write=client.timeout.write, pool=client.timeout.pool,
+                    ),
+                    extensions={"trace": timings.trace} if timings is not None else None,
+                )
+                try:
+                    response = await client.send(request, stream=True)
+                    upstream.push_async_callback(response.aclose)
+                    if timings is not None:
+                        timings.add("upstream", time.perf_counter() - ctx.upstream_start)
+                    if response.status_code != 200:
+                        await response.aread()
+                        response.raise_for_status()
+                    if models is not None:
+                        models.loaded(backend, payload.model)
+                    chunks = response.aiter_bytes()
+                    first_chunk = b""
+                    async for first_chunk in chunks:
+                        break
+                    if idle_timeout is not None:
+                        chunks = idle_limited(chunks, idle_timeout)
+                except httpx.RequestError as exc:
+                    pool.report_failure(backend, str(exc))
+                    raise
+                if ctx is not None:
+                    ctx.first_byte = time.perf_counter()
+                if timings is not None:
+                    timings.add("ttft", ctx.first_byte - timings.start)
+                return backend, chunks, first_chunk
+
+            # Everything up to the first chunk happens before the response starts, so failures
+            # still get a status code; later ones end the stream with an error record
+            try:
+                backend, chunks, first_chunk = await asyncio.wait_for(open_stream(), first_byte_timeout)
+            except BaseException:
+                await upstream.aclose()
+                finish()
+                raise
 
-                # Parse the JSON content
+            async def stream_response():
+                last = first_chunk
+                # The first chunk goes out at once, it is what the client's time to first token is
+                body = coalesce_lines(chunks, flush) if flush is not None else chunks
                 try:
-                    json_obj = json.loads(content_text)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON decoding error: {e}")
-                    raise HTTPException(status_code=500, detail="Invalid JSON response from Ollama")
-                
-                return JSONResponse(content=json_obj, status_code=response.status_code)
-
-    except httpx.HTTPStatusError as exc:
-        logger.error(f"Error response {exc.response.status_code} from Ollama: {exc.response.text}")
-        raise HTTPException(status_code=exc.response.status_code, detail=exc.response.text)
-    except httpx.RequestError as exc:
-        logger.error(f"Request forwarding failed: {exc}")
-        raise HTTPException(status_code=500, detail=f"Request forwarding failed: {exc}")
-    except Exception as e:
-        logger.error(f"Unhandled exception: {e}")
-        raise HTTPException(status_code=500, detail="Request forwarding failed")
+                    if first_chunk:
+                        tap.feed(first_chunk)
+                        yield first_chunk
+                    async for chunk in body:
+                        tap.feed(chunk)
+                        last = chunk
+                        yield chunk
+                    if ctx is not None:
+                        ctx.upstream_end = time.perf_counter()
+                except httpx.RequestError as exc:
+                    if isinstance(exc, httpx.ReadTimeout):
+                        message = f"Ollama sent nothing for {idle_timeout:g} seconds"
+                    else:
+                        pool.report_failure(backend, str(exc))
+                        message = f"Connection to Ollama failed: {exc}"
+                    logger.error("Stream from %s%s cut short: %s", backend.url, endpoint, message)
+                    if ctx is not None:
+                        ctx.error = message
+                    yield error_record(message, last)
+                finally:
+                    if flush is not None:
+                        await body.aclose()  # Stops its pending read before the upstream response is closed
+
+            async def close():
+                await upstream.aclose()
+                if timings is not None:
+                    timings.add("stream", (ctx.upstream_end or time.perf_counter()) - ctx.first_byte)
+                finish(tap.usage())
+
+            return UpstreamStreamingResponse(
+                stream_response(),
+                on_close=close,
+                media_type="application/json",
+            )
+        else:
+            usage = None
+            try:
+                if ctx is not None:
+                    ctx.upstream_start = time.perf_counter()
+                if flight is not None:
+                    # Callers sending the same body to the same endpoint at the same time get the
+                    # result of a single upstream call. One of them going away doesn't stop it.
+                    status_code, content, media_type = await flight.do(
+                        (endpoint, payload.body()),
+                        lambda: post_upstream(pool, endpoint, payload, validate_json, models, timings),
+                    )
+                else:
+                    status_code, content, media_type = await post_upstream(pool, endpoint, payload, validate_json, models, timings)
+
+                if ctx is not None:
+                    ctx.upstream_end = time.perf_counter()
+                    usage = usage_from_body(content)
+                if timings is not None and "upstream" not in timings.phases:
+                    # Waited for another caller's identical request
+                    timings.add("upstream", ctx.upstream_end - ctx.upstream_start)
+                # Relay the upstream bytes as they are
+                return Response(content=content, status_code=status_code, media_type=media_type)
+            finally:
+                finish(usage)
+
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise upstream_error(exc)
+
+# The app's forward_request options: request coalescing, upstream JSON validation, stream deadlines and model residency
+def upstream_options(app) -> Dict[str, Any]:
+    settings: Settings = app.state.settings
+    return {
+        "flight": app.state.upstream_flight,
+        "validate_json": settings.VALIDATE_UPSTREAM_JSON,
+        "first_byte_timeout": settings.UPSTREAM_FIRST_BYTE_TIMEOUT,
+        "idle_timeout": settings.UPSTREAM_IDLE_TIMEOUT,
+        "models": app.state.model_manager,
+    }
+
+async def wait_for_disconnect(request: Request):
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+# Run `awaitable` (typically waiting for upstream capacity and for Ollama's answer) and cancel it
+# as soon as the client disconnects, so its queue slot and the GPU aren't spent on an answer
+# nobody will read. Once a stream has started, its response takes care of that itself.
+async def until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    task = asyncio.ensure_future(awaitable)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait((task, disconnected), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnected.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait((task,))
+    if task.cancelled():
+        raise HTTPException(status_code=499, detail="Client closed the request")
+    return task.result()  # Also when the answer came in just as the client left, so it gets closed properly
 
 # Helper function to forward GET requests
-async def forward_get_request(endpoint: str) -> Response:
-    url = f"{settings.OLLAMA_BASE_URL}{endpoint}"
-    logger.debug(f"Forwarding GET request to {url}")
+async def forward_get_request(pool: BackendPool, endpoint: str) -> Response:
+    logger.debug("Forwarding GET request to %s", endpoint)
     try:
-        async with httpx.AsyncClient(timeout=None) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            content = await response.aread()
-            return Response(
-                content=content,
-                status_code=response.status_code,
-                media_type=response.headers.get('Content-Type', 'application/json')
-            )
-    except httpx.HTTPStatusError as exc:
-        logger.error(f"Error response {exc.response.status_code} from Ollama: {exc.response.text}")
-        raise HTTPException(status_code=exc.response.status_code, detail=exc.response.text)
-    except httpx.RequestError as exc:
-        logger.error(f"Request forwarding failed: {exc}")
-        raise HTTPException(status_code=500, detail=f"Request forwarding failed: {exc}")
-    except Exception as e:
-        logger.error(f"Unhandled exception: {e}")
-        raise HTTPException(status_code=500, detail="Request forwarding failed")
+        async with pool.acquire() as backend:
+            try:
+                response = await pool.client.get(f"{backend.url}{endpoint}")
+            except httpx.RequestError as exc:
+                pool.report_failure(backend, str(exc))
+                raise
+        response.raise_for_status()
+        content = await response.aread()
+        return Response(
+            content=content,
+            status_code=response.status_code,
+            media_type=response.headers.get('Content-Type', 'application/json')
+        )
+    except Exception as exc:
+        raise upstream_error(exc)
+
+# /api/tags across several backends: the union of their model lists (first listing of a name wins)
+async def merged_tags(pool: BackendPool) -> Response:
+    backends = pool.healthy_backends() or pool.backends
+
+    async def fetch(backend):
+        response = await pool.client.get(f"{backend.url}/api/tags")
+        response.raise_for_status()
+        return orjson.loads(response.content).get("models") or []
+
+    results = await asyncio.gather(*(fetch(backend) for backend in backends), return_exceptions=True)
+    models = {}
+    for backend, result in zip(backends, results):
+        if isinstance(result, Exception):
+            logger.error("Tags request to %s failed: %s", backend.url, result)
+            continue
+        for model in result:
+            models.setdefault(model.get("name"), model)
+
+    if all(isinstance(result, Exception) for result in results):
+        raise HTTPException(status_code=502, detail="Request forwarding failed")
+    return Response(content=orjson.dumps({"models": list(models.values())}), media_type="application/json")
+
+# Model list from the upstream: the backend's own answer, or the merged one with several backends
+async def fetch_tags(pool: BackendPool) -> Response:
+    if len(pool.backends) > 1:
+        return await merged_tags(pool)
+    return await forward_get_request(pool, endpoint="/api/tags")
 
 # APIs #####################################################################################
 
+# How a stream of the route is re-chunked: the route's STREAM_FLUSH_ROUTES interval (else
+# STREAM_FLUSH_INTERVAL_MS) and STREAM_FLUSH_MAX_BYTES, unless the client's X-Stream-Flush-Ms and
+# X-Stream-Flush-Bytes headers say otherwise. None relays Ollama's chunks as they come.
+def stream_flush(request: Request, route: str) -> Optional[FlushPolicy]:
+    settings: Settings = request.app.state.settings
+    try:
+        return flush_policy(
+            settings.STREAM_FLUSH_ROUTES.get(route, settings.STREAM_FLUSH_INTERVAL_MS),
+            settings.STREAM_FLUSH_MAX_BYTES,
+            request.headers.get(INTERVAL_HEADER),
+            request.headers.get(MAX_BYTES_HEADER),
+            settings.STREAM_FLUSH_MAX_CLIENT_MS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# Forward a /generate or /chat request. Deterministic ones (temperature 0 or a fixed seed) are
+# answered from the response cache when it is on, unless the key opted out or the client sent
+# Cache-Control: no-cache (don't read the cache) or no-store (don't read or fill it).
+async def forward_generation(
+    request: Request,
+    route: str,
+    payload: Payload,
+    principal: Principal,
+    pool: BackendPool,
+    admission: AdmissionController,
+    scheduler: Optional[FairScheduler],
+    response_cache: Optional[ResponseCache],
+) -> Response:
+    flush = stream_flush(request, route) if payload.stream else None
+    cache_key = None
+    if response_cache is not None and principal.cache_responses != 0 and is_deterministic(payload):
+        cache_control = request.headers.get("cache-control", "")
+        if "no-store" not in cache_control:
+            cache_key = response_cache.key(route, payload)
+            body = response_cache.get(cache_key) if "no-cache" not in cache_control else None
+            if body is not None:
+                if payload.stream:
+                    return response_cache.replay_stream(body, flush.max_bytes if flush is not None else 0)
+                return Response(content=body, media_type="application/json")
+
+    ctx = new_context(request, principal, route, payload.model)
+
+    async def admit_and_forward() -> Response:
+        await admit(ctx, admission, scheduler, payload.model, payload.stream)
+        return await forward_request(
+            pool, endpoint=f"/api/{route}", payload=payload, stream=payload.stream, ctx=ctx, flush=flush,
+            **upstream_options(request.app)
+        )
+
+    response = await until_disconnected(request, admit_and_forward())
+    if cache_key is not None:
+        if payload.stream:
+            response_cache.record_stream(response, cache_key, payload.model)
+        elif response.status_code == 200:
+            response_cache.set(cache_key, payload.model, response.body)
+    return response
+
+# Request models of the routes a batch job can call
+BATCH_ROUTES: Dict[str, Type[BaseRequest]] = {"generate": GenerateRequest, "chat": ChatRequest, "embed": EmbedRequest}
+
+# Send one request of a batch job (see libs/batch.py) as the job's key: validated, admitted,
+# scheduled and counted like an interactive request, but never streamed. Returns Ollama's body,
+# failures raise HTTPException (or RateLimitExceeded, which the job waits out).
+async def forward_batch_request(app, principal: Principal, route: str, raw: bytes) -> bytes:
+    try:
+        payload = parse_payload(raw, BATCH_ROUTES[route], app.state.settings.REQUEST_PASSTHROUGH)
+    except RequestValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors()))
+    if payload.stream:
+        payload.update({"stream": False})  # One JSON document per result line
+    if route == "embed":
+        encoding_format, dtype = payload.pop(FORMAT_FIELD), payload.pop(DTYPE_FIELD)
+        if encoding_format not in (None, "float") or dtype not in (None, "float32"):
+            raise HTTPException(status_code=422, detail="Batch results are JSON, the binary embedding encodings are not available")
+
+    ctx = RequestContext(principal, route, payload.model)
+    usage_recorder: Optional[UsageRecorder] = app.state.usage_recorder
+    if usage_recorder is not None:
+        ctx.on_finish(usage_recorder.record)
+    await admit(ctx, app.state.admission, app.state.scheduler, payload.model, stream=False)
+    response = await forward_request(
+        app.state.backend_pool, endpoint=f"/api/{route}", payload=payload, stream=False, ctx=ctx, **upstream_options(app)
+    )
+    return response.body
+
+# Answer /embed with Ollama's JSON body, re-encoded when the client asked for a binary encoding
+# (see libs/embed_encoding.py), and JSON compressed when it is large and the client accepts it
+async def embeddings_response(request: Request, body: bytes, encoding: Optional[EmbedEncoding], compression_min_bytes: int) -> Response:
+    media_type, headers = "application/json", {}
+    with timed(get_timings(request), "encode"):
+        if encoding is not None:
+            try:
+                body, media_type, headers = encode(body, encoding)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.error("Could not encode the embeddings: %s", e)
+                raise HTTPException(status_code=502, detail="Invalid embeddings response from Ollama")
+
+        if media_type == "application/json" and compression_min_bytes > 0:
+            headers["Vary"] = "Accept-Encoding"
+            if len(body) >= compression_min_bytes:
+                coding = negotiate(request.headers.get("accept-encoding"))
+                if coding is not None:
+                    body = await run_in_threadpool(compress, body, coding)  # Off the event loop
+                    headers["Content-Encoding"] = coding
+    return Response(content=body, media_type=media_type, headers=headers)
+
 # Route handlers
-@router.post("/generate")
-async def generate(request_data: GenerateRequest, api_key: str = Security(get_api_key)):
-    username = token_manager.get_user_by_token(api_key)
-    logger.debug(f"Generate request made by user: {username}")
+@router.post("/generate", openapi_extra=request_body_schema(GenerateRequest))
+async def generate(
+    request: Request,
+    principal: Principal = Security(check_rate_limit),
+    pool: BackendPool = Depends(get_backend_pool),
+    admission: AdmissionController = Depends(get_admission),
+    scheduler: Optional[FairScheduler] = Depends(get_scheduler),
+    response_cache: Optional[ResponseCache] = Depends(get_response_cache),
+):
+    username = principal.user
+    logger.debug("Generate request made by user: %s", username)
 
     # Prepare payload for forwarding
-    payload = request_data.model_dump(exclude_unset=True)
-    payload.update(request_data.extra_params)
-
-    return await forward_request(endpoint="/api/generate", payload=payload, stream=request_data.stream)
-
-@router.post("/chat")
-async def chat(request_data: ChatRequest, api_key: str = Security(get_api_key)):
-    username = token_manager.get_user_by_token(api_key)
-    logger.debug(f"Chat request made by user: {username}")
-
-    payload = request_data.model_dump(exclude_unset=True)
-    payload.update(request_data.extra_params)
-
-    return await forward_request(endpoint="/api/chat", payload=payload, stream=request_data.stream)
-
-class EmbedRequest(BaseRequest):
-    input: str
-
-@router.post("/embed")
-async def embed(request_data: EmbedRequest, api_key: str = Security(get_api_key)):
-    username = token_manager.get_user_by_token(api_key)
-    logger.debug(f"Embeddings request made by user: {username}")
+    payload = await read_payload(request, GenerateRequest)
+
+    return await forward_generation(request, "generate", payload, principal, pool, admission, scheduler, response_cache)
+
+@router.post("/chat", openapi_extra=request_body_schema(ChatRequest))
+async def chat(
+    request: Request,
+    principal: Principal = Security(check_rate_limit),
+    pool: BackendPool = Depends(get_backend_pool),
+    admission: AdmissionController = Depends(get_admission),
+    scheduler: Optional[FairScheduler] = Depends(get_scheduler),
+    response_cache: Optional[ResponseCache] = Depends(get_response_cache),
+):
+    username = principal.user
+    logger.debug("Chat request made by user: %s", username)
 
-    payload = request_data.model_dump(exclude_unset=True)
-    payload.update(request_data.extra_params)
+    # Prepare payload for forwarding
+    payload = await read_payload(request, ChatRequest)
+
+    return await forward_generation(request, "chat", payload, principal, pool, admission, scheduler, response_cache)
+
+@router.post("/embed", openapi_extra=request_body_schema(EmbedRequest))
+async def embed(
+    request: Request,
+    principal: Principal = Security(check_rate_limit),
+    pool: BackendPool = Depends(get_backend_pool),
+    admission: AdmissionController = Depends(get_admission),
+    scheduler: Optional[FairScheduler] = Depends(get_scheduler),
+    embed_cache: Optional[EmbedCache] = Depends(get_embed_cache),
+    embed_batcher: Optional[EmbedBatcher] = Depends(get_embed_batcher),
+):
+    username = principal.user
+    logger.debug("Embeddings request made by user: %s", username)
 
-    return await forward_request(endpoint="/api/embed", payload=payload, stream=request_data.stream)
+    # Prepare payload for forwarding
+    payload = await read_payload(request, EmbedRequest)
+    try:
+        encoding = parse_encoding(request.headers.get("accept"), payload.pop(FORMAT_FIELD), payload.pop(DTYPE_FIELD))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if encoding is not None and not encodings_available():
+        raise HTTPException(status_code=406, detail=f"The {encoding.format} encoding needs numpy, which is not installed on the server")
+    compression_min_bytes = request.app.state.settings.EMBED_COMPRESSION_MIN_BYTES
+
+    # /api/embed answers with a single JSON document, so it is always fetched whole: to be cached,
+    # split from a batch or shared between identical requests
+    cache_key = None
+    if embed_cache is not None:
+        cache_key = embed_cache.key(payload)
+        body = await embed_cache.get(cache_key)
+        if body is not None:
+            return await embeddings_response(request, body, encoding, compression_min_bytes)
+
+    ctx = new_context(request, principal, "embed", payload.model)
+
+    async def admit_and_forward() -> bytes:
+        if embed_batcher is not None:
+            # The batcher takes the model slot for each batch's upstream call, callers waiting on it don't take one
+            await admit(ctx, admission, scheduler, None, stream=False)
+            body = None
+            try:
+                with timed(ctx.timings, "upstream"):
+                    body = await embed_batcher.embed(payload)
+            finally:
+                ctx.finish(usage_from_body(body) if body is not None else None)
+            return body
+        await admit(ctx, admission, scheduler, payload.model, stream=False)
+        response = await forward_request(
+            pool, endpoint="/api/embed", payload=payload, stream=False, ctx=ctx, **upstream_options(request.app)
+        )
+        return response.body
+
+    body = await until_disconnected(request, admit_and_forward())
+    if cache_key is not None:
+        embed_cache.set(cache_key, payload.model, body)
+    return await embeddings_response(request, body, encoding, compression_min_bytes)
 
 @router.get("/tags")
-async def get_tags(api_key: str = Security(get_api_key)):
-    username = token_manager.get_user_by_token(api_key)
-    logger.debug(f"Tags request made by user: {username}")
-
-    return await forward_get_request(endpoint="/api/tags")
+async def get_tags(
+    request: Request,
+    principal: Principal = Security(check_rate_limit),
+    pool: BackendPool = Depends(get_backend_pool),
+    tags_cache: Optional[TagsCache] = Depends(get_tags_cache),
+    settings: Settings = Depends(get_settings),
+):
+    username = principal.user
+    logger.debug("Tags request made by user: %s", username)
+
+    if tags_cache is None:
+        return await fetch_tags(pool)
+
+    body, etag = await tags_cache.get()
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(settings.TAGS_CACHE_TTL)}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Prometheus scrape endpoint, with an admin key (Prometheus sends it with `authorization: {credentials: ...}`)
+@router.get("/metrics", dependencies=[Security(get_admin_principal)])
+async def get_metrics_text(
+    pool: BackendPool = Depends(get_backend_pool),
+    metrics: Optional[GatewayMetrics] = Depends(get_metrics),
+    models: ModelManager = Depends(get_model_manager),
+):
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    metrics.set_backends(pool.stats())
+    metrics.set_model_loads(models.cold_requests, models.loads)
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
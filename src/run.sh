@@ -1,3 +1,3 @@
 #!/bin/bash
 
-uvicorn main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
+uvicorn --factory main:create_app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
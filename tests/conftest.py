@@ -0,0 +1,163 @@
+# tests/conftest.py
+"""
+Fixtures running the gateway against fake Ollama servers (bench/fake_ollama.py), all in this
+process: every app is served by uvicorn from a thread of its own, on a free local port.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+import pytest
+import uvicorn
+
+from fake_ollama import FakeConfig, create_app as create_fake_app
+from libs.token_manager import TokenManager
+from main import create_app
+from models import Settings
+
+USERS = ("alice", "bob", "admin")
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5.0, message: str = "condition"):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Timed out waiting for {message}")
+        time.sleep(0.01)
+
+class ServerThread:
+    """Serve an ASGI app with uvicorn from a daemon thread, on a free port of 127.0.0.1."""
+
+    def __init__(self, app):
+        self.app = app
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> "ServerThread":
+        self.thread.start()
+        wait_until(lambda: self.server.started or not self.thread.is_alive(), timeout=15, message="server start")
+        if not self.server.started:
+            raise RuntimeError("Server failed to start")
+        return self
+
+    @property
+    def url(self) -> str:
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=15)
+
+class FakeBackend:
+    """
+    A fake Ollama behind an ASGI wrapper recording what it was asked: requests per path,
+    requests in progress (and the most at once), and responses the client abandoned (it disconnected before the
+    last body chunk). With `down` set, every request gets a 503.
+    """
+
+    def __init__(self, config: FakeConfig):
+        self.app = create_fake_app(config)
+        self.requests: Counter = Counter()
+        self.disconnects: Counter = Counter()
+        self.in_progress = 0
+        self.max_in_progress = 0
+        self.down = False
+        self.server = ServerThread(self).start()
+        self.url = self.server.url
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        self.requests[path] += 1
+        if self.down:
+            await send({"type": "http.response.start", "status": 503, "headers": []})
+            await send({"type": "http.response.body", "body": b"down"})
+            return
+
+        complete = False
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.disconnect" and not complete:
+                self.disconnects[path] += 1
+            return message
+
+        async def send_wrapper(message):
+            nonlocal complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                complete = True
+            await send(message)
+
+        self.in_progress += 1
+        self.max_in_progress = max(self.max_in_progress, self.in_progress)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            self.in_progress -= 1
+
+@pytest.fixture
+def fake_backend():
+    """Factory of fake Ollama servers: fake_backend(token_rate=..., models=[...]) -> FakeBackend."""
+    backends: List[FakeBackend] = []
+
+    def start(**config) -> FakeBackend:
+        config.setdefault("ttft", 0.0)
+        config.setdefault("tokens", 4)
+        config.setdefault("token_rate", 1000.0)
+        config.setdefault("embed_dim", 4)
+        backend = FakeBackend(FakeConfig(**config))
+        backends.append(backend)
+        return backend
+
+    yield start
+    for backend in backends:
+        backend.server.stop()
+
+class Gateway:
+    def __init__(self, app, server: ServerThread, tokens: Dict[str, str]):
+        self.app = app
+        self.server = server
+        self.url = server.url
+        self.tokens = tokens  # User -> API key
+
+    def headers(self, user: str = "alice") -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+@pytest.fixture
+def gateway(tmp_path):
+    """
+    Factory of gateways: gateway([backend, ...], SETTING=value, ...) -> Gateway, with an API key
+    for each of USERS ("admin" is in ADMIN_USERS).
+    """
+    servers: List[ServerThread] = []
+
+    def start(backends: List[str], **overrides) -> Gateway:
+        values = {
+            "TOKEN_DB_PATH": str(tmp_path / f"tokens{len(servers)}.db"),
+            "OLLAMA_BASE_URLS": backends,
+            "LOG_FILE": "",
+            "LOG_LEVEL": "WARNING",
+            "ADMIN_USERS": ["admin"],
+            "BACKEND_HEALTH_INTERVAL": 60.0,
+            "MODEL_PS_INTERVAL": 60.0,
+        }
+        values.update(overrides)
+        settings = Settings(**values)
+        token_manager = TokenManager(settings=settings)
+        tokens = {user: token_manager.generate_token(user, "test") for user in USERS}
+        token_manager.close()
+        app = create_app(settings)
+        server = ServerThread(app).start()
+        servers.append(server)
+        return Gateway(app, server, tokens)
+
+    yield start
+    for server in servers:
+        server.stop()
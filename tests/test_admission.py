@@ -0,0 +1,60 @@
+# tests/test_admission.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from libs.rate_limiter import AdmissionController, RateLimitExceeded
+from libs.request_context import RequestContext
+from libs.token_manager import Principal
+
+def test_embed_batches_take_model_slots(fake_backend, gateway):
+    backend = fake_backend(ttft=0.1)
+    gw = gateway([backend.url], EMBED_BATCH_ENABLED=True, MODEL_MAX_CONCURRENCY=1)
+
+    def embed(i: int) -> int:
+        # Different options, so every call is a batch of its own
+        body = {"model": "nomic-embed-text", "input": ["a"], "options": {"num_ctx": 1024 + i}}
+        with httpx.Client(base_url=gw.url, timeout=10) as client:
+            return client.post("/api/embed", json=body, headers=gw.headers()).status_code
+
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(embed, range(4))) == [200] * 4
+    assert backend.requests["/api/embed"] == 4
+    assert backend.max_in_progress == 1
+
+@pytest.mark.anyio
+async def test_stream_cap_counts_streams_waiting_for_the_model():
+    admission = AdmissionController(model_max_concurrency=1, queue_timeout=0.2)
+    principal = Principal("1", "alice", "test", None, max_concurrent_streams=1)
+    busy = RequestContext(Principal("2", "bob", "test", None), "generate")
+    await admission.acquire(busy, "llama3.2", stream=False)  # Holds the model's only slot
+
+    waiting = asyncio.ensure_future(admission.acquire(RequestContext(principal, "generate"), "llama3.2", stream=True))
+    await asyncio.sleep(0.01)
+    with pytest.raises(RateLimitExceeded, match="concurrent streams"):
+        await admission.acquire(RequestContext(principal, "generate"), "llama3.2", stream=True)
+
+    with pytest.raises(RateLimitExceeded, match="at capacity"):
+        await waiting
+    busy.finish()
+    # The stream that gave up in line no longer counts
+    ctx = RequestContext(principal, "generate")
+    await admission.acquire(ctx, "llama3.2", stream=True)
+    ctx.finish()
+
+@pytest.mark.anyio
+async def test_cancelled_stream_gives_back_its_count():
+    admission = AdmissionController(model_max_concurrency=1)
+    principal = Principal("1", "alice", "test", None, max_concurrent_streams=1)
+    busy = RequestContext(Principal("2", "bob", "test", None), "generate")
+    await admission.acquire(busy, "llama3.2", stream=False)
+
+    waiting = asyncio.ensure_future(admission.acquire(RequestContext(principal, "generate"), "llama3.2", stream=True))
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    busy.finish()
+    await admission.acquire(RequestContext(principal, "generate"), "llama3.2", stream=True)
@@ -0,0 +1,96 @@
+# tests/test_backend_pool.py
+import socket
+
+import httpx
+import pytest
+
+from libs.backend_pool import BackendPool
+
+GENERATE = {"model": "llama3.2", "prompt": "Why is the sky blue?", "stream": False}
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+# Selection ###############################################################################
+
+@pytest.mark.anyio
+async def test_select_prefers_least_outstanding(fake_backend):
+    a, b = fake_backend(), fake_backend()
+    async with httpx.AsyncClient() as client:
+        pool = BackendPool([a.url, b.url], client)
+        async with pool.acquire("llama3.2") as busy:
+            assert busy.outstanding == 1
+            assert all(pool.select("llama3.2") is not busy for _ in range(4))
+        assert [backend.outstanding for backend in pool.backends] == [0, 0]
+
+@pytest.mark.anyio
+async def test_requests_spread_over_backends(fake_backend):
+    a, b = fake_backend(), fake_backend()
+    async with httpx.AsyncClient() as client:
+        pool = BackendPool([a.url, b.url], client)
+        await pool.check_all()
+        for _ in range(6):
+            async with pool.acquire("llama3.2") as backend:
+                response = await client.post(f"{backend.url}/api/generate", json=GENERATE)
+                assert response.status_code == 200
+    assert a.requests["/api/generate"] == b.requests["/api/generate"] == 3
+
+# Ejection and re-admission ###############################################################
+
+@pytest.mark.anyio
+async def test_health_checks_eject_and_readmit(fake_backend):
+    a, b = fake_backend(), fake_backend()
+    async with httpx.AsyncClient() as client:
+        pool = BackendPool([a.url, b.url], client, failure_threshold=2)
+        await pool.check_all()
+        assert [backend.healthy for backend in pool.backends] == [True, True]
+
+        a.down = True
+        await pool.check_all()
+        assert pool.backends[0].healthy  # One failure is below the threshold
+        await pool.check_all()
+        assert not pool.backends[0].healthy
+        assert all(pool.select("llama3.2") is pool.backends[1] for _ in range(4))
+
+        a.down = False
+        await pool.check_all()
+        assert pool.backends[0].healthy and pool.backends[0].failures == 0
+        assert {pool.select("llama3.2").url for _ in range(4)} == {a.url, b.url}
+
+@pytest.mark.anyio
+async def test_unreachable_backend_is_ejected(fake_backend):
+    live = fake_backend()
+    dead = closed_port_url()
+    async with httpx.AsyncClient() as client:
+        pool = BackendPool([dead, live.url], client, failure_threshold=2)
+        await pool.check_all()
+        await pool.check_all()
+        assert [backend.healthy for backend in pool.backends] == [False, True]
+        assert pool.backends[0].last_error
+        assert all(pool.select("llama3.2").url == live.url for _ in range(4))
+
+@pytest.mark.anyio
+async def test_all_ejected_still_tries_every_backend(fake_backend):
+    a, b = fake_backend(), fake_backend()
+    a.down = b.down = True
+    async with httpx.AsyncClient() as client:
+        pool = BackendPool([a.url, b.url], client, failure_threshold=1)
+        await pool.check_all()
+        assert pool.healthy_backends() == []
+        assert {pool.select("llama3.2").url for _ in range(4)} == {a.url, b.url}
+
+# Model-aware routing #####################################################################
+
+@pytest.mark.anyio
+async def test_routes_to_backends_listing_the_model(fake_backend):
+    chat = fake_backend(models=["llama3.2:latest"])
+    embeddings = fake_backend(models=["nomic-embed-text:latest"])
+    async with httpx.AsyncClient() as client:
+        pool = BackendPool([chat.url, embeddings.url], client)
+        await pool.check_all()
+        assert all(pool.select("llama3.2").url == chat.url for _ in range(4))
+        assert all(pool.select("nomic-embed-text:latest").url == embeddings.url for _ in range(4))
+        # No server lists it: any of them may answer, Ollama gives the 404
+        assert {pool.select("qwen2.5").url for _ in range(4)} == {chat.url, embeddings.url}
@@ -0,0 +1,78 @@
+# tests/test_batches.py
+import asyncio
+import time
+
+import httpx
+import orjson
+import pytest
+
+from conftest import wait_until
+from libs.batch import BatchRunner, _Job
+from libs.rate_limiter import RateLimitExceeded
+from libs.token_manager import Principal
+from libs.token_store import TokenStore
+
+def test_cancel_by_another_key_leaves_job_running(fake_backend, gateway, tmp_path):
+    backend = fake_backend(ttft=0.2)
+    gw = gateway([backend.url], BATCH_ENABLED=True, BATCH_DIR=str(tmp_path / "batches"), BATCH_CONCURRENCY=1)
+    lines = "\n".join('{"model": "nomic-embed-text", "input": "a"}' for _ in range(20))
+    with httpx.Client(base_url=gw.url) as client:
+        response = client.post("/api/batches?endpoint=embed", content=lines, headers=gw.headers("alice"))
+        assert response.status_code == 201
+        job_id = response.json()["id"]
+        wait_until(lambda: backend.requests["/api/embed"] > 0, message="the job to start")
+
+        assert client.post(f"/api/batches/{job_id}/cancel", headers=gw.headers("bob")).status_code == 404
+        assert client.delete(f"/api/batches/{job_id}", headers=gw.headers("bob")).status_code == 404
+        requests = backend.requests["/api/embed"]
+        wait_until(lambda: backend.requests["/api/embed"] > requests, message="the job to go on")
+        assert client.get(f"/api/batches/{job_id}", headers=gw.headers("alice")).json()["status"] == "running"
+
+        response = client.post(f"/api/batches/{job_id}/cancel", headers=gw.headers("alice"))
+        assert response.status_code == 200 and response.json()["status"] == "cancelled"
+
+PRINCIPAL = Principal(*["x"] * len(Principal._fields))
+
+@pytest.fixture
+def runner(tmp_path):
+    """A BatchRunner whose requests are all answered with 429, counted in runner.sent."""
+    store = TokenStore(str(tmp_path / "tokens.db"))
+
+    async def send(principal, route, body):
+        runner.sent += 1
+        raise RateLimitExceeded("Too many requests", retry_after=0.1)
+
+    runner = BatchRunner(store, str(tmp_path / "batches"), send, lambda user_id: None, max_rate_limited_wait=1.5)
+    runner.sent = 0
+    yield runner
+    runner._io.shutdown(wait=True)  # Never started, close() has nothing else to stop
+    store.close()
+
+@pytest.mark.anyio
+async def test_rate_limited_request_gives_up(runner):
+    job = _Job("job", "user", "embed", 1)
+    start = time.monotonic()
+    result, ok = await runner._execute(job, PRINCIPAL, 1, b'{"model": "nomic-embed-text", "input": "a"}\n')
+    # Waits of 1 second (the least Retry-After) and the half second left, then it fails
+    assert not ok and orjson.loads(result)["status"] == 429
+    assert runner.sent == 3 and 1.4 < time.monotonic() - start < 2.5
+
+@pytest.mark.anyio
+async def test_stopped_job_sends_no_more_tries(runner):
+    job = _Job("job", "user", "embed", 1)
+    execute = asyncio.ensure_future(runner._execute(job, PRINCIPAL, 1, b'{"input": "a"}\n'))
+    await asyncio.sleep(0.1)
+    job.stopped = True  # As cancel() and the claim renewals mark it
+    with pytest.raises(asyncio.CancelledError):
+        await execute
+    assert runner.sent == 1
+
+def test_cancel_only_stops_active_jobs(fake_backend, gateway, tmp_path):
+    gw = gateway([fake_backend().url], BATCH_ENABLED=True, BATCH_DIR=str(tmp_path / "batches"))
+    with httpx.Client(base_url=gw.url) as client:
+        response = client.post("/api/batches?endpoint=embed", content='{"model": "nomic-embed-text", "input": "a"}', headers=gw.headers())
+        job_id = response.json()["id"]
+        url = f"/api/batches/{job_id}"
+        wait_until(lambda: client.get(url, headers=gw.headers()).json()["status"] == "completed", message="the job to complete")
+        response = client.post(f"{url}/cancel", headers=gw.headers())
+        assert response.status_code == 200 and response.json()["status"] == "completed"
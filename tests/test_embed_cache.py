@@ -0,0 +1,27 @@
+# tests/test_embed_cache.py
+import pytest
+
+from libs.embed_cache import EmbedCache
+from libs.payload import Payload
+
+def cached(cache: EmbedCache, model: str) -> str:
+    key = cache.key(Payload({"model": model, "input": ["a"]}))
+    cache.set(key, model, b'{"embeddings": [[0.1]]}')
+    return key
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("stored, invalidated", [
+    ("nomic-embed-text", "nomic-embed-text:latest"),
+    ("nomic-embed-text:latest", "nomic-embed-text"),
+])
+async def test_invalidate_matches_normalized_model_names(tmp_path, stored, invalidated):
+    cache = EmbedCache(max_bytes=1 << 20, disk_path=str(tmp_path / "embed.db"))
+    try:
+        key = cached(cache, stored)
+        other = cached(cache, "all-minilm")
+        await cache.disk.run(lambda: None)  # Let the disk writes land
+        assert await cache.invalidate(invalidated) == {"memory": 1, "disk": 1}
+        assert await cache.get(key) is None
+        assert await cache.get(other) is not None
+    finally:
+        cache.close()
@@ -0,0 +1,45 @@
+# tests/test_embed_encoding.py
+import io
+
+import httpx
+import pytest
+
+import routes
+
+EMBED = {"model": "nomic-embed-text", "input": ["one", "two"]}
+
+def post_embed(gw, headers=None, **fields):
+    return httpx.post(f"{gw.url}/api/embed", json=dict(EMBED, **fields), headers=dict(gw.headers(), **(headers or {})), timeout=10)
+
+def test_binary_encoding(fake_backend, gateway):
+    numpy = pytest.importorskip("numpy")
+    gw = gateway([fake_backend(embed_dim=4).url])
+    expected = post_embed(gw).json()["embeddings"]
+
+    response = post_embed(gw, headers={"Accept": "application/octet-stream; dtype=float16"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["x-embedding-shape"] == "2,4" and response.headers["x-embedding-dtype"] == "float16"
+    vectors = numpy.frombuffer(response.content, dtype="<f2").reshape(2, 4)
+    assert numpy.allclose(vectors, expected, atol=1e-3)
+
+def test_npy_encoding(fake_backend, gateway):
+    numpy = pytest.importorskip("numpy")
+    gw = gateway([fake_backend(embed_dim=4).url])
+    expected = post_embed(gw).json()["embeddings"]
+
+    response = post_embed(gw, encoding_format="npy")
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-npy"
+    vectors = numpy.load(io.BytesIO(response.content), allow_pickle=False)
+    assert vectors.dtype == numpy.float32 and vectors.shape == (2, 4)
+    assert numpy.allclose(vectors, expected)
+
+def test_binary_encodings_need_numpy(fake_backend, gateway, monkeypatch):
+    monkeypatch.setattr(routes, "encodings_available", lambda: False)
+    backend = fake_backend()
+    gw = gateway([backend.url])
+    for fields in ({"encoding_format": "npy"}, {"encoding_format": "base64"}):
+        response = post_embed(gw, **fields)
+        assert response.status_code == 406 and "needs numpy" in response.json()["detail"]
+    assert post_embed(gw, headers={"Accept": "application/octet-stream"}).status_code == 406
+    assert post_embed(gw).status_code == 200  # Ollama's JSON needs nothing
+    assert backend.requests["/api/embed"] == 1
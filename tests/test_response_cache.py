@@ -0,0 +1,49 @@
+# tests/test_response_cache.py
+import httpx
+import pytest
+
+from libs.payload import Payload
+from libs.response_cache import ResponseCache
+
+DETERMINISTIC = {"model": "llama3.2", "prompt": "Why is the sky blue?", "stream": False, "options": {"temperature": 0}}
+
+def test_key_normalization():
+    key = ResponseCache.key
+    base = key("generate", Payload({"model": "llama3.2", "prompt": "hi", "options": {"temperature": 0, "seed": 1}}))
+    # Model aliases, options ordering and the fields that don't change the answer
+    assert key("generate", Payload({"options": {"seed": 1, "temperature": 0}, "prompt": "hi", "model": "llama3.2:latest"})) == base
+    assert key("generate", Payload({"model": "llama3.2", "prompt": "hi", "options": {"temperature": 0, "seed": 1}, "keep_alive": "5m"})) == base
+    # What does change it
+    assert key("chat", Payload({"model": "llama3.2", "prompt": "hi", "options": {"temperature": 0, "seed": 1}})) != base
+    assert key("generate", Payload({"model": "llama3.2:1b", "prompt": "hi", "options": {"temperature": 0, "seed": 1}})) != base
+    assert key("generate", Payload({"model": "llama3.2", "prompt": "hi", "options": {"temperature": 0, "seed": 2}})) != base
+    assert key("generate", Payload({"model": "llama3.2", "prompt": "hi", "options": {"temperature": 0, "seed": 1}, "stream": False})) != base
+
+@pytest.mark.parametrize("second_model", ["llama3.2", "llama3.2:latest"])
+def test_repeated_request_reaches_backend_once(fake_backend, gateway, second_model):
+    backend = fake_backend()
+    gw = gateway([backend.url], RESPONSE_CACHE_ENABLED=True)
+    with httpx.Client(base_url=gw.url) as client:
+        first = client.post("/api/generate", json=DETERMINISTIC, headers=gw.headers())
+        second = client.post("/api/generate", json=dict(DETERMINISTIC, model=second_model), headers=gw.headers("bob"))
+        assert first.status_code == second.status_code == 200
+        assert second.content == first.content
+        assert backend.requests["/api/generate"] == 1
+
+        client.post("/api/generate", json=dict(DETERMINISTIC, options={"temperature": 0.7}), headers=gw.headers())
+        assert backend.requests["/api/generate"] == 2  # Not deterministic, never cached
+
+@pytest.mark.parametrize("alias", ["llama3.2", "llama3.2:latest"])
+def test_invalidate_by_model_alias(fake_backend, gateway, alias):
+    backend = fake_backend()
+    gw = gateway([backend.url], RESPONSE_CACHE_ENABLED=True)
+    with httpx.Client(base_url=gw.url) as client:
+        client.post("/api/generate", json=DETERMINISTIC, headers=gw.headers())
+        client.post("/api/generate", json=dict(DETERMINISTIC, model="nomic-embed-text"), headers=gw.headers())
+        assert client.get("/api/admin/cache/responses", headers=gw.headers("admin")).json()["entries"] == 2
+
+        response = client.delete("/api/admin/cache/responses", params={"model": alias}, headers=gw.headers("admin"))
+        assert response.json() == {"model": alias, "dropped": 1}
+        client.post("/api/generate", json=DETERMINISTIC, headers=gw.headers())
+        client.post("/api/generate", json=dict(DETERMINISTIC, model="nomic-embed-text"), headers=gw.headers())
+    assert backend.requests["/api/generate"] == 3  # Only the invalidated model was asked again
@@ -0,0 +1,66 @@
+# tests/test_routing.py
+"""Routing through the whole gateway, against the benchmark's fake Ollama (see conftest.py)."""
+import socket
+
+import httpx
+
+from conftest import wait_until
+
+GENERATE = {"model": "llama3.2", "prompt": "Why is the sky blue?", "stream": False}
+EMBED = {"model": "nomic-embed-text", "input": ["a", "b"]}
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+def test_requests_spread_over_backends(fake_backend, gateway):
+    a, b = fake_backend(loaded=["llama3.2"]), fake_backend(loaded=["llama3.2"])
+    gw = gateway([a.url, b.url], MODEL_PS_INTERVAL=0.05)
+    wait_until(lambda: len(gw.app.state.model_manager.resident()) == 2, message="residency poll")
+    with httpx.Client(base_url=gw.url) as client:
+        for _ in range(6):
+            assert client.post("/api/generate", json=GENERATE, headers=gw.headers()).status_code == 200
+    assert a.requests["/api/generate"] == b.requests["/api/generate"] == 3
+
+def test_failed_requests_eject_unreachable_backend(fake_backend, gateway):
+    live = fake_backend()
+    dead = closed_port_url()
+    gw = gateway([dead, live.url], BACKEND_FAILURE_THRESHOLD=2)  # The startup check counts one failure
+    with httpx.Client(base_url=gw.url) as client:
+        # Models no server has loaded, so residency doesn't keep sending them to the live one
+        statuses = [
+            client.post("/api/generate", json=dict(GENERATE, model=f"model{i}"), headers=gw.headers()).status_code
+            for i in range(6)
+        ]
+        backends = {backend["url"]: backend for backend in client.get("/api/admin/backends", headers=gw.headers("admin")).json()}
+    assert statuses.count(502) == 1 and statuses[-4:] == [200] * 4
+    assert not backends[dead]["healthy"] and backends[live.url]["healthy"]
+
+def test_routes_to_backends_listing_the_model(fake_backend, gateway):
+    chat = fake_backend(models=["llama3.2:latest"])
+    embeddings = fake_backend(models=["nomic-embed-text:latest"])
+    gw = gateway([chat.url, embeddings.url])
+    with httpx.Client(base_url=gw.url) as client:
+        for _ in range(3):
+            assert client.post("/api/generate", json=GENERATE, headers=gw.headers()).status_code == 200
+            assert client.post("/api/embed", json=EMBED, headers=gw.headers()).status_code == 200
+    assert chat.requests["/api/generate"] == 3 and chat.requests["/api/embed"] == 0
+    assert embeddings.requests["/api/embed"] == 3 and embeddings.requests["/api/generate"] == 0
+
+def test_unknown_model_goes_to_any_backend(fake_backend, gateway):
+    a = fake_backend(models=["llama3.2:latest"])
+    gw = gateway([a.url])
+    with httpx.Client(base_url=gw.url) as client:
+        response = client.post("/api/generate", json=dict(GENERATE, model="qwen2.5"), headers=gw.headers())
+    assert response.status_code == 200 and a.requests["/api/generate"] == 1
+
+def test_prefers_backend_with_model_loaded(fake_backend, gateway):
+    cold = fake_backend()
+    warm = fake_backend(loaded=["llama3.2"])
+    gw = gateway([cold.url, warm.url], MODEL_PS_INTERVAL=0.05)
+    wait_until(lambda: "llama3.2:latest" in gw.app.state.model_manager.resident().get(warm.url, ()), message="residency poll")
+    with httpx.Client(base_url=gw.url) as client:
+        for _ in range(4):
+            assert client.post("/api/generate", json=GENERATE, headers=gw.headers()).status_code == 200
+    assert warm.requests["/api/generate"] == 4 and cold.requests["/api/generate"] == 0
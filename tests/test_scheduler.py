@@ -0,0 +1,54 @@
+# tests/test_scheduler.py
+import asyncio
+from typing import List
+
+import pytest
+
+from libs.request_context import RequestContext
+from libs.scheduler import FairScheduler
+from libs.token_manager import Principal
+
+def context(user: str, priority: int = 0) -> RequestContext:
+    return RequestContext(Principal(user, user, "test", None, priority=priority), "generate")
+
+def contexts(user: str, count: int, priority: int = 0) -> List[RequestContext]:
+    return [context(user, priority) for _ in range(count)]
+
+async def serve_in_order(scheduler: FairScheduler, contexts: List[RequestContext]) -> List[str]:
+    """Queue `contexts` behind a request holding the only slot, then let them through one at a time."""
+    served: List[str] = []
+    busy = context("busy", 100)
+    await scheduler.acquire(busy)
+
+    async def request(ctx: RequestContext):
+        await scheduler.acquire(ctx)
+        served.append(ctx.principal.user)
+        await asyncio.sleep(0)
+        ctx.finish()
+
+    tasks = [asyncio.ensure_future(request(ctx)) for ctx in contexts]
+    await asyncio.sleep(0.01)
+    assert scheduler.queued == len(contexts)
+    busy.finish()
+    await asyncio.gather(*tasks)
+    return served
+
+@pytest.mark.anyio
+async def test_users_of_a_tier_take_turns():
+    scheduler = FairScheduler(max_inflight=1)
+    served = await serve_in_order(scheduler, contexts("alice", 3) + contexts("bob", 3))
+    assert served == ["alice", "bob"] * 3
+
+@pytest.mark.anyio
+async def test_tiers_share_slots_by_weight():
+    scheduler = FairScheduler(max_inflight=1, tier_weights={0: 3, -10: 1})
+    served = await serve_in_order(scheduler, contexts("alice", 9) + contexts("batch", 3, -10))
+    # The lower tier isn't starved while the higher one has requests waiting
+    assert served == ["alice", "alice", "batch", "alice"] * 3
+
+@pytest.mark.anyio
+async def test_default_weights_favour_higher_tiers():
+    scheduler = FairScheduler(max_inflight=1, tier_weight_base=2)
+    assert scheduler.tier_weight(1) == 2 * scheduler.tier_weight(0)
+    served = await serve_in_order(scheduler, contexts("alice", 4, 1) + contexts("bob", 4))
+    assert served[:3].count("alice") == 2 and served[:6].count("alice") == 4
@@ -0,0 +1,81 @@
+# tests/test_streaming.py
+import httpx
+import pytest
+
+from conftest import ServerThread, wait_until
+
+STREAM = {"model": "llama3.2", "prompt": "Why is the sky blue?", "stream": True}
+
+@pytest.mark.parametrize("flush_ms", [0, 50])
+def test_client_disconnect_cancels_upstream_stream(fake_backend, gateway, flush_ms):
+    backend = fake_backend(tokens=200, token_rate=20)  # A 10 second stream
+    gw = gateway([backend.url], STREAM_FLUSH_INTERVAL_MS=flush_ms)
+    with httpx.Client(base_url=gw.url) as client:
+        with client.stream("POST", "/api/generate", json=STREAM, headers=gw.headers()) as response:
+            assert response.status_code == 200
+            chunks = response.iter_raw()
+            next(chunks)
+            next(chunks)
+        # Leaving the block closed the connection mid-stream
+
+    wait_until(lambda: backend.disconnects["/api/generate"] == 1, timeout=2, message="the upstream request to be cancelled")
+    wait_until(lambda: backend.in_progress == 0, timeout=2, message="the upstream request to end")
+    pool = gw.app.state.backend_pool
+    wait_until(lambda: pool.backends[0].outstanding == 0, timeout=2, message="the backend slot to be released")
+
+@pytest.mark.parametrize("flush_ms", [0, 50])
+def test_stream_relays_every_line(fake_backend, gateway, flush_ms):
+    backend = fake_backend(tokens=20, token_rate=200)
+    gw = gateway([backend.url], STREAM_FLUSH_INTERVAL_MS=flush_ms)
+    with httpx.Client(base_url=gw.url) as client:
+        with client.stream("POST", "/api/generate", json=STREAM, headers=gw.headers()) as response:
+            chunks = list(response.iter_raw())
+    lines = b"".join(chunks).splitlines()
+    assert len(lines) == 21 and lines[-1].startswith(b'{"model":"llama3.2","created_at"')
+    if flush_ms:
+        assert len(chunks) < 21  # Lines were coalesced
+        assert all(chunk.endswith(b"\n") for chunk in chunks)
+
+def stream_lines(gw):
+    with httpx.Client(base_url=gw.url, timeout=10) as client:
+        with client.stream("POST", "/api/generate", json=STREAM, headers=gw.headers()) as response:
+            assert response.status_code == 200
+            return b"".join(response.iter_raw()).splitlines()
+
+def test_first_byte_deadline_gives_504(fake_backend, gateway):
+    backend = fake_backend(ttft=2)
+    gw = gateway([backend.url], UPSTREAM_FIRST_BYTE_TIMEOUT=0.2)
+    response = httpx.post(f"{gw.url}/api/generate", json=STREAM, headers=gw.headers(), timeout=10)
+    assert response.status_code == 504
+    wait_until(lambda: backend.in_progress == 0, timeout=2, message="the upstream request to end")
+
+@pytest.mark.parametrize("flush_ms", [0, 50])
+def test_stalled_stream_ends_with_error_record(fake_backend, gateway, flush_ms):
+    backend = fake_backend(tokens=3, token_rate=2)  # A chunk every half second
+    gw = gateway([backend.url], UPSTREAM_IDLE_TIMEOUT=0.2, STREAM_FLUSH_INTERVAL_MS=flush_ms)
+    lines = stream_lines(gw)
+    assert b'"done":false' in lines[0]
+    assert lines[-1] == b'{"error":"Ollama sent nothing for 0.2 seconds"}'
+    wait_until(lambda: backend.in_progress == 0, timeout=2, message="the upstream request to end")
+    wait_until(lambda: gw.app.state.backend_pool.backends[0].outstanding == 0, timeout=2, message="the backend slot to be released")
+
+def test_dropped_stream_ends_with_error_record(gateway):
+    async def dropping_backend(scope, receive, send):
+        """Sends the start of a stream, then drops the connection."""
+        if scope["type"] != "http":
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/x-ndjson")]})
+        if scope["path"] != "/api/generate":
+            await send({"type": "http.response.body", "body": b'{"models":[]}'})
+            return
+        await send({"type": "http.response.body", "body": b'{"response":"tok","done":false}\n{"resp', "more_body": True})
+        raise RuntimeError("backend crashed")
+
+    backend = ServerThread(dropping_backend).start()
+    try:
+        lines = stream_lines(gateway([backend.url]))
+    finally:
+        backend.stop()
+    assert lines[0] == b'{"response":"tok","done":false}'
+    assert lines[1] == b'{"resp'  # The cut off line is ended before the error record
+    assert lines[-1].startswith(b'{"error":"Connection to Ollama failed:')
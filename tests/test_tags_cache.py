@@ -0,0 +1,53 @@
+# tests/test_tags_cache.py
+import asyncio
+
+import httpx
+import pytest
+
+from libs.tags_cache import TagsCache
+
+def test_conditional_get_gives_304(fake_backend, gateway):
+    backend = fake_backend()
+    gw = gateway([backend.url])
+    with httpx.Client(base_url=gw.url) as client:
+        response = client.get("/api/tags", headers=gw.headers())
+        assert response.status_code == 200 and "llama3.2:latest" in response.text
+        etag = response.headers["etag"]
+        fetched = backend.requests["/api/tags"]
+
+        response = client.get("/api/tags", headers=dict(gw.headers(), **{"If-None-Match": f"W/{etag}"}))
+        assert response.status_code == 304 and response.content == b""
+        assert response.headers["etag"] == etag
+
+        response = client.get("/api/tags", headers=dict(gw.headers(), **{"If-None-Match": '"other"'}))
+        assert response.status_code == 200 and response.headers["etag"] == etag
+    assert backend.requests["/api/tags"] == fetched  # Both answered from the cache
+
+@pytest.mark.anyio
+async def test_stale_body_served_while_refreshing():
+    bodies = [b'{"models":["v1"]}', b'{"models":["v2"]}']
+    release = asyncio.Event()
+    fetches = 0
+
+    async def fetch():
+        nonlocal fetches
+        fetches += 1
+        if fetches > 1:
+            await release.wait()  # A slow Ollama
+        return bodies[fetches - 1]
+
+    cache = TagsCache(fetch, ttl=30, stale_ttl=300)
+    body, etag = await cache.get()
+    assert body == bodies[0] and cache.misses == 1
+
+    cache.fetched_at -= 60  # Past the TTL, within the stale window
+    for _ in range(2):  # Answered at once, with a single refresh started
+        assert await asyncio.wait_for(cache.get(), 1) == (bodies[0], etag)
+    await asyncio.sleep(0)
+    assert fetches == 2 and cache.stale_hits == 2 and len(cache._tasks) == 1
+
+    release.set()
+    await asyncio.gather(*cache._tasks)
+    body, new_etag = await cache.get()
+    assert body == bodies[1] and new_etag != etag
+    assert cache.hits == 1 and fetches == 2 and not cache._tasks
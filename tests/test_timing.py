@@ -0,0 +1,16 @@
+# tests/test_timing.py
+import httpx
+import pytest
+
+GENERATE = {"model": "llama3.2", "prompt": "Why is the sky blue?", "stream": False}
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_server_timing_header_is_opt_in(fake_backend, gateway, enabled):
+    backend = fake_backend()
+    gw = gateway([backend.url], **({"SERVER_TIMING": True} if enabled else {}))
+    with httpx.Client(base_url=gw.url) as client:
+        response = client.post("/api/generate", json=GENERATE, headers=gw.headers())
+    assert response.status_code == 200
+    assert ("server-timing" in response.headers) is enabled
+    if enabled:
+        assert "upstream;dur=" in response.headers["server-timing"]
@@ -0,0 +1,64 @@
+# tests/test_token_manager.py
+import pytest
+
+from libs.request_context import RequestContext
+from libs.token_manager import TokenManager
+from libs.usage_recorder import UsageRecorder
+from models import Settings
+
+@pytest.fixture
+def managers(tmp_path):
+    """Two managers on one database, like the gateway and the CLI in separate processes."""
+    settings = Settings(TOKEN_DB_PATH=str(tmp_path / "tokens.db"), AUTH_CACHE_DB_CHECK_INTERVAL=0, LOG_FILE="")
+    gateway, cli = TokenManager(settings=settings), TokenManager(settings=settings)
+    yield gateway, cli
+    gateway.close()
+    cli.close()
+
+@pytest.mark.anyio
+async def test_usage_flush_keeps_auth_cache(managers):
+    gateway, cli = managers
+    token = cli.generate_token("alice", "test")
+    principal = await gateway.aresolve_principal(token)
+    assert principal.user == "alice" and len(gateway._cache) == 1
+
+    recorder = UsageRecorder(cli.store)
+    ctx = RequestContext(principal, "generate", "llama3.2")
+    ctx.on_finish(recorder.record)
+    ctx.finish({"prompt_eval_count": 3, "eval_count": 5})
+    await recorder.flush()
+    assert cli.get_usage("alice")
+
+    assert (await gateway.aresolve_principal(token)) is principal  # Still the cached entry
+
+@pytest.mark.anyio
+async def test_key_changes_clear_auth_cache(managers):
+    gateway, cli = managers
+    token = cli.generate_token("alice", "test")
+    assert (await gateway.aresolve_principal(token)).user == "alice"
+
+    cli.revoke_token("alice", "test")
+    assert await gateway.aresolve_principal(token) is None
+
+def test_generate_token_normalizes_expiry(managers):
+    _, cli = managers
+    cli.generate_token("alice", "dated", "2099-12-31")
+    cli.generate_token("alice", "utc", "2099-12-31T18:00:00Z")
+    expiries = {api_name: expires_at for _, _, api_name, _, expires_at in cli.iter_users("alice")}
+    assert expiries == {"dated": "2099-12-31T00:00:00+00:00", "utc": "2099-12-31T18:00:00+00:00"}
+
+    with pytest.raises(ValueError, match="Invalid expiry 'next tuesday'"):
+        cli.generate_token("alice", "typo", "next tuesday")
+    assert [row[2] for row in cli.iter_users("alice")] == ["dated", "utc"]
+
+@pytest.mark.anyio
+async def test_unreadable_stored_expiry_refuses_the_key(managers):
+    gateway, cli = managers
+    token = cli.generate_token("alice", "test")
+    expired = cli.generate_token("bob", "test", "2000-01-01")
+    with cli.store.transaction() as conn:  # As older versions could store it
+        conn.execute("UPDATE tokens SET expires_at = 'next tuesday' WHERE user = 'alice'")
+
+    assert await gateway.aresolve_principal(token) is None
+    assert await gateway.aresolve_principal(expired) is None
+    assert cli.get_principal(cli.list_users()[0][0]) is None
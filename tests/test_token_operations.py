@@ -0,0 +1,61 @@
+# tests/test_token_operations.py
+import pytest
+
+from libs import token_operations
+from libs.token_manager import TokenManager
+from models import Settings
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """The CLIs' TokenManager, on a database of its own."""
+    settings = Settings(TOKEN_DB_PATH=str(tmp_path / "tokens.db"), AUTH_CACHE_DB_CHECK_INTERVAL=0, LOG_FILE="")
+    manager = TokenManager(settings=settings)
+    monkeypatch.setattr(token_operations, "_token_manager", manager)
+    yield manager
+    manager.close()
+
+def write_csv(path, *lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+def test_csv_import_normalizes_expiries(manager, tmp_path):
+    keys = write_csv(tmp_path / "keys.csv", "alice,dated,2099-12-31", "alice,utc,2099-12-31T18:00:00Z", "bob,open")
+    message = token_operations.generate_tokens_from_csv(keys, str(tmp_path / "tokens.csv"))
+    assert message.startswith("Generated 3 tokens")
+    expiries = {(user, api_name): expires_at for _, user, api_name, _, expires_at in manager.iter_users()}
+    assert expiries == {
+        ("alice", "dated"): "2099-12-31T00:00:00+00:00",
+        ("alice", "utc"): "2099-12-31T18:00:00+00:00",
+        ("bob", "open"): None,
+    }
+
+def test_csv_import_rejects_unreadable_expiry(manager, tmp_path):
+    keys = write_csv(tmp_path / "keys.csv", "alice,dated,2099-12-31", "", "bob,typo,next tuesday")
+    output = tmp_path / "tokens.csv"
+    message = token_operations.generate_tokens_from_csv(keys, str(output))
+    assert message.startswith(f"{keys}, line 3: Invalid expiry 'next tuesday'")
+    assert manager.list_users() == [] and not output.exists()  # Nothing half imported
+
+@pytest.mark.anyio
+async def test_bulk_rotation_grace_window(manager, tmp_path):
+    old = {}
+    manager.generate_tokens([("alice", "test", None), ("bob", "test", None)], lambda user, _, token: old.__setitem__(user, token))
+    keys = write_csv(tmp_path / "keys.csv", "alice,test")
+
+    output = tmp_path / "rotated.csv"
+    message = token_operations.rotate_tokens_from_csv(keys, str(output), 60)
+    assert message.startswith("Rotated 1 tokens") and "60 seconds" in message
+    new = output.read_text(encoding="utf-8").splitlines()[-1].split(",")[-1]
+    assert (await manager.aresolve_principal(new)).user == "alice"
+    assert (await manager.aresolve_principal(old["alice"])).user == "alice"  # Still in its grace period
+    assert (await manager.aresolve_principal(old["bob"])).user == "bob"  # Not in the file
+
+    with manager.store.transaction() as conn:  # The grace period runs out
+        conn.execute("UPDATE tokens SET previous_expires_at = '2000-01-01T00:00:00+00:00' WHERE user = 'alice'")
+    manager.invalidate_cache()
+    assert await manager.aresolve_principal(old["alice"]) is None
+    assert (await manager.aresolve_principal(new)).user == "alice"
+
+    message = token_operations.rotate_tokens_from_csv(keys, str(output), 0)
+    assert message.endswith("Old tokens no longer work.")
+    assert await manager.aresolve_principal(new) is None